@@ -1,6 +1,8 @@
 # Admin configuration for chatbot models
 from django.contrib import admin
-from .models import Conversation, Message, QueryLog, AuditLog
+from django.db.models import Count
+from .models import Conversation, Message, QueryLog, AuditLog, MetricsRollup
+from .services.runtime import chunk_lookup
 
 
 @admin.register(Conversation)
@@ -11,14 +13,19 @@ class ConversationAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at')
     date_hierarchy = 'created_at'
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(message_count=Count('messages'))
+    
     def message_count(self, obj):
-        return obj.messages.count()
+        return obj.message_count
     message_count.short_description = 'Cantidad de Mensajes'
+    message_count.admin_order_field = 'message_count'
 
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     list_display = ('id', 'conversation', 'role', 'created_at', 'content_preview')
+    list_select_related = ('conversation',)
     list_filter = ('role', 'created_at', 'conversation')
     search_fields = ('content', 'conversation__id')
     readonly_fields = ('created_at',)
@@ -31,10 +38,11 @@ class MessageAdmin(admin.ModelAdmin):
 
 @admin.register(QueryLog)
 class QueryLogAdmin(admin.ModelAdmin):
-    list_display = ('id', 'conversation', 'created_at', 'response_time', 'chunks_retrieved', 'feedback_score', 'query_preview')
-    list_filter = ('created_at', 'feedback_score', 'chunks_retrieved')
+    list_display = ('id', 'conversation', 'created_at', 'response_time', 'chunks_retrieved', 'answer_cached', 'feedback_score', 'query_preview')
+    list_select_related = ('conversation',)
+    list_filter = ('created_at', 'feedback_score', 'chunks_retrieved', 'answer_cached')
     search_fields = ('user_query', 'assistant_response', 'conversation__id')
-    readonly_fields = ('created_at', 'response_time', 'chunks_retrieved', 'context_used', 'ip_address', 'user_agent')
+    readonly_fields = ('created_at', 'response_time', 'chunks_retrieved', 'answer_cached', 'stage_timings', 'context_index_version', 'context_display', 'ip_address', 'user_agent')
     date_hierarchy = 'created_at'
     
     fieldsets = (
@@ -45,10 +53,10 @@ class QueryLogAdmin(admin.ModelAdmin):
             'fields': ('user_query', 'assistant_response')
         }),
         ('Métricas', {
-            'fields': ('response_time', 'chunks_retrieved', 'feedback_score')
+            'fields': ('response_time', 'stage_timings', 'chunks_retrieved', 'answer_cached', 'feedback_score')
         }),
         ('Contexto', {
-            'fields': ('context_used',),
+            'fields': ('context_index_version', 'context_display'),
             'classes': ('collapse',)
         }),
         ('Metadata', {
@@ -57,6 +65,12 @@ class QueryLogAdmin(admin.ModelAdmin):
         }),
     )
     
+    def context_display(self, obj):
+        if obj.context_used or not obj.context_refs:
+            return obj.context_used
+        return chunk_lookup().render(obj.context_refs, obj.context_index_version)
+    context_display.short_description = 'Contexto utilizado'
+    
     def query_preview(self, obj):
         return obj.user_query[:50] + '...' if len(obj.user_query) > 50 else obj.user_query
     query_preview.short_description = 'Consulta'
@@ -86,3 +100,11 @@ class AuditLogAdmin(admin.ModelAdmin):
     def description_preview(self, obj):
         return obj.description[:80] + '...' if len(obj.description) > 80 else obj.description
     description_preview.short_description = 'Descripción'
+
+
+@admin.register(MetricsRollup)
+class MetricsRollupAdmin(admin.ModelAdmin):
+    list_display = ('period', 'bucket_start', 'query_count', 'cached_count', 'error_count', 'updated_at')
+    list_filter = ('period',)
+    date_hierarchy = 'bucket_start'
+    readonly_fields = [field.name for field in MetricsRollup._meta.fields]
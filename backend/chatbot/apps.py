@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ChatbotConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "chatbot"
+    
+    def ready(self):
+        """Precarga modelo e índice antes de que el worker acepte tráfico."""
+        from .services import runtime
+        
+        if runtime.should_warm_up():
+            runtime.warm_up()
@@ -1,10 +1,13 @@
 """
 Comando Django para construir el índice de vectores.
-Uso: python manage.py build_index
+Uso: python manage.py build_index [--index-type flat|ivf_flat|ivf_pq|hnsw] [--metric l2|ip]
 """
 
+import os
+
 from django.core.management.base import BaseCommand
 from chatbot.services.chat_service import ChatService
+from chatbot.services.vectorizer import VectorizerService
 
 
 class Command(BaseCommand):
@@ -23,6 +26,47 @@ class Command(BaseCommand):
             default="data/vectors",
             help="Directorio para guardar índices",
         )
+        parser.add_argument(
+            "--index-type",
+            choices=VectorizerService.INDEX_TYPES,
+            default="flat",
+            help="Tipo de índice FAISS (flat es búsqueda exacta)",
+        )
+        parser.add_argument(
+            "--metric",
+            choices=VectorizerService.METRICS,
+            default="l2",
+            help="l2 o ip (similitud coseno sobre embeddings normalizados)",
+        )
+        parser.add_argument("--nlist", type=int, help="IVF: número de listas (por defecto 4·√N)")
+        parser.add_argument("--nprobe", type=int, help="IVF: listas visitadas por búsqueda")
+        parser.add_argument("--pq-m", type=int, help="IVF-PQ: número de subcuantizadores")
+        parser.add_argument("--pq-nbits", type=int, help="IVF-PQ: bits por subcuantizador")
+        parser.add_argument("--hnsw-m", type=int, help="HNSW: vecinos por nodo")
+        parser.add_argument("--ef-construction", type=int, help="HNSW: efConstruction")
+        parser.add_argument("--ef-search", type=int, help="HNSW: efSearch")
+        parser.add_argument(
+            "--embedding-cache-dir",
+            type=str,
+            default=os.getenv("EMBEDDING_CACHE_DIR", "data/embedding_cache"),
+            help="Caché persistente de embeddings por hash de chunk",
+        )
+        parser.add_argument(
+            "--no-embedding-cache",
+            action="store_true",
+            help="No consultar ni actualizar la caché persistente de embeddings",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Reutiliza embeddings del índice existente y solo vectoriza chunks nuevos o modificados",
+        )
+        parser.add_argument(
+            "--eval-queries",
+            type=int,
+            default=200,
+            help="Consultas de muestra para medir recall/latencia (0 = no medir)",
+        )
     
     def handle(self, *args, **options):
         documents_dir = options["documents_dir"]
@@ -35,18 +79,48 @@ class Command(BaseCommand):
             self.style.SUCCESS(f"📁 Vectores: {vectors_dir}")
         )
         
+        index_params = {
+            name: options[name]
+            for name in VectorizerService.DEFAULT_INDEX_PARAMS
+            if options.get(name) is not None
+        }
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"🧭 Tipo de índice: {options['index_type']} ({options['metric']}) {index_params or ''}"
+            )
+        )
+        
         # Crear servicio y construir índice
         chat_service = ChatService(
             documents_dir=documents_dir,
-            vectors_dir=vectors_dir
+            vectors_dir=vectors_dir,
+            vectorizer_options={
+                "index_type": options["index_type"],
+                "metric": options["metric"],
+                "embedding_cache_dir": (
+                    None if options["no_embedding_cache"] else options["embedding_cache_dir"]
+                ),
+                "index_params": index_params,
+            }
         )
         
-        success = chat_service.build_index()
+        success = chat_service.build_index(
+            eval_queries=options["eval_queries"],
+            incremental=options["incremental"]
+        )
         
         if success:
             self.stdout.write(
                 self.style.SUCCESS("✅ Índice construido exitosamente")
             )
+            report = chat_service.vectorizer.build_report
+            if report:
+                self.stdout.write(
+                    f"📊 recall@{report['k']}: {report['recall_at_k']:.3f} | "
+                    f"latencia: {report['latency_ms']:.3f} ms/consulta "
+                    f"(exacta: {report['exact_latency_ms']:.3f} ms) | "
+                    f"{report['queries']} consultas de muestra"
+                )
         else:
             self.stdout.write(
                 self.style.ERROR("❌ Error al construir el índice")
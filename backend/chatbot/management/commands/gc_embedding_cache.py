@@ -0,0 +1,66 @@
+"""
+Comando Django para compactar la caché persistente de embeddings.
+Elimina las entradas que ningún índice referencia.
+Uso: python manage.py gc_embedding_cache [--vectors-dir data/vectors ...]
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.services.embedding_cache import EmbeddingCache
+from chatbot.services.vectorizer import VectorizerService
+
+
+class Command(BaseCommand):
+    help = "Compacta la caché de embeddings conservando solo los chunks referenciados por los índices"
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--vectors-dir",
+            action="append",
+            dest="vectors_dirs",
+            help="Directorio de un índice cuyos chunks se conservan (repetible; por defecto data/vectors)",
+        )
+        parser.add_argument(
+            "--cache-dir",
+            type=str,
+            default=os.getenv("EMBEDDING_CACHE_DIR", "data/embedding_cache"),
+            help="Directorio raíz de la caché de embeddings",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Solo informa cuántas entradas se eliminarían",
+        )
+    
+    def handle(self, *args, **options):
+        vectors_dirs = options["vectors_dirs"] or ["data/vectors"]
+        
+        # Hashes referenciados, agrupados por modelo
+        referenced = {}
+        for vectors_dir in vectors_dirs:
+            manifest = VectorizerService.read_manifest(vectors_dir)
+            meta = VectorizerService._read_index_meta(vectors_dir)
+            if not manifest.get("chunk_hashes") or not meta.get("embedding_dim"):
+                raise CommandError(
+                    f"{vectors_dir} no tiene manifest.json/index_meta.json; reconstruye el índice antes de compactar."
+                )
+            entry = referenced.setdefault(
+                manifest["model_name"], {"embedding_dim": meta["embedding_dim"], "keep": set()}
+            )
+            entry["keep"].update(manifest["chunk_hashes"])
+        
+        for model_name, entry in referenced.items():
+            cache = EmbeddingCache(options["cache_dir"], model_name, entry["embedding_dim"])
+            
+            if options["dry_run"]:
+                stale = len(cache.hashes() - entry["keep"])
+                self.stdout.write(
+                    f"🔍 {model_name}: {len(cache)} entradas, {stale} sin referenciar"
+                )
+                continue
+            
+            kept, removed = cache.compact(entry["keep"])
+            self.stdout.write(
+                self.style.SUCCESS(f"🧹 {model_name}: {kept} entradas conservadas, {removed} eliminadas")
+            )
@@ -0,0 +1,120 @@
+"""
+Comando Django para aplicar la retención de QueryLog y AuditLog.
+Archiva los registros antiguos en JSONL comprimido y los borra por lotes; en
+PostgreSQL con tablas particionadas elimina los meses vencidos con DROP TABLE.
+Uso: python manage.py prune_logs [--query-days 180] [--audit-days 365] [--dry-run]
+     python manage.py prune_logs --setup-partitions   (solo PostgreSQL, una vez)
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from chatbot.models import AuditLog, QueryLog
+from chatbot.services import log_retention
+
+
+class Command(BaseCommand):
+    help = "Archiva y elimina QueryLog/AuditLog más antiguos que el periodo de retención"
+    
+    def add_arguments(self, parser):
+        retention = settings.LOG_RETENTION
+        parser.add_argument(
+            "--query-days",
+            type=int,
+            default=retention["QUERY_LOG_DAYS"],
+            help="Días que se conservan los QueryLog (0 = siempre)",
+        )
+        parser.add_argument(
+            "--audit-days",
+            type=int,
+            default=retention["AUDIT_LOG_DAYS"],
+            help="Días que se conservan los AuditLog (0 = siempre)",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            type=str,
+            default=retention["ARCHIVE_DIR"],
+            help="Directorio de los archivos JSONL comprimidos",
+        )
+        parser.add_argument(
+            "--no-archive",
+            action="store_true",
+            help="Borrar sin archivar",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Filas por lote de archivado/borrado",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Solo informa cuántos registros se eliminarían",
+        )
+        parser.add_argument(
+            "--setup-partitions",
+            action="store_true",
+            help="Convierte ambas tablas a particiones mensuales (PostgreSQL)",
+        )
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=3,
+            help="Meses futuros para los que se crean particiones",
+        )
+    
+    def handle(self, *args, **options):
+        partitioning = log_retention.supports_partitioning()
+        
+        if options["setup_partitions"]:
+            if not partitioning:
+                raise CommandError("El particionado mensual solo está disponible en PostgreSQL.")
+            for model in (QueryLog, AuditLog):
+                table = model._meta.db_table
+                if log_retention.is_partitioned(table):
+                    self.stdout.write(f"ℹ️  {table} ya está particionada")
+                    continue
+                self.stdout.write(f"🔄 Particionando {table} por mes...")
+                log_retention.convert_to_partitioned(model, options["months_ahead"])
+                self.stdout.write(self.style.SUCCESS(f"✅ {table} particionada"))
+        
+        archive_dir = None if options["no_archive"] else options["archive_dir"]
+        now = timezone.now()
+        
+        for model, days in ((QueryLog, options["query_days"]), (AuditLog, options["audit_days"])):
+            table = model._meta.db_table
+            if days <= 0:
+                self.stdout.write(f"⏭️  {table}: retención desactivada")
+                continue
+            cutoff = now - timedelta(days=days)
+            
+            if options["dry_run"]:
+                expired = model.objects.filter(created_at__lt=cutoff).count()
+                self.stdout.write(f"🔍 {table}: {expired} registros anteriores a {cutoff:%Y-%m-%d}")
+                continue
+            
+            archived = 0
+            if partitioning and log_retention.is_partitioned(table):
+                now_local = timezone.localtime(now)
+                log_retention.ensure_partitions(table, (now_local.year, now_local.month), options["months_ahead"])
+                archived, dropped = log_retention.drop_expired_partitions(
+                    model, cutoff, archive_dir, options["batch_size"]
+                )
+                for name in dropped:
+                    self.stdout.write(f"🗑️  Partición eliminada: {name}")
+            
+            # Lo que queda del mes parcial (o toda la tabla si no está particionada)
+            batch_archived, deleted = log_retention.prune_rows(
+                model, cutoff, archive_dir, options["batch_size"]
+            )
+            archived += batch_archived
+            
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"✅ {table}: {deleted} registros borrados por lotes, {archived} archivados "
+                    f"(anteriores a {cutoff:%Y-%m-%d})"
+                )
+            )
@@ -0,0 +1,45 @@
+"""
+Comando Django para actualizar los agregados de métricas (MetricsRollup).
+Pensado para ejecutarse periódicamente (p. ej. cada 5 minutos con cron);
+el endpoint de métricas también refresca de forma perezosa, pero solo este
+comando rellena el historial anterior al primer agregado.
+Uso: python manage.py rollup_metrics [--hours 48] [--full]
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from chatbot.services import rollups
+
+
+class Command(BaseCommand):
+    help = "Recalcula los agregados horarios y diarios de QueryLog/AuditLog"
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=int,
+            default=None,
+            help="Recalcular las últimas N horas (p. ej. para recoger feedback tardío)",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Rehacer todo desde el registro más antiguo (se pierden los agregados de registros ya podados)",
+        )
+    
+    def handle(self, *args, **options):
+        now = timezone.now()
+        end = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        
+        if options["full"]:
+            from chatbot.models import MetricsRollup
+            MetricsRollup.objects.all().delete()
+            hours = rollups.refresh(now, backfill=True)
+        elif options["hours"]:
+            hours = rollups.rollup_hours(now - timedelta(hours=options["hours"]), end)
+        else:
+            hours = rollups.refresh(now, backfill=True)
+        
+        self.stdout.write(self.style.SUCCESS(f"✅ {hours} horas de métricas recalculadas"))
@@ -0,0 +1,71 @@
+"""
+Comando Django que levanta el servidor de recuperación dedicado.
+Mantiene el modelo y el índice FAISS en un solo proceso y atiende búsquedas
+de los workers web por un socket Unix (ver RETRIEVER_SOCKET).
+Uso: python manage.py run_retriever [--socket /tmp/gapid-retriever.sock]
+"""
+
+import os
+
+from django.core.management.base import BaseCommand
+from chatbot.services.retriever import RetrieverServer
+from chatbot.services.vectorizer import VectorizerService
+
+
+class Command(BaseCommand):
+    help = "Servidor de búsqueda semántica (modelo + FAISS) sobre socket Unix"
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socket",
+            type=str,
+            default=os.getenv("RETRIEVER_SOCKET", "/tmp/gapid-retriever.sock"),
+            help="Ruta del socket Unix",
+        )
+        parser.add_argument(
+            "--vectors-dir",
+            type=str,
+            default=os.getenv("VECTORS_DIR", "data/vectors"),
+            help="Directorio del índice a servir",
+        )
+        parser.add_argument(
+            "--max-batch",
+            type=int,
+            default=32,
+            help="Máximo de consultas por lote del encoder",
+        )
+        parser.add_argument(
+            "--max-wait-ms",
+            type=float,
+            default=5.0,
+            help="Milisegundos máximos de espera para completar un lote",
+        )
+    
+    def handle(self, *args, **options):
+        vectorizer = VectorizerService(
+            query_cache_size=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024")),
+            query_cache_ttl=float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "0")) or None,
+            embedding_cache_dir=os.getenv("EMBEDDING_CACHE_DIR") or None,
+        )
+        vectorizer.load_index(options["vectors_dir"])
+        vectorizer.warm_up()
+        
+        server = RetrieverServer(
+            vectorizer,
+            options["socket"],
+            max_batch=options["max_batch"],
+            max_wait_ms=options["max_wait_ms"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"🛰️  Servidor de recuperación escuchando en {options['socket']} "
+                f"(lote ≤ {options['max_batch']}, espera ≤ {options['max_wait_ms']} ms)"
+            )
+        )
+        
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("⏹️  Deteniendo servidor de recuperación...")
+        finally:
+            server.server_close()
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-17 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0003_alter_auditlog_ip_address_alter_querylog_ip_address'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='querylog',
+            name='answer_cached',
+            field=models.BooleanField(default=False, help_text='La respuesta se sirvió desde la caché de respuestas'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-17 14:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0004_querylog_answer_cached'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='message',
+            options={'ordering': ['created_at', 'id'], 'verbose_name': 'Mensaje', 'verbose_name_plural': 'Mensajes'},
+        ),
+    ]
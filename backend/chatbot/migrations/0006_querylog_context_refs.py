@@ -0,0 +1,130 @@
+# Generated by Django 5.1 on 2026-10-17 15:30
+
+import hashlib
+import re
+
+from django.db import migrations, models
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+BLOCK_PATTERN = re.compile(r"\[(?P<source>[^\]\n]*)\]\n(?P<text>.*)", re.S)
+MISSING_CHUNK_TEXT = "(chunk no disponible en el índice actual)"
+BATCH_SIZE = 1000
+
+
+def _text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _render(blocks):
+    return CONTEXT_SEPARATOR.join(f"[{source}]\n{text}" for source, text in blocks)
+
+
+def backfill_context_refs(apps, schema_editor):
+    """
+    Mueve el texto de context_used a ChunkText (deduplicado por hash) y deja
+    en context_refs las referencias [fuente, None, None, hash]. Solo se
+    convierten los registros cuyo texto se puede reconstruir exactamente;
+    el resto conserva su context_used.
+    """
+    QueryLog = apps.get_model('chatbot', 'QueryLog')
+    ChunkText = apps.get_model('chatbot', 'ChunkText')
+
+    pending = []
+    texts = {}
+
+    def flush():
+        ChunkText.objects.bulk_create(
+            [ChunkText(text_hash=text_hash, text=text) for text_hash, text in texts.items()],
+            ignore_conflicts=True,
+        )
+        QueryLog.objects.bulk_update(pending, ['context_refs', 'context_used'])
+        pending.clear()
+        texts.clear()
+
+    logs = QueryLog.objects.exclude(context_used='').only('id', 'context_used')
+    for query_log in logs.iterator(chunk_size=BATCH_SIZE):
+        blocks = []
+        for block in query_log.context_used.split(CONTEXT_SEPARATOR):
+            match = BLOCK_PATTERN.fullmatch(block)
+            if match is None:
+                blocks = None
+                break
+            blocks.append((match['source'], match['text']))
+        if not blocks or _render(blocks) != query_log.context_used:
+            continue
+
+        refs = []
+        for source, text in blocks:
+            text_hash = _text_hash(text)
+            texts[text_hash] = text
+            refs.append([source, None, None, text_hash])
+        query_log.context_refs = refs
+        query_log.context_used = ''
+        pending.append(query_log)
+
+        if len(pending) >= BATCH_SIZE:
+            flush()
+
+    if pending:
+        flush()
+
+
+def restore_context_used(apps, schema_editor):
+    """Inverso: vuelve a escribir context_used a partir de ChunkText."""
+    QueryLog = apps.get_model('chatbot', 'QueryLog')
+    ChunkText = apps.get_model('chatbot', 'ChunkText')
+
+    pending = []
+    logs = QueryLog.objects.filter(context_used='').exclude(context_refs=[]).only('id', 'context_refs')
+    for query_log in logs.iterator(chunk_size=BATCH_SIZE):
+        hashes = [ref[3] for ref in query_log.context_refs if len(ref) > 3 and ref[3]]
+        texts = dict(ChunkText.objects.filter(text_hash__in=hashes).values_list('text_hash', 'text'))
+        query_log.context_used = _render(
+            (ref[0], (texts.get(ref[3]) if len(ref) > 3 else None) or MISSING_CHUNK_TEXT)
+            for ref in query_log.context_refs
+        )
+        pending.append(query_log)
+        if len(pending) >= BATCH_SIZE:
+            QueryLog.objects.bulk_update(pending, ['context_used'])
+            pending = []
+
+    if pending:
+        QueryLog.objects.bulk_update(pending, ['context_used'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0005_alter_message_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkText',
+            fields=[
+                ('text_hash', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('text', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Texto de Chunk',
+                'verbose_name_plural': 'Textos de Chunks',
+            },
+        ),
+        migrations.AddField(
+            model_name='querylog',
+            name='context_refs',
+            field=models.JSONField(blank=True, default=list, help_text='Chunks usados como [fuente, chunk_id, puntuación, hash del texto]'),
+        ),
+        migrations.AddField(
+            model_name='querylog',
+            name='context_index_version',
+            field=models.CharField(blank=True, help_text='Huella del índice del que salieron los chunks', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='querylog',
+            name='context_used',
+            field=models.TextField(blank=True, help_text='Contexto recuperado del índice vectorial (registros antiguos)'),
+        ),
+        migrations.RunPython(backfill_context_refs, restore_context_used),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1 on 2026-10-17 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0006_querylog_context_refs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hora'), ('day', 'Día')], max_length=4)),
+                ('bucket_start', models.DateTimeField(help_text='Inicio de la hora o del día (hora local)')),
+                ('query_count', models.IntegerField(default=0)),
+                ('cached_count', models.IntegerField(default=0)),
+                ('chunks_sum', models.BigIntegerField(default=0)),
+                ('response_time_sum', models.FloatField(default=0.0)),
+                ('response_time_count', models.IntegerField(default=0)),
+                ('response_time_buckets', models.JSONField(blank=True, default=list, help_text='Consultas con tiempo de respuesta <= cada límite (acumulado)')),
+                ('feedback_sum', models.IntegerField(default=0)),
+                ('feedback_count', models.IntegerField(default=0)),
+                ('error_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Agregado de Métricas',
+                'verbose_name_plural': 'Agregados de Métricas',
+                'ordering': ['-bucket_start'],
+                'constraints': [models.UniqueConstraint(fields=('period', 'bucket_start'), name='unique_rollup_bucket')],
+            },
+        ),
+    ]
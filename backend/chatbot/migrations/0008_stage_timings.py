@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-17 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0007_metricsrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='querylog',
+            name='stage_timings',
+            field=models.JSONField(blank=True, default=dict, help_text='Milisegundos por etapa (queue, embed, search, section, chunk, db)'),
+        ),
+        migrations.AddField(
+            model_name='metricsrollup',
+            name='stage_buckets',
+            field=models.JSONField(blank=True, default=dict, help_text='Por etapa, consultas en cada cubeta de latencia (ms, sin acumular)'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1 on 2026-10-17 23:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0008_stage_timings'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['created_at', 'id'], name='chatbot_aud_created_c08c2f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='querylog',
+            index=models.Index(fields=['conversation', 'created_at'], name='chatbot_que_convers_dfdc0b_idx'),
+        ),
+    ]
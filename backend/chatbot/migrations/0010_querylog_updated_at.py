@@ -0,0 +1,30 @@
+# Generated by Django 5.1 on 2026-10-17 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0009_log_list_indexes'),
+    ]
+
+    operations = [
+        # Se añade sin auto_now: con él Django rellenaría todas las filas
+        # existentes con la hora de la migración y el siguiente refresco de
+        # MetricsRollup las trataría como modificadas
+        migrations.AddField(
+            model_name='querylog',
+            name='updated_at',
+            field=models.DateTimeField(help_text='Última escritura del registro (p. ej. feedback); vacío en registros antiguos', null=True),
+        ),
+        migrations.AlterField(
+            model_name='querylog',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, help_text='Última escritura del registro (p. ej. feedback); vacío en registros antiguos', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='querylog',
+            index=models.Index(fields=['updated_at'], name='chatbot_que_updated_df8cf1_idx'),
+        ),
+    ]
@@ -36,7 +36,8 @@ class Message(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        ordering = ['created_at']
+        # Los dos mensajes de un turno se insertan juntos; el id desempata
+        ordering = ['created_at', 'id']
         verbose_name = "Mensaje"
         verbose_name_plural = "Mensajes"
         indexes = [
@@ -71,14 +72,39 @@ class QueryLog(models.Model):
         help_text="Número de chunks recuperados del índice"
     )
     
-    # Contexto utilizado
+    # Contexto utilizado: referencias a los chunks del índice. context_used
+    # solo conserva el texto de registros antiguos que no se pudieron migrar.
     context_used = models.TextField(
         blank=True,
-        help_text="Contexto recuperado del índice vectorial"
+        help_text="Contexto recuperado del índice vectorial (registros antiguos)"
+    )
+    context_refs = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Chunks usados como [fuente, chunk_id, puntuación, hash del texto]"
+    )
+    context_index_version = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Huella del índice del que salieron los chunks"
+    )
+    answer_cached = models.BooleanField(
+        default=False,
+        help_text="La respuesta se sirvió desde la caché de respuestas"
+    )
+    stage_timings = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Milisegundos por etapa (queue, embed, search, section, chunk, db)"
     )
     
     # Metadatos
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        null=True,
+        help_text="Última escritura del registro (p. ej. feedback); vacío en registros antiguos"
+    )
     ip_address = models.CharField(max_length=45, null=True, blank=True, help_text="Dirección IP del cliente")
     user_agent = models.TextField(blank=True)
     
@@ -96,12 +122,33 @@ class QueryLog(models.Model):
         indexes = [
             models.Index(fields=['created_at']),
             models.Index(fields=['conversation']),
+            models.Index(fields=['conversation', 'created_at']),
+            models.Index(fields=['updated_at']),
         ]
     
     def __str__(self):
         return f"Query {self.id} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
 
 
+class ChunkText(models.Model):
+    """
+    Texto de los chunks citados por QueryLog.context_refs, deduplicado por su
+    hash SHA-1. No depende del índice publicado, así que el contexto de un
+    registro sigue disponible tras reconstruir el índice.
+    """
+    
+    text_hash = models.CharField(max_length=40, primary_key=True)
+    text = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Texto de Chunk"
+        verbose_name_plural = "Textos de Chunks"
+    
+    def __str__(self):
+        return self.text_hash
+
+
 class AuditLog(models.Model):
     """Registra eventos importantes del sistema para auditoría."""
     
@@ -147,7 +194,55 @@ class AuditLog(models.Model):
         indexes = [
             models.Index(fields=['event_type', 'created_at']),
             models.Index(fields=['severity', 'created_at']),
+            models.Index(fields=['created_at', 'id']),
         ]
     
     def __str__(self):
         return f"{self.get_event_type_display()} - {self.get_severity_display()} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+class MetricsRollup(models.Model):
+    """
+    Agregados por hora y por día de QueryLog y AuditLog para el endpoint de
+    métricas. Se mantienen de forma incremental (ver services/rollups.py).
+    """
+    
+    PERIOD_CHOICES = [
+        ('hour', 'Hora'),
+        ('day', 'Día'),
+    ]
+    
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket_start = models.DateTimeField(help_text="Inicio de la hora o del día (hora local)")
+    
+    query_count = models.IntegerField(default=0)
+    cached_count = models.IntegerField(default=0)
+    chunks_sum = models.BigIntegerField(default=0)
+    response_time_sum = models.FloatField(default=0.0)
+    response_time_count = models.IntegerField(default=0)
+    response_time_buckets = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Consultas con tiempo de respuesta <= cada límite (acumulado)"
+    )
+    feedback_sum = models.IntegerField(default=0)
+    feedback_count = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    stage_buckets = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Por etapa, consultas en cada cubeta de latencia (ms, sin acumular)"
+    )
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-bucket_start']
+        verbose_name = "Agregado de Métricas"
+        verbose_name_plural = "Agregados de Métricas"
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket_start'], name='unique_rollup_bucket'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_period_display()} {self.bucket_start.strftime('%Y-%m-%d %H:%M')} - {self.query_count} consultas"
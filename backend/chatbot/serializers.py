@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Conversation, Message, QueryLog, AuditLog
+from .services import runtime
 
 
 class MessageSerializer(serializers.ModelSerializer):
@@ -24,7 +25,9 @@ class ConversationListSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
     
     def get_message_count(self, obj):
-        return obj.messages.count()
+        # Las vistas anotan message_count con Count; un objeto recién creado no lo trae
+        message_count = getattr(obj, 'message_count', None)
+        return message_count if message_count is not None else obj.messages.count()
 
 
 class ConversationDetailSerializer(serializers.ModelSerializer):
@@ -39,13 +42,19 @@ class ConversationDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
     
     def get_message_count(self, obj):
-        return obj.messages.count()
+        message_count = getattr(obj, 'message_count', None)
+        return message_count if message_count is not None else obj.messages.count()
 
 
 class QueryLogSerializer(serializers.ModelSerializer):
-    """Serializador para registros de consultas."""
+    """
+    Serializador para registros de consultas.
+    El texto del contexto se reconstruye a partir de context_refs (ver
+    ChunkLookup); los registros antiguos conservan su context_used.
+    """
     
     conversation_id = serializers.SerializerMethodField()
+    context_used = serializers.SerializerMethodField()
     
     class Meta:
         model = QueryLog
@@ -57,6 +66,10 @@ class QueryLogSerializer(serializers.ModelSerializer):
             'response_time',
             'chunks_retrieved',
             'context_used',
+            'context_refs',
+            'context_index_version',
+            'answer_cached',
+            'stage_timings',
             'created_at',
             'ip_address',
             'user_agent',
@@ -65,7 +78,13 @@ class QueryLogSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
     
     def get_conversation_id(self, obj):
-        return obj.conversation.id if obj.conversation else None
+        return obj.conversation_id
+    
+    def get_context_used(self, obj):
+        if obj.context_used or not obj.context_refs:
+            return obj.context_used
+        chunk_lookup = self.context.get('chunk_lookup') or runtime.chunk_lookup()
+        return chunk_lookup.render(obj.context_refs, obj.context_index_version)
 
 
 class QueryLogListSerializer(serializers.ModelSerializer):
@@ -84,13 +103,14 @@ class QueryLogListSerializer(serializers.ModelSerializer):
             'response_preview',
             'response_time',
             'chunks_retrieved',
+            'answer_cached',
             'created_at',
             'feedback_score'
         ]
         read_only_fields = ['id', 'created_at']
     
     def get_conversation_id(self, obj):
-        return obj.conversation.id if obj.conversation else None
+        return obj.conversation_id
     
     def get_query_preview(self, obj):
         """Retorna preview de 100 caracteres."""
@@ -137,3 +157,9 @@ class MetricsSerializer(serializers.Serializer):
     avg_feedback_score = serializers.FloatField(allow_null=True)
     total_errors = serializers.IntegerField()
     most_active_hours = serializers.ListField(child=serializers.DictField())
+    cached_queries = serializers.IntegerField()
+    response_time_percentiles_24h = serializers.DictField()
+    stage_latency_ms = serializers.DictField()
+    search_batching = serializers.DictField(allow_null=True, required=False)
+    caches = serializers.DictField(allow_null=True, required=False)
+    log_writer = serializers.DictField(allow_null=True, required=False)
@@ -0,0 +1,152 @@
+"""
+Micro-batching de búsquedas concurrentes.
+Las consultas que llegan dentro de una ventana corta se codifican en un solo
+pase del encoder y se buscan con una única llamada a FAISS; cada llamador
+recibe solo sus resultados.
+"""
+
+import os
+import queue
+import threading
+import time
+from typing import Callable, List
+
+from .metrics import Histogram, collect_stages, record_stages
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class _PendingSearch:
+    """Búsqueda en espera de ser atendida por el lote en curso."""
+
+    def __init__(self, queries: List[str], k: int, persist: bool):
+        self.queries = queries
+        self.k = k
+        self.persist = persist
+        self.enqueued_at = time.perf_counter()
+        self.timings = {}
+        self.results = None
+        self.error: Exception = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Agrupa búsquedas concurrentes y las resuelve con una sola llamada a
+    `search_batch(queries, k, persist_embeddings)`.
+    """
+
+    def __init__(self, search_batch: Callable, max_batch: int = 32, max_wait_ms: float = 5.0):
+        """
+        Args:
+            search_batch: Función de búsqueda por lotes (VectorizerService.search_batch).
+            max_batch: Máximo de consultas por lote.
+            max_wait_ms: Tiempo máximo que se espera a completar un lote desde
+                que llega la primera consulta.
+        """
+        self.search_batch = search_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._pending = None
+
+    def _ensure_worker(self) -> None:
+        # El hilo se arranca en el primer uso y de nuevo tras un fork
+        # (los hilos no sobreviven al fork de los workers de gunicorn).
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pending = queue.Queue()
+            threading.Thread(
+                target=self._run, args=(self._pending,), name="search-batcher", daemon=True
+            ).start()
+            self._pid = os.getpid()
+
+    def submit(self, queries: List[str], k: int = 5, persist: bool = False) -> list:
+        """
+        Encola una búsqueda y bloquea hasta que la resuelva el lote.
+
+        Returns:
+            Una lista de resultados (chunk, puntuación) por consulta.
+        """
+        self._ensure_worker()
+        pending = _PendingSearch(queries, k, persist)
+        self._pending.put(pending)
+        pending.done.wait()
+        # Los tiempos del lote se midieron en el hilo del batcher: se
+        # trasladan al colector de etapas del llamador
+        record_stages(pending.timings)
+        if pending.error is not None:
+            raise pending.error
+        return pending.results
+
+    def _run(self, pending_queue: "queue.Queue[_PendingSearch]") -> None:
+        while True:
+            batch = []
+            try:
+                batch.append(pending_queue.get())
+                size = len(batch[0].queries)
+                deadline = time.perf_counter() + self.max_wait
+                while size < self.max_batch:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    try:
+                        pending = pending_queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    batch.append(pending)
+                    size += len(pending.queries)
+                self._run_batch(batch)
+            except Exception as e:
+                # Cualquier fallo del lote (no solo de search_batch) se entrega
+                # a sus llamadores: si el hilo muriera, submit() esperaría para siempre
+                self._fail(batch, e)
+
+    def _run_batch(self, batch: List[_PendingSearch]) -> None:
+        started = time.perf_counter()
+        for pending in batch:
+            wait_ms = (started - pending.enqueued_at) * 1000
+            self.queue_wait_ms.observe(wait_ms)
+            pending.timings["queue"] = wait_ms
+
+        queries = [query for pending in batch for query in pending.queries]
+        self.batch_sizes.observe(len(queries))
+        try:
+            with collect_stages() as timings:
+                results = self.search_batch(
+                    queries,
+                    k=max(pending.k for pending in batch),
+                    persist_embeddings=any(pending.persist for pending in batch),
+                )
+        except Exception as e:
+            self._fail(batch, e)
+            return
+
+        position = 0
+        for pending in batch:
+            count = len(pending.queries)
+            pending.results = [row[:pending.k] for row in results[position:position + count]]
+            pending.timings.update(timings)
+            position += count
+            pending.done.set()
+
+    @staticmethod
+    def _fail(batch: List[_PendingSearch], error: Exception) -> None:
+        for pending in batch:
+            if not pending.done.is_set():
+                pending.error = error
+                pending.done.set()
+
+    def stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
@@ -0,0 +1,162 @@
+"""
+Caché LRU en memoria, segura para hilos, con TTL opcional y estadísticas.
+Se usa para evitar trabajo repetido en la ruta de /api/chat/.
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+def fold_query(text: str) -> str:
+    """
+    Normaliza una consulta para usarla como clave de caché: colapsa espacios,
+    quita signos de interrogación, acentos y mayúsculas.
+    """
+    folded = re.sub(r"\s+", " ", text).strip().strip("¿? ")
+    folded = unicodedata.normalize("NFKD", folded)
+    folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return folded.lower()
+
+
+class LRUCache:
+    """Caché LRU acotada con expiración opcional por tiempo."""
+
+    def __init__(self, maxsize: int = 128, ttl: Optional[float] = None):
+        """
+        Args:
+            maxsize: Número máximo de entradas (0 desactiva la caché).
+            ttl: Segundos de vida de cada entrada (None = sin expiración).
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default: Any = None,
+            validate: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Retorna el valor asociado a `key` o `default` si no está o expiró.
+        
+        Args:
+            key: Clave a buscar.
+            default: Valor a retornar en caso de fallo.
+            validate: Función opcional; si retorna False la entrada se descarta.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                expired = expires_at is not None and expires_at <= time.monotonic()
+                if not expired and (validate is None or validate(value)):
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                if not expired:
+                    self.invalidations += 1
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Guarda `value` bajo `key`, desalojando la entrada menos usada."""
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Elimina una entrada si existe."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Vacía la caché (las estadísticas se conservan)."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Retorna contadores de aciertos/fallos y ocupación."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class DjangoCacheBackend:
+    """
+    Adaptador con la interfaz de LRUCache sobre un caché de Django
+    (p. ej. Redis o base de datos) para compartir entradas entre workers.
+    """
+
+    def __init__(self, alias: str = "default", ttl: Optional[float] = None):
+        """
+        Args:
+            alias: Alias del caché en settings.CACHES.
+            ttl: Segundos de vida de cada entrada (None = timeout por defecto del caché).
+        """
+        from django.core.cache import caches
+
+        self.alias = alias
+        self.ttl = ttl
+        self._cache = caches[alias]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._cache.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return default if value is None else value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.ttl:
+            self._cache.set(key, value, timeout=self.ttl)
+        else:
+            self._cache.set(key, value)
+
+    def invalidate(self, key: str) -> None:
+        self._cache.delete(key)
+
+    def clear(self) -> None:
+        # El caché es compartido: las entradas viejas quedan huérfanas al cambiar
+        # la huella del índice y expiran solas.
+        pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": f"django:{self.alias}",
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -3,53 +3,138 @@ Servicio de chat que coordina la respuesta a consultas del usuario.
 Integra procesamiento de documentos, vectorización y lógica de respuesta.
 """
 
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
 import time
 import re
 import unicodedata
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
+from .cache import LRUCache, fold_query
+from .chunk_store import text_hash
 from .document_processor import DocumentProcessor
-from .vectorizer import VectorizerService
+from .log_writer import get_log_writer
+from . import telemetry
+from .metrics import collect_stages, stage_timer
+from .vectorizer import VectorizerService, publish_directory
+
+
+# Índice de secciones: fuente -> encabezado normalizado -> pasajes en bruto
+SectionIndex = Dict[str, Dict[str, List[str]]]
 
 
 class ChatService:
     """Coordina la respuesta a consultas del usuario usando RAG."""
     
+    SECTION_INDEX_FILE = "section_index.json"
+    # Espera mínima entre reintentos de carga mientras no hay índice
+    INDEX_RETRY_SECONDS = 5.0
+    
     def __init__(self, documents_dir: str = "data/documents", 
-                 vectors_dir: str = "data/vectors"):
+                 vectors_dir: str = "data/vectors",
+                 document_cache_size: int = 8,
+                 vectorizer_options: Optional[dict] = None,
+                 answer_cache=None,
+                 min_similarity: float = 0.0,
+                 vectorizer=None):
         """
         Args:
             documents_dir: Directorio con documentos .txt.
             vectors_dir: Directorio para guardar/cargar índices.
+            document_cache_size: Máximo de documentos decodificados en memoria.
+            vectorizer_options: Argumentos adicionales para VectorizerService.
+            answer_cache: Caché de respuestas (LRUCache o DjangoCacheBackend).
+                Por defecto un LRU en proceso de 512 entradas.
+            min_similarity: Similitud mínima del mejor chunk para intentar
+                responder; por debajo se responde "sin información".
+            vectorizer: Backend de búsqueda ya creado (p. ej. RetrieverClient);
+                si es None se crea un VectorizerService en proceso.
         """
         self.documents_dir = documents_dir
         self.vectors_dir = vectors_dir
         self.processor = DocumentProcessor(chunk_size=500, overlap=100)
-        self.vectorizer = VectorizerService()
+        self.document_cache = LRUCache(maxsize=document_cache_size)
+        self.answer_cache = answer_cache if answer_cache is not None else LRUCache(maxsize=512)
+        self.min_similarity = min_similarity
+        self.vectorizer = vectorizer or VectorizerService(**(vectorizer_options or {}))
+        self.section_index: Optional[SectionIndex] = None
         self.is_indexed = False
+        self._load_lock = threading.Lock()
+        self._last_load_attempt = 0.0
     
-    def build_index(self) -> bool:
+    def build_index(self, eval_queries: int = 200, incremental: bool = False) -> bool:
         """
         Construye el índice de vectores desde los documentos.
+        El resultado se escribe en un directorio temporal y se publica de forma
+        atómica, por lo que un fallo a mitad no deja un índice corrupto.
+        
+        Args:
+            eval_queries: Consultas de muestra para medir recall/latencia (0 = no medir).
+            incremental: Si True, reutiliza los embeddings del índice existente
+                y solo vectoriza los chunks nuevos o modificados.
         
         Returns:
             True si el indexado fue exitoso.
         """
+        staging_dir = None
         try:
             print("🔄 Iniciando construcción del índice...")
             
             # Cargar y procesar documentos
-            chunks = self.processor.process_all_documents(self.documents_dir)
+            documents = self.processor.load_documents(self.documents_dir)
+            chunks = self.processor.process_documents(documents)
             
             if not chunks:
                 print("⚠️ No hay chunks para indexar.")
                 return False
             
+            document_hashes = {
+                doc_name: hashlib.sha256(content.encode("utf-8")).hexdigest()
+                for doc_name, content in documents
+            }
+            previous_documents = {}
+            if incremental:
+                previous_documents = self._report_document_changes(document_hashes)
+                if self._index_is_current(document_hashes):
+                    print("✅ Los documentos no cambiaron; el índice actual sigue vigente.")
+                    return self.load_index()
+            
             # Vectorizar y construir índice
-            self.vectorizer.build_index(chunks)
+            self.vectorizer.build_index(
+                chunks,
+                eval_queries=eval_queries,
+                reuse_from=self.vectors_dir if incremental else None
+            )
+            
+            # Precalcular pasajes por encabezado para no releer documentos por consulta
+            # (en modo incremental solo se recalculan los documentos modificados)
+            previous_sections = (self._load_section_index() or {}) if incremental else {}
+            changed = [
+                (doc_name, content) for doc_name, content in documents
+                if previous_documents.get(doc_name) != document_hashes[doc_name]
+                or doc_name not in previous_sections
+            ]
+            section_index = self._build_section_index(changed)
+            for doc_name, _ in documents:
+                section_index.setdefault(doc_name, previous_sections.get(doc_name))
+            self.section_index = section_index
             
-            # Guardar índice
-            self.vectorizer.save_index(self.vectors_dir)
+            # Escribir todo en un directorio temporal y publicarlo de una vez
+            # (nueva huella: las respuestas en caché dejan de aplicar)
+            parent_dir = os.path.dirname(os.path.abspath(self.vectors_dir))
+            os.makedirs(parent_dir, exist_ok=True)
+            staging_dir = tempfile.mkdtemp(prefix=".vectors-staging-", dir=parent_dir)
+            self.vectorizer.save_index(staging_dir, manifest_extra={
+                "documents": document_hashes,
+                "chunking": self._chunking_options(),
+            })
+            self._save_section_index(staging_dir)
+            publish_directory(staging_dir, self.vectors_dir)
+            self.answer_cache.clear()
             
             self.is_indexed = True
             print("✅ Índice construido y guardado exitosamente.")
@@ -58,6 +143,48 @@ class ChatService:
         except Exception as e:
             print(f"❌ Error construyendo índice: {e}")
             return False
+        
+        finally:
+            if staging_dir:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+    
+    def _report_document_changes(self, document_hashes: Dict[str, str]) -> Dict[str, str]:
+        """Compara con el manifiesto anterior e informa qué documentos cambiaron."""
+        previous = self.vectorizer.read_manifest(self.vectors_dir).get("documents", {})
+        added = [name for name in document_hashes if name not in previous]
+        changed = [
+            name for name in document_hashes
+            if name in previous and previous[name] != document_hashes[name]
+        ]
+        removed = [name for name in previous if name not in document_hashes]
+        print(
+            f"📋 Documentos nuevos: {len(added)} | modificados: {len(changed)} | "
+            f"eliminados: {len(removed)} | sin cambios: "
+            f"{len(document_hashes) - len(added) - len(changed)}"
+        )
+        return previous
+    
+    def _index_is_current(self, document_hashes: Dict[str, str]) -> bool:
+        """True si el índice en disco se construyó con los mismos documentos y opciones."""
+        manifest = self.vectorizer.read_manifest(self.vectors_dir)
+        meta = self.vectorizer._read_index_meta(self.vectors_dir)
+        built_params = meta.get("index_params", {})
+        return (
+            manifest.get("documents") == document_hashes
+            and manifest.get("chunking") == self._chunking_options()
+            and manifest.get("model_name") == self.vectorizer.model_name
+            and meta.get("index_type") == self.vectorizer.index_type
+            and meta.get("metric") == self.vectorizer.metric
+            and all(
+                built_params.get(name) == value
+                for name, value in self.vectorizer.index_params.items()
+                if value is not None
+            )
+            and os.path.exists(os.path.join(self.vectors_dir, self.SECTION_INDEX_FILE))
+        )
+    
+    def _chunking_options(self) -> dict:
+        return {"chunk_size": self.processor.chunk_size, "overlap": self.processor.overlap}
     
     def load_index(self) -> bool:
         """
@@ -66,14 +193,92 @@ class ChatService:
         Returns:
             True si la carga fue exitosa.
         """
+        self._last_load_attempt = time.monotonic()
         try:
             self.vectorizer.load_index(self.vectors_dir)
+            self.section_index = self._load_section_index()
             self.is_indexed = True
             return True
         except Exception as e:
             print(f"⚠️ No se pudo cargar índice: {e}")
             return False
     
+    def ensure_index(self) -> bool:
+        """
+        Comprueba que hay un índice cargado y vigente. Sin índice (p. ej. el
+        servidor de recuperación aún no escuchaba al arrancar el worker) se
+        reintenta la carga como mucho cada INDEX_RETRY_SECONDS; si el backend
+        de búsqueda avisa de que cambió el índice, se recargan sus metadatos
+        y el índice de secciones.
+        
+        Returns:
+            True si hay índice cargado.
+        """
+        changed = getattr(self.vectorizer, "index_changed", False)
+        if self.is_indexed and not changed:
+            return True
+        if not changed and time.monotonic() - self._last_load_attempt < self.INDEX_RETRY_SECONDS:
+            return self.is_indexed
+        # Un solo hilo recarga; el resto sigue con el estado actual
+        if self._load_lock.acquire(blocking=False):
+            try:
+                if changed:
+                    print("🔄 El índice del servidor de recuperación cambió; recargando metadatos")
+                self.load_index()
+            finally:
+                self._load_lock.release()
+        return self.is_indexed
+    
+    def _build_section_index(self, documents: List[Tuple[str, str]]) -> SectionIndex:
+        """
+        Precalcula, por documento, el pasaje que sigue a cada encabezado
+        (ver _looks_like_heading). Las líneas de texto corrido no se indexan:
+        multiplicaban el tamaño del archivo sin aportar coincidencias útiles.
+        
+        Args:
+            documents: Lista de tuplas (nombre_archivo, contenido).
+            
+        Returns:
+            Dict fuente -> encabezado normalizado -> pasajes en bruto (en orden del documento).
+        """
+        section_index: SectionIndex = {}
+        
+        for doc_name, content in documents:
+            lines = content.splitlines()
+            headings: Dict[str, List[str]] = {}
+            
+            for index, line in enumerate(lines):
+                if not self._looks_like_heading(line):
+                    continue
+                key = self._simplify_for_match(line)
+                if not key:
+                    continue
+                
+                passage = self._collect_section_lines(lines, index)
+                if passage and passage not in headings.get(key, []):
+                    headings.setdefault(key, []).append(passage)
+            
+            section_index[doc_name] = headings
+            print(f"   {doc_name} → {len(headings)} encabezados indexados")
+        
+        return section_index
+
+    def _save_section_index(self, index_path: str) -> None:
+        """Guarda el índice de secciones junto al índice FAISS."""
+        os.makedirs(index_path, exist_ok=True)
+        path = os.path.join(index_path, self.SECTION_INDEX_FILE)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.section_index or {}, f, ensure_ascii=False)
+
+    def _load_section_index(self) -> Optional[SectionIndex]:
+        """Carga el índice de secciones; None si no existe (índice antiguo)."""
+        path = os.path.join(self.vectors_dir, self.SECTION_INDEX_FILE)
+        if not os.path.exists(path):
+            print("⚠️ Índice de secciones no encontrado; se leerán los documentos por consulta.")
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
     def get_context(self, query: str, k: int = 3) -> List[Tuple[dict, float]]:
         """
         Obtiene los chunks más relevantes para una consulta.
@@ -85,7 +290,7 @@ class ChatService:
         Returns:
             Lista de (chunk, distancia).
         """
-        if not self.is_indexed:
+        if not self.ensure_index():
             return []
         
         return self.vectorizer.search(query, k=k)
@@ -153,10 +358,26 @@ class ChatService:
             document_path = Path(self.documents_dir) / source_name
             if not document_path.exists():
                 return ""
-            return self.processor._read_text_with_fallback(document_path)
+
+            # El texto decodificado y reparado se reutiliza mientras el archivo no cambie
+            file_stat = document_path.stat()
+            signature = (file_stat.st_mtime_ns, file_stat.st_size)
+            cached = self.document_cache.get(
+                str(document_path), validate=lambda entry: entry[0] == signature
+            )
+            if cached is not None:
+                return cached[1]
+
+            text = self.processor._read_text_with_fallback(document_path)
+            self.document_cache.set(str(document_path), (signature, text))
+            return text
         except Exception:
             return ""
 
+    def document_cache_stats(self) -> dict:
+        """Estadísticas de la caché de documentos fuente."""
+        return self.document_cache.stats()
+
     def _looks_like_heading(self, line: str) -> bool:
         clean = self._normalize_text(line)
         if not clean:
@@ -233,52 +454,63 @@ class ChatService:
 
         return self._repair_mojibake(explanation)
 
-    def _extract_section_passage(self, query: str, source_name: str) -> str:
-        document_text = self._load_source_document(source_name)
-        if not document_text:
-            return ""
+    def _should_skip_line(self, line: str) -> bool:
+        clean = self._normalize_text(line)
+        if not clean:
+            return True
+        if "." in clean and clean.count(".") >= 10:
+            return True
+        if clean in {"1.", "2.", "3.", "4.", "5.", "6.", "7.", "8.", "9."}:
+            return True
+        if "Av. Faro" in clean or "Guadalajara, Jalisco" in clean or "Tel.:" in clean:
+            return True
+        return False
 
-        lines = document_text.splitlines()
-        query_clean = self._simplify_for_match(query)
+    def _collect_section_lines(self, lines: List[str], index: int) -> str:
+        """Recoge el texto que sigue a la línea `index` hasta el siguiente encabezado."""
+        collected = []
+        for next_line in lines[index + 1:]:
+            if self._should_skip_line(next_line):
+                if collected and len(" ".join(collected)) >= 220:
+                    break
+                continue
 
-        def should_skip_line(line: str) -> bool:
-            clean = self._normalize_text(line)
-            if not clean:
-                return True
-            if "." in clean and clean.count(".") >= 10:
-                return True
-            if clean in {"1.", "2.", "3.", "4.", "5.", "6.", "7.", "8.", "9."}:
-                return True
-            if "Av. Faro" in clean or "Guadalajara, Jalisco" in clean or "Tel.:" in clean:
-                return True
-            return False
+            if collected and self._looks_like_heading(next_line):
+                break
 
-        for index, line in enumerate(lines):
-            clean_line = self._normalize_text(line)
-            if self._simplify_for_match(clean_line) != query_clean:
-                continue
+            collected.append(self._normalize_text(next_line))
 
-            collected = []
-            for next_line in lines[index + 1:]:
-                if should_skip_line(next_line):
-                    if collected and len(" ".join(collected)) >= 220:
-                        break
-                    continue
+            if len(" ".join(collected)) >= 700:
+                break
 
-                if collected and self._looks_like_heading(next_line):
-                    break
+        return " ".join(collected)
 
-                collected.append(self._normalize_text(next_line))
+    def _extract_section_passage(self, query: str, source_name: str) -> str:
+        query_clean = self._simplify_for_match(query)
 
-                if len(" ".join(collected)) >= 700:
-                    break
+        if self.section_index is not None:
+            candidates = self.section_index.get(source_name, {}).get(query_clean, [])
+        else:
+            candidates = self._scan_section_passages(query_clean, source_name)
 
-            passage = self._cleanup_explanation(" ".join(collected), query)
+        for raw_passage in candidates:
+            passage = self._cleanup_explanation(raw_passage, query)
             if passage:
                 return passage
 
         return ""
 
+    def _scan_section_passages(self, query_clean: str, source_name: str):
+        """Recorre el documento fuente en disco (índices sin section_index.json)."""
+        document_text = self._load_source_document(source_name)
+        if not document_text:
+            return
+
+        lines = document_text.splitlines()
+        for index, line in enumerate(lines):
+            if self._looks_like_heading(line) and self._simplify_for_match(line) == query_clean:
+                yield self._collect_section_lines(lines, index)
+
     def _extract_chunk_passage(self, query: str, context_chunks: List[dict], source_name: str) -> str:
         query_tokens = set(self._tokenize(query))
         candidate_sentences = []
@@ -307,7 +539,8 @@ class ChatService:
         explanation = " ".join(sentence for _, sentence in candidate_sentences[:4])
         return self._cleanup_explanation(explanation, query)
     
-    def generate_response(self, query: str, context_chunks: List[dict]) -> Tuple[str, Optional[str]]:
+    def generate_response(self, query: str, context_chunks: List[dict],
+                          top_similarity: Optional[float] = None) -> Tuple[str, Optional[str]]:
         """
         Genera una respuesta basada en el contexto.
         Busca un bloque coherente en el documento fuente y devuelve una respuesta
@@ -316,18 +549,21 @@ class ChatService:
         Args:
             query: Pregunta del usuario.
             context_chunks: Chunks relevantes.
+            top_similarity: Similitud del mejor chunk; si es menor que
+                min_similarity no se extrae ningún pasaje.
 
         Returns:
             Tupla con (respuesta del asistente, fuente principal sugerida).
         """
-        if not context_chunks:
+        primary_source = self._primary_source(context_chunks, top_similarity)
+        if primary_source is None:
             return "No encontré información relevante para responder tu pregunta.", None
 
-        primary_source = context_chunks[0].get("source", "Documento sin nombre")
-
-        explanation = self._extract_section_passage(query, primary_source)
+        with stage_timer("section"):
+            explanation = self._extract_section_passage(query, primary_source)
         if not explanation:
-            explanation = self._extract_chunk_passage(query, context_chunks, primary_source)
+            with stage_timer("chunk"):
+                explanation = self._extract_chunk_passage(query, context_chunks, primary_source)
 
         if not explanation:
             return (
@@ -337,6 +573,15 @@ class ChatService:
 
         return f"{explanation}\n\nFuente sugerida: {primary_source}.", primary_source
     
+    def _primary_source(self, context_chunks: List[dict],
+                        top_similarity: Optional[float] = None) -> Optional[str]:
+        """Fuente de la que sale la respuesta; None si no hay contexto suficiente."""
+        if not context_chunks or (
+            top_similarity is not None and top_similarity < self.min_similarity
+        ):
+            return None
+        return context_chunks[0].get("source", "Documento sin nombre")
+    
     def answer_question(self, query: str, k: int = 3, log_to_db: bool = False, 
                        conversation_id: Optional[int] = None,
                        request_meta: Optional[dict] = None) -> dict:
@@ -353,22 +598,205 @@ class ChatService:
         Returns:
             Dict con 'answer', 'sources', 'response_time', 'chunks_retrieved'.
         """
+        if not self.ensure_index():
+            return self._not_indexed_result()
+        
+        result, context_chunks = self.compute_answer(query, k)
+        
+        # Registrar en BD si se solicita
+        if log_to_db:
+            self._log_query_to_db(
+                query=query,
+                answer=result["answer"],
+                context_chunks=context_chunks,
+                response_time=result["response_time"],
+                conversation_id=conversation_id,
+                request_meta=request_meta,
+                answer_cached=result["cached"],
+                context_refs=result["context_refs"],
+                index_version=result["index_version"],
+                stage_timings=result["stage_timings"]
+            )
+        
+        return result
+
+    def compute_answer(self, query: str, k: int = 3) -> Tuple[dict, List[dict]]:
+        """
+        Parte de answer_question sin acceso a la BD (caché, búsqueda y
+        composición), para ejecutarla en un pool de hilos desde vistas async.
+        Requiere el índice cargado.
+        
+        Returns:
+            Tupla (resultado, chunks de contexto usados).
+        """
+        return self.finish_answer(query, k, self.retrieve_context(query, k))
+
+    def retrieve_context(self, query: str, k: int = 3) -> dict:
+        """
+        Primera etapa de compute_answer: consulta la caché de respuestas y, si
+        no hay acierto, recupera los chunks. Permite a la vista en streaming
+        enviar fuentes y confianza antes de generar la respuesta.
+        
+        Returns:
+            Dict con 'sources' (las mismas que tendrá la respuesta: la fuente
+            principal) y 'confidence_score', más el estado que necesita
+            finish_answer.
+        """
         start_time = time.time()
+        cache_key = self._answer_cache_key(query, k)
+        cached = self.answer_cache.get(cache_key)
+        stage_timings = {}
         
-        if not self.is_indexed:
-            return {
-                "answer": "Sistema no indexado. Por favor, ejecuta 'build_index' primero.",
-                "sources": [],
-                "response_time": 0.0,
-                "chunks_retrieved": 0
-            }
+        if cached is not None:
+            sources = list(cached["sources"])
+            confidence_score = cached["confidence_score"]
+            results = None
+        else:
+            # Obtener contexto relevante (cola, embed y search se miden dentro)
+            with collect_stages(stage_timings):
+                results = self.get_context(query, k=k)
+            context_chunks = [chunk for chunk, _ in results]
+            similarities = [self.vectorizer.similarity(score) for _, score in results]
+            confidence_score = max(similarities) if similarities else 0.0
+            primary_source = self._primary_source(context_chunks, confidence_score)
+            sources = [primary_source] if primary_source else []
+        
+        return {
+            "start_time": start_time,
+            "cache_key": cache_key,
+            "cached": cached,
+            "results": results,
+            "stage_timings": stage_timings,
+            "sources": sources,
+            "confidence_score": confidence_score,
+        }
+
+    def finish_answer(self, query: str, k: int, retrieval: dict) -> Tuple[dict, List[dict]]:
+        """
+        Segunda etapa de compute_answer: genera la respuesta a partir de lo
+        recuperado por retrieve_context y la guarda en la caché.
+        
+        Returns:
+            Tupla (resultado, chunks de contexto usados). result['stage_timings']
+            tiene los milisegundos de cada etapa (ver metrics.STAGES).
+        """
+        stage_timings = retrieval["stage_timings"]
+        cached = retrieval["cached"]
+        if cached is not None:
+            result = self._result_from_cache(cached, retrieval["start_time"])
+            result["stage_timings"] = stage_timings
+            telemetry.observe_answer(result, stage_timings)
+            return result, cached["context_chunks"]
         
-        # Obtener contexto relevante
-        results = self.get_context(query, k=k)
+        results = retrieval["results"]
+        with collect_stages(stage_timings):
+            result = self._compose_result(query, results, k, retrieval["start_time"])
+        result["stage_timings"] = stage_timings
+        telemetry.observe_answer(result, stage_timings)
         context_chunks = [chunk for chunk, _ in results]
+        self.answer_cache.set(retrieval["cache_key"], self._cache_entry(result, context_chunks))
+        return result, context_chunks
+
+    def answer_questions(self, queries: List[str], k: int = 3) -> List[dict]:
+        """
+        Responde varias preguntas usando una sola búsqueda por lotes.
+        Pensado para evaluación offline y pre-respuesta masiva de FAQs:
+        las respuestas se guardan en la caché de respuestas, pero no se
+        registra nada en la BD.
+        
+        Args:
+            queries: Preguntas a responder.
+            k: Número de chunks de contexto por pregunta.
+            
+        Returns:
+            Lista de dicts con el mismo formato que answer_question, en el mismo orden.
+        """
+        if not self.ensure_index():
+            return [self._not_indexed_result() for _ in queries]
+        
+        start_time = time.time()
+        answers: List[Optional[dict]] = []
+        pending = []
+        for position, query in enumerate(queries):
+            cached = self.answer_cache.get(self._answer_cache_key(query, k))
+            answers.append(
+                self._result_from_cache(cached, start_time) if cached is not None else None
+            )
+            if cached is None:
+                pending.append(position)
+        
+        pending_queries = [queries[position] for position in pending]
+        batch_results = self.vectorizer.search_batch(
+            pending_queries, k=k, persist_embeddings=True
+        )
+        retrieval_time = (time.time() - start_time) / max(len(pending), 1)
+        
+        for position, results in zip(pending, batch_results):
+            # Cada respuesta se atribuye su parte proporcional de la búsqueda en lote
+            query = queries[position]
+            result = self._compose_result(query, results, k, time.time() - retrieval_time)
+            self.answer_cache.set(
+                self._answer_cache_key(query, k),
+                self._cache_entry(result, [chunk for chunk, _ in results])
+            )
+            answers[position] = result
+        
+        return answers
+
+    def _answer_cache_key(self, query: str, k: int) -> str:
+        """Clave de caché: consulta normalizada + k + huella del índice cargado."""
+        raw = f"{fold_query(query)}|{k}|{self.vectorizer.index_fingerprint}"
+        return "chat-answer:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _cache_entry(result: dict, context_chunks: List[dict]) -> dict:
+        return {
+            "answer": result["answer"],
+            "sources": result["sources"],
+            "confidence_score": result["confidence_score"],
+            "chunks_retrieved": result["chunks_retrieved"],
+            "context_refs": result["context_refs"],
+            "index_version": result["index_version"],
+            "context_chunks": context_chunks,
+        }
+
+    @staticmethod
+    def _result_from_cache(entry: dict, start_time: float) -> dict:
+        return {
+            "answer": entry["answer"],
+            "sources": list(entry["sources"]),
+            "confidence_score": entry["confidence_score"],
+            "response_time": time.time() - start_time,
+            "chunks_retrieved": entry["chunks_retrieved"],
+            "context_refs": entry.get("context_refs"),
+            "index_version": entry.get("index_version"),
+            "cached": True,
+        }
+
+    def answer_cache_stats(self) -> dict:
+        """Estadísticas de la caché de respuestas."""
+        return self.answer_cache.stats()
+
+    @staticmethod
+    def _not_indexed_result() -> dict:
+        return {
+            "answer": "Sistema no indexado. Por favor, ejecuta 'build_index' primero.",
+            "sources": [],
+            "response_time": 0.0,
+            "chunks_retrieved": 0
+        }
+
+    def _compose_result(self, query: str, results: List[Tuple[dict, float]],
+                        k: int, start_time: float) -> dict:
+        """Genera la respuesta a partir de los resultados de búsqueda."""
+        context_chunks = [chunk for chunk, _ in results]
+        
+        # La confianza es la similitud del mejor chunk recuperado
+        similarities = [self.vectorizer.similarity(score) for _, score in results]
+        top_similarity = max(similarities) if similarities else 0.0
         
         # Generar respuesta
-        answer, main_source = self.generate_response(query, context_chunks)
+        answer, main_source = self.generate_response(query, context_chunks, top_similarity)
         answer = self._repair_mojibake(answer)
 
         # Recopilar solo la fuente principal sugerida
@@ -377,32 +805,52 @@ class ChatService:
         # Calcular tiempo de respuesta
         response_time = time.time() - start_time
         
-        result = {
+        return {
             "answer": answer,
             "sources": sources,
-            "confidence_score": float(1.0 - (sum([d for _, d in results]) / k / 100)),
+            "confidence_score": top_similarity,
             "response_time": response_time,
-            "chunks_retrieved": len(context_chunks)
+            "chunks_retrieved": len(context_chunks),
+            "context_refs": self.context_refs(results),
+            "index_version": self.vectorizer.index_fingerprint,
+            "cached": False
         }
+    
+    @staticmethod
+    def context_refs(results) -> List[list]:
+        """
+        Referencias compactas [fuente, chunk_id, puntuación, hash] a los chunks
+        usados. El hash del texto es la clave estable (ver ChunkText); fuente y
+        chunk_id solo describen la posición en el índice de ese momento.
+        """
+        return [
+            [
+                chunk["source"],
+                int(chunk["chunk_id"]),
+                round(float(score), 6) if score is not None else None,
+                text_hash(chunk["text"]),
+            ]
+            for chunk, score in results
+        ]
+    
+    @staticmethod
+    def chunk_text_records(context_chunks: List[dict]) -> list:
+        """Filas ChunkText (sin guardar) con el texto de los chunks citados."""
+        from ..models import ChunkText
         
-        # Registrar en BD si se solicita
-        if log_to_db:
-            self._log_query_to_db(
-                query=query,
-                answer=answer,
-                context_chunks=context_chunks,
-                response_time=response_time,
-                conversation_id=conversation_id,
-                request_meta=request_meta
-            )
-        
-        return result
+        texts = {text_hash(chunk["text"]): chunk["text"] for chunk in context_chunks}
+        return [ChunkText(text_hash=key, text=text) for key, text in texts.items()]
     
     def _log_query_to_db(self, query: str, answer: str, context_chunks: List[dict],
                         response_time: float, conversation_id: Optional[int] = None,
-                        request_meta: Optional[dict] = None):
+                        request_meta: Optional[dict] = None,
+                        answer_cached: bool = False,
+                        context_refs: Optional[List[list]] = None,
+                        index_version: Optional[str] = None,
+                        stage_timings: Optional[Dict[str, float]] = None):
         """
-        Registra una consulta en la base de datos.
+        Registra una consulta en la base de datos. Con el escritor en segundo
+        plano activo (CHAT_ASYNC_LOGGING) solo se encola y no añade latencia.
         
         Args:
             query: Pregunta del usuario.
@@ -411,15 +859,27 @@ class ChatService:
             response_time: Tiempo de respuesta en segundos.
             conversation_id: ID de la conversación.
             request_meta: Metadata del request (IP, user-agent).
+            answer_cached: True si la respuesta salió de la caché de respuestas.
+            context_refs: Referencias [fuente, chunk_id, puntuación, hash] de los chunks.
+            index_version: Huella del índice del que salieron los chunks.
+            stage_timings: Milisegundos por etapa de la consulta.
         """
         try:
-            from ..models import QueryLog, Conversation
+            from ..models import QueryLog, Conversation, ChunkText
             
-            # Extraer contexto usado
-            context_used = "\n\n---\n\n".join([
-                f"[{chunk['source']}]\n{chunk['text']}"
-                for chunk in context_chunks
-            ])
+            fields = self.query_log_fields(
+                query, answer, context_chunks, response_time, request_meta, answer_cached,
+                context_refs, index_version, stage_timings
+            )
+            chunk_texts = self.chunk_text_records(context_chunks)
+            log_writer = get_log_writer()
+            if log_writer is not None:
+                for record in chunk_texts:
+                    log_writer.enqueue(record)
+                log_writer.enqueue(QueryLog(conversation_id=conversation_id or None, **fields))
+                return
+            
+            ChunkText.objects.bulk_create(chunk_texts, ignore_conflicts=True)
             
             # Obtener conversación si existe
             conversation = None
@@ -429,29 +889,124 @@ class ChatService:
                 except Conversation.DoesNotExist:
                     pass
             
-            # Extraer metadata del request
-            ip_address = None
-            user_agent = ""
-            if request_meta:
-                ip_address = request_meta.get('ip_address')
-                user_agent = request_meta.get('user_agent', '')
-            
             # Crear registro
-            QueryLog.objects.create(
-                conversation=conversation,
-                user_query=query,
-                assistant_response=answer,
-                response_time=response_time,
-                chunks_retrieved=len(context_chunks),
-                context_used=context_used,
-                ip_address=ip_address,
-                user_agent=user_agent
-            )
+            QueryLog.objects.create(conversation=conversation, **fields)
             
         except Exception as e:
             # No fallar si el logging falla
             print(f"⚠️ Error al registrar query en BD: {e}")
     
+    @staticmethod
+    def persist_chat_turn(conversation, query: str, result: dict,
+                          context_chunks: Optional[List[dict]],
+                          request_meta: Optional[dict] = None):
+        """
+        Guarda un turno de chat en una sola transacción: crea la conversación
+        si hace falta (o actualiza su updated_at una vez), inserta los dos
+        mensajes con un bulk_create y el QueryLog (con los textos de sus chunks
+        en ChunkText) en el mismo bloque. Con el escritor en segundo plano
+        activo, el QueryLog se encola al confirmar.
+        El tiempo de las escrituras de conversación y mensajes se guarda como
+        etapa "db" del QueryLog.
+        
+        Args:
+            conversation: Conversación ya cargada, o None para crear una nueva.
+            query: Pregunta del usuario.
+            result: Resultado de compute_answer.
+            context_chunks: Chunks usados (None si no hay índice: no se registra consulta).
+            request_meta: Metadata del request (IP, user-agent).
+            
+        Returns:
+            Tupla (conversación, mensaje del usuario, mensaje del asistente).
+        """
+        from django.db import transaction
+        from django.utils import timezone
+        from ..models import ChunkText, Conversation, Message, QueryLog
+        
+        query_log = None
+        chunk_texts = []
+        if context_chunks is not None:
+            chunk_texts = ChatService.chunk_text_records(context_chunks)
+            query_log = QueryLog(**ChatService.query_log_fields(
+                query, result["answer"], context_chunks, result["response_time"],
+                request_meta, result.get("cached", False),
+                result.get("context_refs"), result.get("index_version"),
+                result.get("stage_timings")
+            ))
+        log_writer = get_log_writer()
+        
+        with transaction.atomic():
+            db_started = time.perf_counter()
+            if conversation is None:
+                conversation = Conversation.objects.create()
+            else:
+                conversation.updated_at = timezone.now()
+                Conversation.objects.filter(pk=conversation.pk).update(
+                    updated_at=conversation.updated_at
+                )
+            
+            user_message, assistant_message = Message.objects.bulk_create([
+                Message(conversation=conversation, role='user', content=query),
+                Message(conversation=conversation, role='assistant', content=result["answer"]),
+            ])
+            
+            db_ms = (time.perf_counter() - db_started) * 1000
+            telemetry.observe_stage("db", db_ms)
+            
+            if query_log is not None:
+                query_log.conversation = conversation
+                query_log.stage_timings["db"] = round(db_ms, 3)
+                if log_writer is not None:
+                    def enqueue_logs():
+                        for record in chunk_texts:
+                            log_writer.enqueue(record)
+                        log_writer.enqueue(query_log)
+                    transaction.on_commit(enqueue_logs)
+                else:
+                    ChunkText.objects.bulk_create(chunk_texts, ignore_conflicts=True)
+                    query_log.save()
+        
+        return conversation, user_message, assistant_message
+    
+    @staticmethod
+    def query_log_fields(query: str, answer: str, context_chunks: List[dict],
+                         response_time: float, request_meta: Optional[dict] = None,
+                         answer_cached: bool = False,
+                         context_refs: Optional[List[list]] = None,
+                         index_version: Optional[str] = None,
+                         stage_timings: Optional[Dict[str, float]] = None) -> dict:
+        """
+        Campos de un QueryLog (sin la conversación), compartidos por el
+        registro síncrono y el de las vistas async. El contexto se guarda
+        como referencias a los chunks (el texto va aparte, en ChunkText).
+        """
+        if context_refs is None or any(len(ref) < 4 for ref in context_refs):
+            # Entradas de caché sin hash: se recalculan conservando la puntuación
+            scores = [ref[2] for ref in context_refs] if context_refs else [None] * len(context_chunks)
+            context_refs = ChatService.context_refs(zip(context_chunks, scores))
+        
+        # Extraer metadata del request
+        ip_address = None
+        user_agent = ""
+        if request_meta:
+            ip_address = request_meta.get('ip_address')
+            user_agent = request_meta.get('user_agent', '')
+        
+        return {
+            "user_query": query,
+            "assistant_response": answer,
+            "response_time": response_time,
+            "chunks_retrieved": len(context_chunks),
+            "context_refs": context_refs,
+            "context_index_version": index_version or "",
+            "answer_cached": answer_cached,
+            "stage_timings": {
+                stage: round(elapsed_ms, 3) for stage, elapsed_ms in (stage_timings or {}).items()
+            },
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+        }
+    
     @staticmethod
     def log_audit_event(event_type: str, description: str, 
                        severity: str = 'info', metadata: Optional[dict] = None,
@@ -476,7 +1031,7 @@ class ChatService:
                 ip_address = request_meta.get('ip_address')
                 user_agent = request_meta.get('user_agent', '')
             
-            AuditLog.objects.create(
+            audit_log = AuditLog(
                 event_type=event_type,
                 description=description,
                 severity=severity,
@@ -484,6 +1039,11 @@ class ChatService:
                 ip_address=ip_address,
                 user_agent=user_agent
             )
+            log_writer = get_log_writer()
+            if log_writer is not None:
+                log_writer.enqueue(audit_log)
+            else:
+                audit_log.save()
             
         except Exception as e:
             print(f"⚠️ Error al registrar evento de auditoría: {e}")
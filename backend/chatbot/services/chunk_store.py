@@ -0,0 +1,250 @@
+"""
+Almacén columnar de chunks en disco.
+Guarda el texto de todos los chunks en un único blob UTF-8 con un arreglo de
+offsets, más arreglos de fuente y chunk_id. Se abre con mmap, de modo que los
+workers comparten las páginas vía la caché del sistema operativo y solo
+materializan los chunks que devuelve una búsqueda.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+class ChunkStore:
+    """Acceso de solo lectura a chunks almacenados en formato columnar."""
+
+    TEXT_FILE = "chunks_text.bin"
+    OFFSETS_FILE = "chunks_offsets.npy"
+    SOURCE_IDS_FILE = "chunks_source.npy"
+    CHUNK_IDS_FILE = "chunks_chunk_id.npy"
+    SOURCES_FILE = "chunks_sources.json"
+
+    def __init__(self, text, offsets: np.ndarray, source_ids: np.ndarray,
+                 chunk_ids: np.ndarray, sources: List[str]):
+        """
+        Args:
+            text: Blob UTF-8 con el texto concatenado (bytes o mmap).
+            offsets: Offsets en bytes de cada chunk (N + 1 elementos).
+            source_ids: Índice en `sources` de cada chunk.
+            chunk_ids: chunk_id original de cada chunk dentro de su documento.
+            sources: Nombres de los documentos fuente.
+        """
+        self._text = text
+        self.offsets = offsets
+        self.source_ids = source_ids
+        self.chunk_ids = chunk_ids
+        self.sources = sources
+
+    @classmethod
+    def write(cls, path: str, chunks: List[dict]) -> None:
+        """
+        Escribe los chunks en `path` en formato columnar.
+
+        Args:
+            path: Directorio destino.
+            chunks: Lista de dicts con 'text', 'source' y 'chunk_id'.
+        """
+        os.makedirs(path, exist_ok=True)
+
+        sources: List[str] = []
+        source_positions = {}
+        offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+        source_ids = np.zeros(len(chunks), dtype=np.int32)
+        chunk_ids = np.zeros(len(chunks), dtype=np.int32)
+
+        with open(os.path.join(path, cls.TEXT_FILE), "wb") as f:
+            position = 0
+            for row, chunk in enumerate(chunks):
+                encoded = chunk["text"].encode("utf-8")
+                f.write(encoded)
+                position += len(encoded)
+                offsets[row + 1] = position
+
+                source = chunk["source"]
+                if source not in source_positions:
+                    source_positions[source] = len(sources)
+                    sources.append(source)
+                source_ids[row] = source_positions[source]
+                chunk_ids[row] = chunk["chunk_id"]
+
+        np.save(os.path.join(path, cls.OFFSETS_FILE), offsets)
+        np.save(os.path.join(path, cls.SOURCE_IDS_FILE), source_ids)
+        np.save(os.path.join(path, cls.CHUNK_IDS_FILE), chunk_ids)
+        with open(os.path.join(path, cls.SOURCES_FILE), "w", encoding="utf-8") as f:
+            json.dump(sources, f, ensure_ascii=False)
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return os.path.exists(os.path.join(path, cls.OFFSETS_FILE))
+
+    @classmethod
+    def open(cls, path: str) -> "ChunkStore":
+        """
+        Abre un almacén existente mapeándolo en memoria.
+
+        Args:
+            path: Directorio donde está el almacén.
+        """
+        text_path = os.path.join(path, cls.TEXT_FILE)
+        if os.path.getsize(text_path) > 0:
+            with open(text_path, "rb") as f:
+                text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            text = b""
+
+        with open(os.path.join(path, cls.SOURCES_FILE), "r", encoding="utf-8") as f:
+            sources = json.load(f)
+
+        return cls(
+            text=text,
+            offsets=np.load(os.path.join(path, cls.OFFSETS_FILE), mmap_mode="r"),
+            source_ids=np.load(os.path.join(path, cls.SOURCE_IDS_FILE), mmap_mode="r"),
+            chunk_ids=np.load(os.path.join(path, cls.CHUNK_IDS_FILE), mmap_mode="r"),
+            sources=sources,
+        )
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def __getitem__(self, row: int) -> dict:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return {
+            "text": bytes(self._text[start:end]).decode("utf-8"),
+            "source": self.sources[int(self.source_ids[row])],
+            "chunk_id": int(self.chunk_ids[row]),
+        }
+
+    def __iter__(self) -> Iterator[dict]:
+        for row in range(len(self)):
+            yield self[row]
+
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+MISSING_CHUNK_TEXT = "(chunk no disponible en el índice actual)"
+INDEX_META_FILE = "index_meta.json"
+
+
+def text_hash(text: str) -> str:
+    """Clave estable del texto de un chunk (SHA-1 de su UTF-8)."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def chunk_texts(hashes: Iterable[str]) -> Dict[str, str]:
+    """Textos guardados en ChunkText para esos hashes (una sola consulta)."""
+    from ..models import ChunkText
+
+    hashes = {value for value in hashes if value}
+    if not hashes:
+        return {}
+    return dict(ChunkText.objects.filter(text_hash__in=hashes).values_list("text_hash", "text"))
+
+
+class ChunkLookup:
+    """
+    Resuelve las referencias [fuente, chunk_id, puntuación, hash] de QueryLog.
+    El texto sale de ChunkText por hash; las referencias antiguas sin hash solo
+    se resuelven contra el almacén publicado si su versión de índice coincide
+    con la del índice actual (tras una reconstrucción los chunk_id cambian).
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Directorio del índice publicado (p. ej. data/vectors).
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._version = None
+        self._store: Optional[ChunkStore] = None
+        self._fingerprint: Optional[str] = None
+        self._rows: Dict[Tuple[str, int], int] = {}
+
+    def _current(self) -> Optional[ChunkStore]:
+        try:
+            stat = os.stat(os.path.join(self.path, ChunkStore.OFFSETS_FILE))
+        except FileNotFoundError:
+            return None
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    store = ChunkStore.open(self.path)
+                    self._rows = {
+                        (store.sources[int(source_id)], int(chunk_id)): row
+                        for row, (source_id, chunk_id) in enumerate(zip(store.source_ids, store.chunk_ids))
+                    }
+                    self._fingerprint = self._read_fingerprint()
+                    self._store = store
+                    self._version = version
+        return self._store
+
+    def _read_fingerprint(self) -> Optional[str]:
+        # Misma huella que VectorizerService.load_index (con el mismo respaldo
+        # para índices antiguos sin metadatos)
+        try:
+            with open(os.path.join(self.path, INDEX_META_FILE), "r", encoding="utf-8") as f:
+                fingerprint = json.load(f).get("fingerprint")
+            if fingerprint:
+                return fingerprint
+        except (OSError, ValueError):
+            pass
+        try:
+            index_stat = os.stat(os.path.join(self.path, "faiss_index.bin"))
+        except OSError:
+            return None
+        return f"{index_stat.st_mtime_ns:x}-{index_stat.st_size:x}"
+
+    def _from_store(self, source: str, chunk_id, index_version: Optional[str]) -> Optional[str]:
+        if chunk_id is None or not index_version:
+            return None
+        store = self._current()
+        if store is None or self._fingerprint != index_version:
+            return None
+        row = self._rows.get((source, int(chunk_id)))
+        return store[row]["text"] if row is not None else None
+
+    def resolve(self, refs: List[list], index_version: Optional[str] = None) -> List[dict]:
+        """
+        Reconstruye el contexto de un QueryLog a partir de sus referencias.
+
+        Args:
+            refs: Lista de [fuente, chunk_id, puntuación] o [..., hash].
+            index_version: context_index_version del registro.
+
+        Returns:
+            Lista de dicts con 'source', 'chunk_id', 'score' y 'text' (None si
+            el texto ya no se puede recuperar).
+        """
+        texts = chunk_texts(ref[3] for ref in refs if len(ref) > 3)
+        resolved = []
+        for ref in refs:
+            source, chunk_id, score = ref[:3]
+            text = texts.get(ref[3]) if len(ref) > 3 else None
+            if text is None:
+                text = self._from_store(source, chunk_id, index_version)
+                if text is not None and len(ref) > 3 and ref[3] and text_hash(text) != ref[3]:
+                    text = None
+            resolved.append({
+                "source": source,
+                "chunk_id": chunk_id,
+                "score": score,
+                "text": text,
+            })
+        return resolved
+
+    def render(self, refs: List[list], index_version: Optional[str] = None) -> str:
+        """Contexto en el formato de texto histórico de QueryLog.context_used."""
+        return CONTEXT_SEPARATOR.join(
+            f"[{chunk['source']}]\n{chunk['text'] if chunk['text'] is not None else MISSING_CHUNK_TEXT}"
+            for chunk in self.resolve(refs, index_version)
+        )
@@ -123,11 +123,22 @@ class DocumentProcessor:
         Args:
             documents_dir: Ruta al directorio con documentos.
             
+        Returns:
+            Lista de chunks procesados.
+        """
+        return self.process_documents(self.load_documents(documents_dir))
+
+    def process_documents(self, documents: List[Tuple[str, str]]) -> List[dict]:
+        """
+        Divide en chunks documentos ya cargados.
+        
+        Args:
+            documents: Lista de tuplas (nombre_archivo, contenido).
+            
         Returns:
             Lista de chunks procesados.
         """
         all_chunks = []
-        documents = self.load_documents(documents_dir)
         
         print(f"\n🔄 Procesando documentos...")
         for doc_name, content in documents:
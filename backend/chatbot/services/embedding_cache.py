@@ -0,0 +1,227 @@
+"""
+Caché persistente de embeddings en disco.
+Guarda los vectores en una matriz float32 de solo anexado (leída con mmap) y
+un archivo de hashes cuya línea N corresponde a la fila N. La clave es el
+modelo (un subdirectorio por modelo) más el hash del texto.
+
+Ambos archivos viven en un directorio de generación; el archivo CURRENT
+indica cuál está vigente. La compactación escribe una generación nueva y la
+activa reemplazando CURRENT, así que nunca se combinan los vectores de una
+generación con los hashes de otra.
+"""
+
+import fcntl
+import os
+import re
+import shutil
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Caché de embeddings por (modelo, hash de texto) persistida en disco."""
+
+    VECTORS_FILE = "vectors.f32"
+    HASHES_FILE = "hashes.txt"
+    LOCK_FILE = ".lock"
+    CURRENT_FILE = "CURRENT"
+    GENERATION_PREFIX = "gen-"
+
+    def __init__(self, cache_dir: str, model_name: str, embedding_dim: int):
+        """
+        Args:
+            cache_dir: Directorio raíz de la caché.
+            model_name: Modelo que generó los embeddings.
+            embedding_dim: Dimensión de los embeddings.
+        """
+        self.model_name = model_name
+        self.embedding_dim = embedding_dim
+        self.path = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9._-]+", "_", model_name))
+        os.makedirs(self.path, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._rows: Dict[str, int] = {}
+        self._vectors = np.empty((0, embedding_dim), dtype=np.float32)
+        self._generation = self.path
+        self._reload()
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self._generation, self.VECTORS_FILE)
+
+    @property
+    def _hashes_path(self) -> str:
+        return os.path.join(self._generation, self.HASHES_FILE)
+
+    def _current_generation(self) -> str:
+        """Directorio de la generación vigente (la raíz en cachés sin CURRENT)."""
+        try:
+            with open(os.path.join(self.path, self.CURRENT_FILE), "r", encoding="ascii") as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return self.path
+        return os.path.join(self.path, name) if name else self.path
+
+    @contextmanager
+    def _locked(self):
+        """Bloqueo entre procesos para escrituras concurrentes."""
+        with open(os.path.join(self.path, self.LOCK_FILE), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reload(self) -> None:
+        """Relee hashes y vuelve a mapear la matriz de vectores de la generación vigente."""
+        self._generation = self._current_generation()
+        hashes: List[str] = []
+        if os.path.exists(self._hashes_path):
+            with open(self._hashes_path, "r", encoding="ascii") as f:
+                hashes = [line.strip() for line in f if line.strip()]
+
+        vector_rows = 0
+        if os.path.exists(self._vectors_path):
+            vector_rows = os.path.getsize(self._vectors_path) // (4 * self.embedding_dim)
+
+        # Una escritura interrumpida puede dejar filas sin hash o hashes sin fila
+        rows = min(len(hashes), vector_rows)
+        self._rows = {chunk_hash: row for row, chunk_hash in enumerate(hashes[:rows])}
+        if rows:
+            self._vectors = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r",
+                shape=(rows, self.embedding_dim)
+            )
+        else:
+            self._vectors = np.empty((0, self.embedding_dim), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, chunk_hash: str) -> bool:
+        return chunk_hash in self._rows
+
+    def hashes(self) -> Set[str]:
+        """Hashes presentes en la caché."""
+        return set(self._rows)
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        Busca varios embeddings.
+
+        Returns:
+            Dict hash -> embedding con los encontrados.
+        """
+        found = {}
+        for chunk_hash in hashes:
+            row = self._rows.get(chunk_hash)
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                found[chunk_hash] = np.array(self._vectors[row])
+        return found
+
+    def add_many(self, hashes: List[str], vectors: np.ndarray) -> None:
+        """Anexa embeddings nuevos (los hashes ya presentes se ignoran)."""
+        with self._locked():
+            # Otro proceso pudo haber anexado mientras tanto
+            self._reload()
+            new_rows = [
+                row for row, chunk_hash in enumerate(hashes)
+                if chunk_hash not in self._rows
+            ]
+            if not new_rows:
+                return
+
+            self._truncate_to(len(self._rows))
+            with open(self._vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(vectors[new_rows], dtype=np.float32).tobytes())
+            with open(self._hashes_path, "a", encoding="ascii") as f:
+                f.writelines(f"{hashes[row]}\n" for row in new_rows)
+            self._reload()
+
+    def _truncate_to(self, rows: int) -> None:
+        """Descarta restos de una escritura interrumpida antes de anexar."""
+        if os.path.exists(self._vectors_path):
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(rows * 4 * self.embedding_dim)
+        if os.path.exists(self._hashes_path):
+            with open(self._hashes_path, "r", encoding="ascii") as f:
+                hashes = [line.strip() for line in f if line.strip()][:rows]
+            with open(self._hashes_path, "w", encoding="ascii") as f:
+                f.writelines(f"{chunk_hash}\n" for chunk_hash in hashes)
+
+    def compact(self, keep: Iterable[str]) -> Tuple[int, int]:
+        """
+        Reescribe la caché conservando solo los hashes de `keep`.
+
+        Args:
+            keep: Hashes todavía referenciados por algún índice.
+
+        Returns:
+            Tupla (entradas conservadas, entradas eliminadas).
+        """
+        keep = set(keep)
+        with self._locked():
+            self._reload()
+            kept = [(chunk_hash, row) for chunk_hash, row in self._rows.items() if chunk_hash in keep]
+            kept.sort(key=lambda item: item[1])
+            removed = len(self._rows) - len(kept)
+            if not removed:
+                return len(kept), 0
+
+            # Restos de una compactación interrumpida antes de activarse
+            self._remove_stale_generations()
+
+            name = f"{self.GENERATION_PREFIX}{time.time_ns():x}"
+            generation = os.path.join(self.path, name)
+            os.makedirs(generation)
+            vectors = np.array(self._vectors[[row for _, row in kept]], dtype=np.float32)
+            with open(os.path.join(generation, self.VECTORS_FILE), "wb") as f:
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(os.path.join(generation, self.HASHES_FILE), "w", encoding="ascii") as f:
+                f.writelines(f"{chunk_hash}\n" for chunk_hash, _ in kept)
+                f.flush()
+                os.fsync(f.fileno())
+
+            # El reemplazo de CURRENT es el único paso que activa la generación
+            pointer = os.path.join(self.path, self.CURRENT_FILE)
+            with open(pointer + ".tmp", "w", encoding="ascii") as f:
+                f.write(name)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(pointer + ".tmp", pointer)
+
+            self._vectors = np.empty((0, self.embedding_dim), dtype=np.float32)
+            self._reload()
+            self._remove_stale_generations()
+            return len(kept), removed
+
+    def _remove_stale_generations(self) -> None:
+        """Borra las generaciones que no son la vigente (incluidos los archivos de la raíz)."""
+        current = self._current_generation()
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if name.startswith(self.GENERATION_PREFIX) and path != current:
+                shutil.rmtree(path, ignore_errors=True)
+        if current != self.path:
+            for name in (self.VECTORS_FILE, self.HASHES_FILE):
+                if os.path.exists(os.path.join(self.path, name)):
+                    os.remove(os.path.join(self.path, name))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": len(self._rows),
+            "size_bytes": len(self._rows) * 4 * self.embedding_dim,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
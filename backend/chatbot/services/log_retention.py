@@ -0,0 +1,330 @@
+"""
+Retención de QueryLog y AuditLog.
+Archiva los registros antiguos en JSONL comprimido (un directorio por tabla y
+mes, un archivo por lote) y los borra por lotes. En PostgreSQL las tablas pueden particionarse por
+mes (RANGE sobre created_at), de modo que podar un mes completo es un
+DROP TABLE de la partición en lugar de un DELETE masivo.
+"""
+
+import gzip
+import json
+import os
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .chunk_store import chunk_texts
+
+# Sufijo de los archivos escritos antes de confirmar el borrado de sus filas
+TMP_SUFFIX = ".tmp"
+
+
+def _with_context_texts(rows: List[dict]) -> List[dict]:
+    """
+    Añade a las filas de QueryLog el texto de sus chunks ('context_texts',
+    en el orden de context_refs) para que el archivo no dependa de la BD.
+    """
+    hashes = [
+        ref[3] for row in rows for ref in (row.get("context_refs") or []) if len(ref) > 3
+    ]
+    if not hashes:
+        return rows
+    texts = chunk_texts(hashes)
+    for row in rows:
+        refs = row.get("context_refs") or []
+        if refs:
+            row["context_texts"] = [texts.get(ref[3]) if len(ref) > 3 else None for ref in refs]
+    return rows
+
+
+def archive_rows(archive_dir: str, table: str, rows: Iterable[dict]) -> Tuple[int, List[str]]:
+    """
+    Escribe las filas en {archive_dir}/{tabla}/{AAAA-MM}/{id mínimo}-{id máximo}.jsonl.gz,
+    con el mes en hora local (los mismos límites que las particiones). Los
+    archivos quedan con el sufijo .tmp hasta que commit_archive los publica,
+    una vez confirmado el borrado de esas filas.
+
+    Returns:
+        Tupla (filas archivadas, rutas temporales escritas).
+    """
+    by_month = {}
+    for row in _with_context_texts(list(rows)):
+        month = timezone.localtime(row["created_at"]).strftime("%Y-%m")
+        by_month.setdefault(month, []).append(row)
+
+    staged = []
+    archived = 0
+    try:
+        for month, month_rows in by_month.items():
+            month_dir = os.path.join(archive_dir, table, month)
+            os.makedirs(month_dir, exist_ok=True)
+            ids = [row["id"] for row in month_rows]
+            path = os.path.join(month_dir, f"{min(ids):012d}-{max(ids):012d}.jsonl.gz{TMP_SUFFIX}")
+            staged.append(path)
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                for row in month_rows:
+                    f.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False))
+                    f.write("\n")
+            archived += len(month_rows)
+    except BaseException:
+        discard_archive(staged)
+        raise
+    return archived, staged
+
+
+def commit_archive(paths: List[str]) -> None:
+    """Publica los archivos de archive_rows (rename atómico) tras confirmar el borrado."""
+    for path in paths:
+        os.replace(path, path[:-len(TMP_SUFFIX)])
+
+
+def discard_archive(paths: List[str]) -> None:
+    """Elimina los archivos de archive_rows si el borrado no se confirmó."""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def recover_archive(archive_dir: str, model) -> None:
+    """
+    Resuelve los .tmp que dejó una ejecución interrumpida: si sus filas ya
+    no están en la BD, el borrado se confirmó y el archivo se publica; si
+    siguen ahí, se descarta (se volverán a archivar).
+    """
+    table_dir = os.path.join(archive_dir, model._meta.db_table)
+    if not os.path.isdir(table_dir):
+        return
+    for month in os.listdir(table_dir):
+        month_dir = os.path.join(table_dir, month)
+        if not os.path.isdir(month_dir):
+            continue
+        for name in os.listdir(month_dir):
+            if not name.endswith(TMP_SUFFIX):
+                continue
+            path = os.path.join(month_dir, name)
+            first_id = int(name.split("-", 1)[0])
+            if model.objects.filter(id=first_id).exists():
+                discard_archive([path])
+            else:
+                commit_archive([path])
+
+
+def prune_rows(model, cutoff: datetime, archive_dir: Optional[str],
+               batch_size: int = 5000) -> Tuple[int, int]:
+    """
+    Archiva (opcional) y borra por lotes las filas con created_at < cutoff.
+    Cada lote es una transacción corta para no bloquear la tabla; su archivo
+    solo se publica si el borrado se confirma, así que un lote fallido no
+    deja filas archivadas dos veces.
+
+    Returns:
+        Tupla (filas archivadas, filas borradas).
+    """
+    if archive_dir:
+        recover_archive(archive_dir, model)
+    archived = deleted = 0
+    while True:
+        staged = []
+        try:
+            with transaction.atomic():
+                rows = list(
+                    model.objects.filter(created_at__lt=cutoff)
+                    .order_by("created_at", "id")
+                    .values()[:batch_size]
+                )
+                if not rows:
+                    break
+                batch_archived = 0
+                if archive_dir:
+                    batch_archived, staged = archive_rows(archive_dir, model._meta.db_table, rows)
+                deleted += model.objects.filter(id__in=[row["id"] for row in rows]).delete()[0]
+        except BaseException:
+            discard_archive(staged)
+            raise
+        commit_archive(staged)
+        archived += batch_archived
+    return archived, deleted
+
+
+# --- Particionado mensual (solo PostgreSQL) ---
+
+def supports_partitioning() -> bool:
+    return connection.vendor == "postgresql"
+
+
+def _month_start(year: int, month: int) -> datetime:
+    return timezone.make_aware(datetime(year, month, 1), timezone.get_current_timezone())
+
+
+def _next_month(year: int, month: int) -> Tuple[int, int]:
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def partition_name(table: str, year: int, month: int) -> str:
+    return f"{table}_p{year:04d}{month:02d}"
+
+
+def is_partitioned(table: str) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s",
+            [table],
+        )
+        return cursor.fetchone() is not None
+
+
+def monthly_partitions(table: str) -> List[Tuple[str, int, int]]:
+    """Particiones mensuales existentes como (nombre, año, mes), en orden."""
+    prefix = f"{table}_p"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s",
+            [table],
+        )
+        names = [name for (name,) in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+            partitions.append((name, int(suffix[:4]), int(suffix[4:])))
+    return sorted(partitions, key=lambda item: (item[1], item[2]))
+
+
+def ensure_partitions(table: str, first: Tuple[int, int], months_ahead: int = 3) -> List[str]:
+    """
+    Crea las particiones mensuales desde `first` (año, mes) hasta
+    `months_ahead` meses después del actual, si no existen.
+
+    Returns:
+        Nombres de las particiones creadas.
+    """
+    now = timezone.localtime()
+    last = (now.year, now.month)
+    for _ in range(months_ahead):
+        last = _next_month(*last)
+
+    existing = {name for name, _, _ in monthly_partitions(table)}
+    created = []
+    year, month = first
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        while (year, month) <= last:
+            name = partition_name(table, year, month)
+            if name not in existing:
+                upper = _next_month(year, month)
+                cursor.execute(
+                    f"CREATE TABLE {qn(name)} PARTITION OF {qn(table)} "
+                    f"FOR VALUES FROM (%s) TO (%s)",
+                    [_month_start(year, month), _month_start(*upper)],
+                )
+                created.append(name)
+            year, month = _next_month(year, month)
+    return created
+
+
+def convert_to_partitioned(model, months_ahead: int = 3) -> None:
+    """
+    Convierte la tabla del modelo en una tabla particionada por mes sobre
+    created_at, copiando los datos existentes. La clave primaria pasa a ser
+    (id, created_at), como exige PostgreSQL; Django sigue usando id.
+    Se ejecuta en una transacción y bloquea la tabla mientras copia.
+    """
+    table = model._meta.db_table
+    legacy = f"{table}_legacy"
+    sequence = f"{table}_part_id_seq"
+    qn = connection.ops.quote_name
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}")
+        # Liberar el nombre de la clave primaria para la tabla nueva
+        cursor.execute(f"ALTER INDEX IF EXISTS {qn(table + '_pkey')} RENAME TO {qn(legacy + '_pkey')}")
+        # Se copian defaults, CHECK, storage, comentarios y estadísticas; los
+        # índices se recrean abajo (la clave primaria cambia) y la identidad
+        # se sustituye por una secuencia propia
+        cursor.execute(
+            f"CREATE TABLE {qn(table)} (LIKE {qn(legacy)} "
+            f"INCLUDING ALL EXCLUDING INDEXES EXCLUDING IDENTITY) "
+            f"PARTITION BY RANGE (created_at)"
+        )
+        cursor.execute(f"CREATE SEQUENCE {qn(sequence)} OWNED BY {qn(table)}.id")
+        cursor.execute(f"ALTER TABLE {qn(table)} ALTER COLUMN id SET DEFAULT nextval(%s)", [sequence])
+        cursor.execute(f"ALTER TABLE {qn(table)} ADD PRIMARY KEY (id, created_at)")
+
+        for field in model._meta.concrete_fields:
+            if field.is_relation:
+                related = field.related_model._meta
+                cursor.execute(
+                    f"ALTER TABLE {qn(table)} ADD FOREIGN KEY ({qn(field.column)}) "
+                    f"REFERENCES {qn(related.db_table)} ({qn(related.pk.column)}) "
+                    f"DEFERRABLE INITIALLY DEFERRED"
+                )
+        for index in model._meta.indexes:
+            columns = ", ".join(qn(model._meta.get_field(name).column) for name in index.fields)
+            cursor.execute(f"DROP INDEX IF EXISTS {qn(index.name)}")
+            cursor.execute(f"CREATE INDEX {qn(index.name)} ON {qn(table)} ({columns})")
+
+        cursor.execute(f"SELECT MIN(created_at), MAX(id) FROM {qn(legacy)}")
+        oldest, max_id = cursor.fetchone()
+        oldest = timezone.localtime(oldest) if oldest else timezone.localtime()
+        ensure_partitions(table, (oldest.year, oldest.month), months_ahead)
+        cursor.execute(f"CREATE TABLE {qn(table + '_default')} PARTITION OF {qn(table)} DEFAULT")
+
+        cursor.execute(f"INSERT INTO {qn(table)} SELECT * FROM {qn(legacy)}")
+        cursor.execute("SELECT setval(%s, %s, false)", [sequence, (max_id or 0) + 1])
+        cursor.execute(f"DROP TABLE {qn(legacy)}")
+
+
+def drop_expired_partitions(model, cutoff: datetime, archive_dir: Optional[str],
+                            batch_size: int = 5000) -> Tuple[int, List[str]]:
+    """
+    Archiva y elimina con DROP TABLE las particiones mensuales que terminan
+    antes de `cutoff`. Como en prune_rows, el archivo de cada partición solo
+    se publica después del DROP.
+
+    Returns:
+        Tupla (filas archivadas, particiones eliminadas).
+    """
+    table = model._meta.db_table
+    archived = 0
+    dropped = []
+    qn = connection.ops.quote_name
+    if archive_dir:
+        recover_archive(archive_dir, model)
+    for name, year, month in monthly_partitions(table):
+        lower, upper = _month_start(year, month), _month_start(*_next_month(year, month))
+        if upper > cutoff:
+            break
+        staged = []
+        partition_archived = 0
+        try:
+            if archive_dir:
+                rows = model.objects.filter(created_at__gte=lower, created_at__lt=upper).order_by("id").values()
+                batch = []
+                for row in rows.iterator(chunk_size=batch_size):
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        batch_archived, batch_staged = archive_rows(archive_dir, table, batch)
+                        partition_archived += batch_archived
+                        staged.extend(batch_staged)
+                        batch = []
+                if batch:
+                    batch_archived, batch_staged = archive_rows(archive_dir, table, batch)
+                    partition_archived += batch_archived
+                    staged.extend(batch_staged)
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE {qn(name)}")
+        except BaseException:
+            discard_archive(staged)
+            raise
+        commit_archive(staged)
+        archived += partition_archived
+        dropped.append(name)
+    return archived, dropped
@@ -0,0 +1,182 @@
+"""
+Escritura en segundo plano de QueryLog y AuditLog.
+Los registros se encolan en memoria (cola acotada) y un hilo los inserta con
+bulk_create cada N registros o T milisegundos, fuera del camino de la
+respuesta. Si la cola se llena se descartan y se cuentan.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from typing import List, Optional
+
+from . import telemetry
+
+_STOP = object()
+
+
+class LogWriter:
+    """Escritor por lotes de instancias de modelos Django (sin guardar)."""
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 100,
+                 flush_interval_ms: float = 200.0):
+        """
+        Args:
+            max_queue: Máximo de registros pendientes; por encima se descartan.
+            batch_size: Registros por bulk_create.
+            flush_interval_ms: Espera máxima antes de escribir un lote incompleto.
+        """
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    def _ensure_worker(self) -> None:
+        # El hilo se arranca en el primer uso y de nuevo tras un fork
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._thread = threading.Thread(
+                target=self._run, args=(self._queue,), name="log-writer", daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def enqueue(self, record) -> bool:
+        """
+        Encola una instancia de modelo sin guardar. No bloquea.
+
+        Returns:
+            False si se descartó por tener la cola llena.
+        """
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        telemetry.set_log_queue_depth(self._queue.qsize())
+        return True
+
+    def _run(self, pending: "queue.Queue") -> None:
+        while True:
+            try:
+                first = pending.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if first is _STOP:
+                return
+
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    record = pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    stop = True
+                    break
+                batch.append(record)
+
+            self._write(batch)
+            telemetry.set_log_queue_depth(pending.qsize())
+            if stop:
+                return
+
+    def _write(self, batch: List) -> None:
+        from django.db import close_old_connections
+
+        close_old_connections()
+        by_model = {}
+        for record in batch:
+            by_model.setdefault(type(record), []).append(record)
+
+        written = failed = 0
+        for model, records in by_model.items():
+            # Con clave natural (ChunkText, por hash) un duplicado ya está guardado
+            ignore_conflicts = not model._meta.pk.auto_created
+            try:
+                model.objects.bulk_create(records, ignore_conflicts=ignore_conflicts)
+                written += len(records)
+            except Exception as e:
+                # Un registro inválido no debe arrastrar al resto del lote
+                print(f"⚠️ Falló bulk_create de {model.__name__} ({len(records)} registros): {e}")
+                for record in records:
+                    try:
+                        record.save(force_insert=True)
+                        written += 1
+                    except Exception:
+                        failed += 1
+
+        with self._lock:
+            self.written += written
+            self.failed += failed
+            self.flushes += 1
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Escribe lo pendiente y detiene el hilo (se llama al salir del proceso)."""
+        if self._pid != os.getpid() or self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize() if self._queue is not None else 0,
+                "max_queue": self.max_queue,
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "flushes": self.flushes,
+            }
+
+
+_log_writer: Optional[LogWriter] = None
+_configured = False
+_config_lock = threading.Lock()
+
+
+def get_log_writer() -> Optional[LogWriter]:
+    """
+    Escritor compartido del proceso, o None si CHAT_ASYNC_LOGGING=false
+    (entonces los registros se insertan de forma síncrona).
+    """
+    global _log_writer, _configured
+    if not _configured:
+        with _config_lock:
+            if not _configured:
+                if os.getenv('CHAT_ASYNC_LOGGING', 'true').lower() == 'true':
+                    _log_writer = LogWriter(
+                        max_queue=int(os.getenv('LOG_WRITER_QUEUE_SIZE', '10000')),
+                        batch_size=int(os.getenv('LOG_WRITER_BATCH_SIZE', '100')),
+                        flush_interval_ms=float(os.getenv('LOG_WRITER_FLUSH_MS', '200')),
+                    )
+                    atexit.register(_log_writer.close)
+                _configured = True
+    return _log_writer
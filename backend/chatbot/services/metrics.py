@@ -0,0 +1,158 @@
+"""
+Histogramas en memoria para métricas de rendimiento del proceso.
+Usan cubetas fijas: registrar un valor es O(log cubetas) y la memoria no
+crece con el número de observaciones.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence
+
+# Cubetas por defecto para latencias en milisegundos
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+# Etapas de una consulta de chat cuyos tiempos se registran en QueryLog
+STAGES = ("queue", "embed", "search", "section", "chunk", "db")
+
+
+class Histogram:
+    """Histograma thread-safe de cubetas fijas (límites superiores inclusivos)."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS_MS):
+        """
+        Args:
+            buckets: Límites superiores de las cubetas en orden creciente; los
+                valores mayores que el último caen en una cubeta de desborde.
+        """
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[position] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Estima el percentil q (0-100) como el límite superior de la cubeta que
+        lo contiene; en la cubeta de desborde se usa el máximo observado.
+        """
+        with self._lock:
+            counts = list(self._counts)
+            count = self.count
+            maximum = self.max
+        return self._percentile(counts, count, maximum, q)
+
+    def _percentile(self, counts: List[int], count: int, maximum: float, q: float) -> Optional[float]:
+        if not count:
+            return None
+        return percentile_from_counts(self.buckets, counts, q, maximum)
+
+    def snapshot(self) -> Dict:
+        """Copia consistente de cuentas, media, máximo y percentiles 50/90/99."""
+        with self._lock:
+            counts = list(self._counts)
+            count = self.count
+            total = self.total
+            maximum = self.max
+        return {
+            "count": count,
+            "mean": total / count if count else None,
+            "max": maximum if count else None,
+            "p50": self._percentile(counts, count, maximum, 50),
+            "p90": self._percentile(counts, count, maximum, 90),
+            "p99": self._percentile(counts, count, maximum, 99),
+            "buckets": [
+                {"le": bound, "count": bucket_count}
+                for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], counts)
+            ],
+        }
+
+
+def bucket_index(value: float, buckets: Sequence[float] = LATENCY_BUCKETS_MS) -> int:
+    """Posición de la cubeta de `value` (len(buckets) para el desborde)."""
+    return bisect.bisect_left(buckets, value)
+
+
+def percentile_from_counts(buckets: Sequence[float], counts: Sequence[int], q: float,
+                           maximum: Optional[float] = None) -> Optional[float]:
+    """
+    Percentil q (0-100) a partir de cuentas no acumuladas por cubeta (con la
+    de desborde al final). Las cuentas de varios procesos o intervalos se
+    combinan sumándolas posición a posición antes de llamar a esta función.
+
+    Returns:
+        Límite superior de la cubeta que contiene el percentil (acotado por
+        `maximum` si se conoce), o None si no hay observaciones o el percentil
+        cae en el desborde sin máximo conocido.
+    """
+    count = sum(counts)
+    if not count:
+        return None
+    rank = q / 100 * count
+    seen = 0
+    for position, bucket_count in enumerate(counts):
+        seen += bucket_count
+        if bucket_count and seen >= rank:
+            if position < len(buckets):
+                bound = buckets[position]
+                return min(bound, maximum) if maximum is not None else bound
+            return maximum
+    return maximum
+
+
+# --- Tiempos por etapa de una consulta ---
+
+_stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def collect_stages(timings: Optional[Dict[str, float]] = None) -> Iterator[Dict[str, float]]:
+    """
+    Recoge en `timings` (etapa -> milisegundos) lo que midan stage_timer y
+    record_stages dentro del bloque, en este hilo o tarea. Se puede reabrir
+    con el mismo dict para acumular varias fases de una consulta.
+    """
+    timings = {} if timings is None else timings
+    token = _stage_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _stage_timings.reset(token)
+
+
+def record_stages(timings: Dict[str, float]) -> None:
+    """Suma tiempos (ms) por etapa al colector activo, si lo hay."""
+    current = _stage_timings.get()
+    if current is None:
+        return
+    for stage, elapsed_ms in timings.items():
+        current[stage] = current.get(stage, 0.0) + elapsed_ms
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Mide el bloque y lo suma a la etapa `stage` del colector activo."""
+    if _stage_timings.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stages({stage: (time.perf_counter() - started) * 1000})
@@ -0,0 +1,105 @@
+"""
+Paginación por cursor (keyset) para los listados de logs.
+Las páginas se ordenan por (created_at, id) descendente y cada una continúa
+después de la última fila de la anterior, así que una página profunda cuesta
+lo mismo que la primera (sin OFFSET). El total es una estimación del
+planificador en PostgreSQL en lugar de un COUNT(*).
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from django.db import connection
+from django.db.models import Q, QuerySet
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def parse_page_size(value: Optional[str]) -> int:
+    """
+    Tamaño de página pedido, acotado a MAX_PAGE_SIZE.
+
+    Raises:
+        ValueError: Si no es un entero positivo.
+    """
+    if value in (None, ""):
+        return DEFAULT_PAGE_SIZE
+    try:
+        size = int(value)
+    except ValueError:
+        size = 0
+    if size < 1:
+        raise ValueError("limit debe ser un entero positivo")
+    return min(size, MAX_PAGE_SIZE)
+
+
+def encode_cursor(created_at: datetime, pk: int) -> str:
+    raw = json.dumps([created_at.isoformat(), pk], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Raises:
+        ValueError: Si el cursor no es uno emitido por encode_cursor.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, pk = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError("Cursor inválido")
+
+
+def keyset_page(queryset: QuerySet, page_size: int,
+                cursor: Optional[str] = None) -> Tuple[List, Optional[str]]:
+    """
+    Una página de `queryset` ordenada por (created_at, id) descendente.
+
+    Args:
+        queryset: Consulta ya filtrada (el orden se reemplaza).
+        page_size: Filas por página.
+        cursor: Cursor devuelto por la página anterior (None para la primera).
+
+    Returns:
+        Tupla (filas, cursor de la página siguiente o None si no hay más).
+    """
+    queryset = queryset.order_by("-created_at", "-id")
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+
+    # Una fila de más indica si existe la página siguiente
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
+
+def estimated_count(queryset: QuerySet) -> Tuple[int, bool]:
+    """
+    Número aproximado de filas de `queryset`. En PostgreSQL es la estimación
+    del planificador (EXPLAIN, que parte de pg_class.reltuples y de las
+    estadísticas de columnas, y suma las particiones); en otros motores,
+    pensados para desarrollo, se usa COUNT(*).
+
+    Returns:
+        Tupla (filas, True si es una estimación).
+    """
+    if connection.vendor != "postgresql":
+        return queryset.count(), False
+
+    sql, params = queryset.order_by().values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"]), True
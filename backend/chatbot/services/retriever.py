@@ -0,0 +1,264 @@
+"""
+Servidor de recuperación dedicado y su cliente.
+Un proceso (`manage.py run_retriever`) mantiene el modelo y el índice FAISS y
+atiende búsquedas por un socket Unix, agrupando en un solo lote las consultas
+que llegan casi a la vez. Los workers web usan RetrieverClient, que sustituye
+a VectorizerService dentro de ChatService sin cargar el modelo.
+
+Protocolo: cada mensaje es un entero de 4 bytes (big-endian) con la longitud
+seguida de un objeto JSON UTF-8.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from .batching import MicroBatcher
+from . import telemetry
+from .metrics import collect_stages, record_stages
+from .vectorizer import VectorizerService
+
+_HEADER = struct.Struct(">I")
+
+
+def send_message(sock: socket.socket, payload: dict) -> None:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(body)) + body)
+
+
+def recv_message(sock: socket.socket) -> Optional[dict]:
+    """Lee un mensaje completo; retorna None si el otro extremo cerró."""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    body = _recv_exact(sock, _HEADER.unpack(header)[0])
+    if body is None:
+        return None
+    return json.loads(body.decode("utf-8"))
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    data = bytearray()
+    while len(data) < size:
+        packet = sock.recv(size - len(data))
+        if not packet:
+            return None
+        data.extend(packet)
+    return bytes(data)
+
+
+class RetrieverServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Servidor de búsquedas sobre socket Unix con micro-batching."""
+
+    daemon_threads = True
+
+    def __init__(self, vectorizer: VectorizerService, socket_path: str,
+                 max_batch: int = 32, max_wait_ms: float = 5.0):
+        """
+        Args:
+            vectorizer: Servicio con el índice ya cargado.
+            socket_path: Ruta del socket Unix.
+            max_batch: Máximo de consultas por lote.
+            max_wait_ms: Tiempo máximo que se espera a completar un lote.
+        """
+        self.vectorizer = vectorizer
+        self.socket_path = socket_path
+        self.batcher = MicroBatcher(vectorizer.search_batch, max_batch=max_batch, max_wait_ms=max_wait_ms)
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _RetrieverHandler)
+        os.chmod(socket_path, 0o660)
+
+    def info(self) -> dict:
+        vectorizer = self.vectorizer
+        return {
+            "model_name": vectorizer.model_name,
+            "index_fingerprint": vectorizer.index_fingerprint,
+            "index_type": vectorizer.index_type,
+            "metric": vectorizer.metric,
+            "ntotal": int(vectorizer.index.ntotal) if vectorizer.index is not None else 0,
+        }
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class _RetrieverHandler(socketserver.BaseRequestHandler):
+    """Atiende una conexión persistente de un worker web."""
+
+    def handle(self) -> None:
+        server: RetrieverServer = self.server
+        while True:
+            request = recv_message(self.request)
+            if request is None:
+                return
+            try:
+                op = request.get("op")
+                if op == "search":
+                    with collect_stages() as timings:
+                        results = server.batcher.submit(
+                            request["queries"], int(request.get("k", 5)), bool(request.get("persist"))
+                        )
+                    response = {
+                        "ok": True, "results": results, "timings": timings,
+                        "index_fingerprint": server.vectorizer.index_fingerprint,
+                    }
+                elif op == "info":
+                    response = {"ok": True, "info": server.info()}
+                elif op == "stats":
+                    response = {"ok": True, "stats": server.batcher.stats()}
+                elif op == "query_cache_stats":
+                    response = {"ok": True, "stats": server.vectorizer.query_cache_stats()}
+                elif op == "warm_up":
+                    server.vectorizer.warm_up()
+                    response = {"ok": True}
+                else:
+                    response = {"ok": False, "error": f"Operación desconocida: {op}"}
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            send_message(self.request, response)
+
+
+class RetrieverClient:
+    """
+    Cliente del servidor de recuperación con la misma interfaz de búsqueda que
+    VectorizerService, para usarlo en ChatService sin cargar modelo ni índice.
+    La conexión se abre en el primer uso y se reintenta si el servidor aún no
+    escucha o se reinició. Es una por hilo y por proceso: los workers creados
+    por fork (gunicorn con preload) no reutilizan la del maestro.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 30.0,
+                 connect_retries: int = 3, retry_delay: float = 0.2):
+        """
+        Args:
+            socket_path: Ruta del socket Unix del servidor.
+            timeout: Segundos máximos de espera por respuesta.
+            connect_retries: Intentos de conexión antes de fallar.
+            retry_delay: Espera inicial entre intentos (se duplica en cada uno).
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.connect_retries = max(connect_retries, 1)
+        self.retry_delay = retry_delay
+        self._local = threading.local()
+        self.model_name: Optional[str] = None
+        self.index_fingerprint: Optional[str] = None
+        self.index_type: Optional[str] = None
+        self.metric = "l2"
+        # True si una búsqueda devolvió otra huella (el servidor cargó otro
+        # índice): ChatService vuelve a llamar a load_index
+        self.index_changed = False
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            if self._local.pid == os.getpid():
+                return sock
+            # Heredada del proceso padre por fork: compartirla mezclaría los
+            # mensajes de ambos procesos. Se cierra solo la copia de este proceso.
+            self._close()
+        delay = self.retry_delay
+        for attempt in range(self.connect_retries):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except (FileNotFoundError, ConnectionRefusedError):
+                # El socket aún no existe o nadie escucha (servidor arrancando)
+                sock.close()
+                if attempt == self.connect_retries - 1:
+                    raise
+                time.sleep(delay)
+                delay *= 2
+                continue
+            self._local.sock = sock
+            self._local.pid = os.getpid()
+            return sock
+
+    def _close(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def _call(self, payload: dict) -> dict:
+        # Un reintento con conexión nueva por si el servidor se reinició
+        for attempt in range(2):
+            try:
+                sock = self._connection()
+                send_message(sock, payload)
+                response = recv_message(sock)
+                if response is None:
+                    raise ConnectionError("El servidor de recuperación cerró la conexión")
+                break
+            except (OSError, ConnectionError):
+                self._close()
+                if attempt:
+                    raise
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error", "Error en el servidor de recuperación"))
+        return response
+
+    def load_index(self, index_path: str = "") -> None:
+        """
+        Obtiene del servidor los metadatos del índice que tiene cargado.
+
+        Raises:
+            OSError: Si el servidor no responde tras los reintentos.
+        """
+        info = self._call({"op": "info"})["info"]
+        self.model_name = info["model_name"]
+        self.index_fingerprint = info["index_fingerprint"]
+        self.index_type = info["index_type"]
+        self.metric = info["metric"]
+        self.index_changed = False
+        telemetry.set_index_size(info["ntotal"])
+        print(f"✅ Conectado al servidor de recuperación {self.socket_path} ({info['ntotal']} vectores)")
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[dict, float]]:
+        return self.search_batch([query], k=k)[0]
+
+    def search_batch(self, queries: List[str], k: int = 5, batch_size: int = 64,
+                     persist_embeddings: bool = False) -> List[List[Tuple[dict, float]]]:
+        if not queries:
+            return []
+        started = time.perf_counter()
+        response = self._call({
+            "op": "search", "queries": list(queries), "k": k, "persist": persist_embeddings
+        })
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        # Etapas medidas en el servidor; el transporte se atribuye a la búsqueda
+        remote = response.get("timings") or {}
+        overhead = max(elapsed_ms - sum(remote.values()), 0.0)
+        record_stages({**remote, "search": remote.get("search", 0.0) + overhead})
+
+        fingerprint = response.get("index_fingerprint")
+        if fingerprint and fingerprint != self.index_fingerprint:
+            # Estos resultados ya son del índice nuevo; el resto de metadatos
+            # se refresca en la siguiente carga (ChatService.ensure_index)
+            self.index_fingerprint = fingerprint
+            self.index_changed = True
+        return [[(chunk, score) for chunk, score in row] for row in response["results"]]
+
+    def similarity(self, score: float) -> float:
+        return VectorizerService.score_to_similarity(score, self.metric)
+
+    def warm_up(self, search: bool = True) -> None:
+        self._call({"op": "warm_up"})
+
+    def batching_stats(self) -> Optional[dict]:
+        """Histogramas de tamaño de lote y espera en cola del servidor."""
+        return self._call({"op": "stats"})["stats"]
+
+    def query_cache_stats(self) -> dict:
+        """Estadísticas de la caché de embeddings de consultas del servidor."""
+        return self._call({"op": "query_cache_stats"})["stats"]
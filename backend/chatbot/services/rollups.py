@@ -0,0 +1,374 @@
+"""
+Agregados horarios y diarios para el endpoint de métricas.
+Las horas recientes, y las anteriores con registros modificados después
+(feedback tardío), se recalculan desde QueryLog/AuditLog (comando
+`rollup_metrics` o refresco perezoso desde la vista) y los días se suman a
+partir de las horas. El historial inicial solo lo rellena el comando. La vista lee solo unos cientos de filas agregadas, sin
+recorrer los logs, y funciona igual en SQLite y PostgreSQL.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from ..models import AuditLog, MetricsRollup, QueryLog
+from .metrics import LATENCY_BUCKETS_MS, STAGES, bucket_index, percentile_from_counts
+
+# Límites (segundos) del histograma de tiempos de respuesta
+RESPONSE_TIME_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+SUM_FIELDS = (
+    "query_count",
+    "cached_count",
+    "chunks_sum",
+    "response_time_sum",
+    "response_time_count",
+    "feedback_sum",
+    "feedback_count",
+    "error_count",
+)
+
+# Margen al buscar registros modificados desde el último refresco, para no
+# perder los que se escribieron mientras se calculaba
+LATE_ROWS_MARGIN = timedelta(minutes=5)
+
+_refresh_lock = threading.Lock()
+_last_refresh = 0.0
+
+
+def _floor_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _local_midnight(value: datetime) -> datetime:
+    local = timezone.localtime(value)
+    return timezone.make_aware(datetime(local.year, local.month, local.day))
+
+
+def _empty_bucket() -> dict:
+    bucket = {field: 0 for field in SUM_FIELDS}
+    bucket["response_time_sum"] = 0.0
+    bucket["response_time_buckets"] = [0] * len(RESPONSE_TIME_BUCKETS)
+    bucket["stage_buckets"] = {}
+    return bucket
+
+
+def _merge_stage_buckets(target: Dict[str, List[int]], source: Dict[str, List[int]]) -> None:
+    """Suma posición a posición las cuentas por etapa de `source` en `target`."""
+    for stage, counts in source.items():
+        merged = target.setdefault(stage, [0] * (len(LATENCY_BUCKETS_MS) + 1))
+        for position, count in enumerate(counts[:len(merged)]):
+            merged[position] += count
+
+
+def _upsert(period: str, buckets: Dict[datetime, dict]) -> None:
+    rows = [
+        MetricsRollup(period=period, bucket_start=bucket_start, **values)
+        for bucket_start, values in buckets.items()
+    ]
+    MetricsRollup.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["period", "bucket_start"],
+        update_fields=[*SUM_FIELDS, "response_time_buckets", "stage_buckets", "updated_at"],
+    )
+
+
+def rollup_hours(start: datetime, end: datetime) -> int:
+    """
+    Recalcula desde los logs los agregados horarios de [start, end) y los
+    diarios de los días que tocan.
+
+    Returns:
+        Número de horas recalculadas.
+    """
+    start = _floor_hour(start)
+    buckets: Dict[datetime, dict] = {}
+    hour = start
+    while hour < end:
+        buckets[hour] = _empty_bucket()
+        hour += timedelta(hours=1)
+    if not buckets:
+        return 0
+
+    query_rows = (
+        QueryLog.objects.filter(created_at__gte=start, created_at__lt=end)
+        .annotate(bucket=TruncHour("created_at"))
+        .values("bucket")
+        .annotate(
+            query_count=Count("id"),
+            cached_count=Count("id", filter=Q(answer_cached=True)),
+            chunks_sum=Sum("chunks_retrieved"),
+            response_time_sum=Sum("response_time"),
+            response_time_count=Count("response_time"),
+            feedback_sum=Sum("feedback_score"),
+            feedback_count=Count("feedback_score"),
+            **{
+                f"le_{position}": Count("id", filter=Q(response_time__lte=bound))
+                for position, bound in enumerate(RESPONSE_TIME_BUCKETS)
+            },
+        )
+    )
+    for row in query_rows:
+        bucket = buckets.setdefault(_floor_hour(row["bucket"]), _empty_bucket())
+        for field in SUM_FIELDS:
+            if field in row:
+                bucket[field] = row[field] or 0
+        bucket["response_time_buckets"] = [
+            row[f"le_{position}"] for position in range(len(RESPONSE_TIME_BUCKETS))
+        ]
+
+    # Histogramas por etapa: los tiempos viven en un JSON por registro, así
+    # que se reparten en cubetas aquí en lugar de en la consulta SQL
+    stage_rows = (
+        QueryLog.objects.filter(created_at__gte=start, created_at__lt=end)
+        .exclude(stage_timings={})
+        .values_list("created_at", "stage_timings")
+    )
+    for created_at, stage_timings in stage_rows.iterator(chunk_size=2000):
+        hour = _floor_hour(timezone.localtime(created_at))
+        stage_buckets = buckets.setdefault(hour, _empty_bucket())["stage_buckets"]
+        for stage, elapsed_ms in stage_timings.items():
+            counts = stage_buckets.setdefault(stage, [0] * (len(LATENCY_BUCKETS_MS) + 1))
+            counts[bucket_index(elapsed_ms)] += 1
+
+    error_rows = (
+        AuditLog.objects.filter(
+            created_at__gte=start, created_at__lt=end, severity__in=["error", "critical"]
+        )
+        .annotate(bucket=TruncHour("created_at"))
+        .values("bucket")
+        .annotate(error_count=Count("id"))
+    )
+    for row in error_rows:
+        buckets.setdefault(_floor_hour(row["bucket"]), _empty_bucket())["error_count"] = row["error_count"]
+
+    _upsert("hour", buckets)
+    rollup_days(start, end)
+    return len(buckets)
+
+
+def rollup_days(start: datetime, end: datetime) -> None:
+    """Recalcula los agregados diarios de los días de [start, end) sumando sus horas."""
+    day_start = _local_midnight(start)
+    day_end = _local_midnight(end - timedelta(microseconds=1)) + timedelta(days=1)
+
+    days: Dict[datetime, dict] = {}
+    hours = MetricsRollup.objects.filter(
+        period="hour", bucket_start__gte=day_start, bucket_start__lt=day_end
+    ).values("bucket_start", "response_time_buckets", "stage_buckets", *SUM_FIELDS)
+    for row in hours:
+        day = days.setdefault(_local_midnight(row["bucket_start"]), _empty_bucket())
+        for field in SUM_FIELDS:
+            day[field] += row[field]
+        for position, count in enumerate(row["response_time_buckets"][:len(RESPONSE_TIME_BUCKETS)]):
+            day["response_time_buckets"][position] += count
+        _merge_stage_buckets(day["stage_buckets"], row["stage_buckets"])
+
+    if days:
+        _upsert("day", days)
+
+
+def _hour_ranges(hours: Iterable[datetime]) -> List[Tuple[datetime, datetime]]:
+    """Agrupa horas sueltas en rangos contiguos [inicio, fin)."""
+    ranges: List[Tuple[datetime, datetime]] = []
+    for hour in sorted(set(_floor_hour(hour) for hour in hours)):
+        if ranges and ranges[-1][1] == hour:
+            ranges[-1] = (ranges[-1][0], hour + timedelta(hours=1))
+        else:
+            ranges.append((hour, hour + timedelta(hours=1)))
+    return ranges
+
+
+def rollup_late_rows(since: datetime, before: datetime) -> int:
+    """
+    Recalcula las horas anteriores a `before` que tienen registros de
+    QueryLog escritos desde `since` (feedback tardío o inserciones diferidas
+    del escritor de logs).
+
+    Returns:
+        Número de horas recalculadas.
+    """
+    hours = (
+        QueryLog.objects.filter(updated_at__gte=since, created_at__lt=before)
+        .annotate(bucket=TruncHour("created_at"))
+        .order_by()
+        .values_list("bucket", flat=True)
+        .distinct()
+    )
+    return sum(rollup_hours(start, end) for start, end in _hour_ranges(hours))
+
+
+def backfill_history() -> int:
+    """
+    Rellena los agregados de las horas anteriores al primer agregado
+    existente, desde el registro más antiguo. Con muchos registros tarda, así
+    que solo lo ejecuta el comando `rollup_metrics`, nunca una petición.
+
+    Returns:
+        Número de horas recalculadas.
+    """
+    earliest = (
+        MetricsRollup.objects.filter(period="hour")
+        .aggregate(earliest=Min("bucket_start"))["earliest"]
+    )
+    oldest = [
+        value for value in (
+            QueryLog.objects.aggregate(oldest=Min("created_at"))["oldest"],
+            AuditLog.objects.aggregate(oldest=Min("created_at"))["oldest"],
+        ) if value is not None
+    ]
+    if not oldest or earliest is None or _floor_hour(min(oldest)) >= earliest:
+        return 0
+    return rollup_hours(min(oldest), earliest)
+
+
+def refresh(now: Optional[datetime] = None, backfill: bool = False) -> int:
+    """
+    Recalcula las horas pendientes: desde la hora anterior al último agregado
+    hasta la actual, más las horas anteriores con registros escritos desde el
+    último refresco (ver rollup_late_rows). Sin agregados previos parte de la
+    hora anterior a la actual.
+
+    Args:
+        now: Momento de referencia (por defecto, ahora).
+        backfill: Si True, rellena además el historial anterior al primer
+            agregado (ver backfill_history).
+
+    Returns:
+        Número de horas recalculadas.
+    """
+    now = now or timezone.now()
+    state = MetricsRollup.objects.filter(period="hour").aggregate(
+        latest=Max("bucket_start"), last_refresh=Max("updated_at")
+    )
+    start = (state["latest"] or _floor_hour(now)) - timedelta(hours=1)
+    hours = rollup_hours(start, _floor_hour(now) + timedelta(hours=1))
+    if state["last_refresh"] is not None:
+        hours += rollup_late_rows(state["last_refresh"] - LATE_ROWS_MARGIN, start)
+    if backfill:
+        hours += backfill_history()
+    return hours
+
+
+def refresh_if_stale(max_age: Optional[float] = None) -> None:
+    """Refresca como mucho una vez cada METRICS_ROLLUP_REFRESH_SECONDS por proceso."""
+    global _last_refresh
+    if max_age is None:
+        max_age = float(os.getenv("METRICS_ROLLUP_REFRESH_SECONDS", "60"))
+    if time.monotonic() - _last_refresh < max_age:
+        return
+    with _refresh_lock:
+        if time.monotonic() - _last_refresh < max_age:
+            return
+        refresh()
+        _last_refresh = time.monotonic()
+
+
+def _percentile(cumulative: List[int], count: int, q: float) -> Optional[float]:
+    """Límite superior de la cubeta que contiene el percentil q (None si cae fuera)."""
+    if not count:
+        return None
+    rank = q / 100 * count
+    for bound, seen in zip(RESPONSE_TIME_BUCKETS, cumulative):
+        if seen >= rank:
+            return bound
+    return None
+
+
+def summarize(now: Optional[datetime] = None) -> dict:
+    """
+    Métricas del endpoint a partir de los agregados: totales históricos
+    desde las filas diarias y ventanas recientes desde las horarias.
+    """
+    now = now or timezone.now()
+    totals = MetricsRollup.objects.filter(period="day").aggregate(
+        **{field: Sum(field) for field in SUM_FIELDS}
+    )
+    totals = {field: value or 0 for field, value in totals.items()}
+
+    hourly = list(
+        MetricsRollup.objects.filter(
+            period="hour", bucket_start__gte=_floor_hour(now - timedelta(days=30))
+        ).values(
+            "bucket_start", "query_count", "response_time_count", "response_time_buckets",
+            "stage_buckets",
+        )
+    )
+
+    def queries_since(delta: timedelta) -> int:
+        since = _floor_hour(now - delta)
+        return sum(row["query_count"] for row in hourly if row["bucket_start"] >= since)
+
+    # Horas del día con más consultas en los últimos 7 días (hora local)
+    by_hour: Dict[int, int] = {}
+    since_7d = _floor_hour(now - timedelta(days=7))
+    for row in hourly:
+        if row["bucket_start"] >= since_7d and row["query_count"]:
+            hour = timezone.localtime(row["bucket_start"]).hour
+            by_hour[hour] = by_hour.get(hour, 0) + row["query_count"]
+    most_active_hours = [
+        {"hour": hour, "count": count}
+        for hour, count in sorted(by_hour.items(), key=lambda item: -item[1])[:5]
+    ]
+
+    # Percentiles del tiempo de respuesta en las últimas 24 horas
+    since_24h = _floor_hour(now - timedelta(hours=24))
+    cumulative = [0] * len(RESPONSE_TIME_BUCKETS)
+    count_24h = 0
+    for row in hourly:
+        if row["bucket_start"] >= since_24h:
+            count_24h += row["response_time_count"]
+            for position, value in enumerate(row["response_time_buckets"][:len(cumulative)]):
+                cumulative[position] += value
+
+    # Percentiles por etapa (ms) en cada ventana, fusionando las horas
+    stage_latency_ms = {}
+    for window, delta in (("24h", timedelta(hours=24)), ("7d", timedelta(days=7)),
+                          ("30d", timedelta(days=30))):
+        since = _floor_hour(now - delta)
+        merged: Dict[str, List[int]] = {}
+        for row in hourly:
+            if row["bucket_start"] >= since:
+                _merge_stage_buckets(merged, row["stage_buckets"])
+        stage_latency_ms[window] = {
+            stage: {
+                "count": sum(merged[stage]),
+                "p50": percentile_from_counts(LATENCY_BUCKETS_MS, merged[stage], 50),
+                "p90": percentile_from_counts(LATENCY_BUCKETS_MS, merged[stage], 90),
+                "p99": percentile_from_counts(LATENCY_BUCKETS_MS, merged[stage], 99),
+            }
+            for stage in STAGES if stage in merged
+        }
+
+    return {
+        "total_queries": totals["query_count"],
+        "avg_response_time": (
+            totals["response_time_sum"] / totals["response_time_count"]
+            if totals["response_time_count"] else 0.0
+        ),
+        "avg_chunks_retrieved": (
+            totals["chunks_sum"] / totals["query_count"] if totals["query_count"] else 0.0
+        ),
+        "queries_last_24h": queries_since(timedelta(hours=24)),
+        "queries_last_7d": queries_since(timedelta(days=7)),
+        "queries_last_30d": queries_since(timedelta(days=30)),
+        "avg_feedback_score": (
+            totals["feedback_sum"] / totals["feedback_count"] if totals["feedback_count"] else None
+        ),
+        "total_errors": totals["error_count"],
+        "cached_queries": totals["cached_count"],
+        "most_active_hours": most_active_hours,
+        "response_time_percentiles_24h": {
+            "p50": _percentile(cumulative, count_24h, 50),
+            "p90": _percentile(cumulative, count_24h, 90),
+            "p99": _percentile(cumulative, count_24h, 99),
+        },
+        "stage_latency_ms": stage_latency_ms,
+    }
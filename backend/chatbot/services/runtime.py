@@ -0,0 +1,241 @@
+"""
+Instancia compartida de ChatService por proceso y su estado de preparación.
+El AppConfig la precarga al arrancar (warm-up) para que la primera consulta
+no pague la carga del modelo y del índice.
+"""
+
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from .cache import DjangoCacheBackend, LRUCache
+from .chat_service import ChatService
+from .chunk_store import ChunkLookup
+from .retriever import RetrieverClient
+from . import telemetry
+
+_chat_service: Optional[ChatService] = None
+_lock = threading.Lock()
+_retrieval_executor: Optional[ThreadPoolExecutor] = None
+_chunk_lookup: Optional[ChunkLookup] = None
+
+# Servidores HTTP cuyos procesos precargan el servicio (además de runserver)
+SERVER_COMMANDS = ("gunicorn", "uvicorn", "daphne", "hypercorn", "uwsgi")
+
+# Estados: cold (sin cargar), warming, ready, failed
+_readiness = {
+    "status": "cold",
+    "indexed": None,
+    "load_seconds": None,
+    "error": None,
+}
+
+
+def build_answer_cache():
+    """Crea la caché de respuestas según ANSWER_CACHE_BACKEND (local, django o none)."""
+    backend = os.getenv('ANSWER_CACHE_BACKEND', 'local').lower()
+    ttl = float(os.getenv('ANSWER_CACHE_TTL', '0')) or None
+    if backend == 'django':
+        return DjangoCacheBackend(alias=os.getenv('ANSWER_CACHE_ALIAS', 'default'), ttl=ttl)
+    if backend == 'none':
+        return LRUCache(maxsize=0)
+    return LRUCache(maxsize=int(os.getenv('ANSWER_CACHE_SIZE', '512')), ttl=ttl)
+
+
+def create_chat_service() -> ChatService:
+    """
+    Crea un ChatService configurado desde variables de entorno y carga el índice.
+    Con RETRIEVER_SOCKET la búsqueda se delega al servidor `run_retriever`.
+    """
+    retriever_socket = os.getenv('RETRIEVER_SOCKET')
+    chat_service = ChatService(
+        documents_dir=os.getenv('DOCUMENTS_DIR', 'data/documents'),
+        vectors_dir=os.getenv('VECTORS_DIR', 'data/vectors'),
+        document_cache_size=int(os.getenv('DOCUMENT_CACHE_SIZE', '8')),
+        vectorizer_options={
+            'query_cache_size': int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '1024')),
+            'query_cache_ttl': float(os.getenv('QUERY_EMBEDDING_CACHE_TTL', '0')) or None,
+            'embedding_cache_dir': os.getenv('EMBEDDING_CACHE_DIR') or None,
+            'mmap_index': os.getenv('FAISS_MMAP', 'true').lower() == 'true',
+            'batch_window_ms': float(os.getenv('SEARCH_BATCH_WINDOW_MS', '0')),
+            'max_batch_size': int(os.getenv('SEARCH_MAX_BATCH', '32')),
+        },
+        answer_cache=build_answer_cache(),
+        min_similarity=float(os.getenv('CHAT_MIN_SIMILARITY', '0')),
+        vectorizer=RetrieverClient(retriever_socket) if retriever_socket else None
+    )
+    # Intentar cargar índice si existe
+    chat_service.load_index()
+    return chat_service
+
+
+def get_chat_service() -> ChatService:
+    """
+    Obtiene la instancia del servicio de chat del proceso.
+    Si no se precargó, se crea en la primera llamada; el lock garantiza que
+    peticiones concurrentes no construyan instancias duplicadas.
+    """
+    global _chat_service
+    if _chat_service is None:
+        with _lock:
+            if _chat_service is None:
+                start = time.time()
+                _readiness["status"] = "warming"
+                try:
+                    chat_service = create_chat_service()
+                except Exception as e:
+                    _readiness.update(status="failed", error=str(e))
+                    raise
+                _readiness.update(
+                    status="ready",
+                    error=None,
+                    indexed=chat_service.is_indexed,
+                    load_seconds=time.time() - start,
+                )
+                telemetry.set_model_load_seconds(_readiness["load_seconds"])
+                _chat_service = chat_service
+    return _chat_service
+
+
+def retrieval_executor() -> ThreadPoolExecutor:
+    """
+    Pool acotado (CHAT_RETRIEVAL_WORKERS hilos) donde las vistas async ejecutan
+    la codificación, la búsqueda y la extracción de pasajes. Se crea en el
+    primer uso, ya dentro del worker, porque los hilos no sobreviven al fork.
+    """
+    global _retrieval_executor
+    if _retrieval_executor is None:
+        with _lock:
+            if _retrieval_executor is None:
+                _retrieval_executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv('CHAT_RETRIEVAL_WORKERS', '4')),
+                    thread_name_prefix='chat-retrieval'
+                )
+    return _retrieval_executor
+
+
+def chunk_lookup() -> ChunkLookup:
+    """
+    Resolución de las referencias a chunks de los QueryLog (por hash en
+    ChunkText, o en el índice publicado en VECTORS_DIR para referencias
+    antiguas de la misma versión), sin cargar el modelo.
+    """
+    global _chunk_lookup
+    if _chunk_lookup is None:
+        _chunk_lookup = ChunkLookup(os.getenv('VECTORS_DIR', 'data/vectors'))
+    return _chunk_lookup
+
+
+def warm_up() -> bool:
+    """
+    Carga modelo e índice y ejecuta una codificación/búsqueda de prueba para
+    reservar memoria y compilar rutas perezosas antes de recibir tráfico.
+
+    Returns:
+        True si el servicio quedó listo.
+    """
+    try:
+        start = time.time()
+        chat_service = get_chat_service()
+        chat_service.vectorizer.warm_up(search=chat_service.is_indexed)
+        _readiness.update(status="ready", error=None, load_seconds=time.time() - start)
+        telemetry.set_model_load_seconds(_readiness["load_seconds"])
+        print(f"🔥 Servicio de chat precargado en {_readiness['load_seconds']:.2f}s")
+        return True
+    except Exception as e:
+        _readiness.update(status="failed", error=str(e))
+        print(f"❌ Falló la precarga del servicio de chat: {e}")
+        return False
+
+
+def eager_warmup_enabled() -> bool:
+    return os.getenv('CHAT_EAGER_WARMUP', 'true').lower() == 'true'
+
+
+def _server_command(argv0: str) -> Optional[str]:
+    """Nombre del servidor HTTP que lanzó el proceso (también con `python -m`)."""
+    path = os.path.abspath(argv0)
+    name = os.path.basename(path)
+    if name in ('__main__.py', 'main.py'):
+        name = os.path.basename(os.path.dirname(path))
+    name = os.path.splitext(name)[0]
+    return name if name in SERVER_COMMANDS else None
+
+
+def should_warm_up() -> bool:
+    """
+    True si este proceso va a servir tráfico HTTP: uno de SERVER_COMMANDS o
+    `manage.py runserver` (solo el proceso hijo del autoreloader). Cualquier
+    otro proceso (comandos de gestión, tests, scripts) no carga el modelo.
+    """
+    if not eager_warmup_enabled() or not sys.argv:
+        return False
+
+    if _server_command(sys.argv[0]):
+        return True
+
+    if os.path.basename(sys.argv[0]) != 'manage.py':
+        return False
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'runserver':
+        return False
+
+    return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv
+
+
+def readiness() -> dict:
+    """
+    Estado de preparación del servicio para el health check. 'indexed' es
+    None mientras el servicio no se haya cargado.
+    """
+    if _chat_service is not None:
+        _readiness["indexed"] = _chat_service.ensure_index()
+        # Una carga o un reintento posterior a un fallo dejan el servicio listo
+        if _readiness["indexed"] and _readiness["status"] == "failed":
+            _readiness.update(status="ready", error=None)
+    state = dict(_readiness)
+    state["eager_warmup"] = eager_warmup_enabled()
+    return state
+
+
+def search_batching_stats() -> Optional[dict]:
+    """
+    Histogramas de micro-batching de búsquedas del proceso (o del servidor de
+    recuperación). None si el servicio no está cargado o no agrupa búsquedas.
+    """
+    if _chat_service is None:
+        return None
+    return _chat_service.vectorizer.batching_stats()
+
+
+def cache_stats() -> Optional[dict]:
+    """
+    Aciertos y fallos de las cachés del servicio en este proceso (la de
+    embeddings de consultas, del servidor de recuperación si se usa). None si
+    el servicio no está cargado.
+    """
+    if _chat_service is None:
+        return None
+    return {
+        'documents': _chat_service.document_cache_stats(),
+        'query_embeddings': _chat_service.vectorizer.query_cache_stats(),
+        'answers': _chat_service.answer_cache_stats(),
+    }
+
+
+def is_ready() -> bool:
+    """
+    True si el proceso puede recibir tráfico: el servicio está cargado y tiene
+    índice (sin él, ensure_index reintenta la carga). Sin precarga
+    (CHAT_EAGER_WARMUP=false) el servicio se carga en la primera consulta y
+    hasta entonces se considera disponible.
+    """
+    state = readiness()
+    if state["indexed"] is False:
+        return False
+    if not eager_warmup_enabled():
+        return state["status"] != "failed"
+    return state["status"] == "ready"
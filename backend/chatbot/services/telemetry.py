@@ -0,0 +1,138 @@
+"""
+Métricas de proceso para el endpoint /metrics (formato OpenMetrics/Prometheus).
+Son contadores e histogramas en memoria, baratos de actualizar y de leer, a
+diferencia de /api/metrics/ que consulta la BD.
+
+Con varios workers (gunicorn) se define PROMETHEUS_MULTIPROC_DIR antes de
+arrancar: cada proceso escribe sus valores en archivos mapeados en memoria de
+ese directorio y el endpoint los agrega. Si prometheus_client no está
+instalado, las funciones de registro no hacen nada.
+"""
+
+import os
+from typing import Dict, Optional, Tuple
+
+from .metrics import LATENCY_BUCKETS_MS
+
+try:
+    from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY
+    from prometheus_client import multiprocess
+    from prometheus_client.exposition import choose_encoder
+except ImportError:
+    CollectorRegistry = Counter = Gauge = Histogram = REGISTRY = None
+    multiprocess = choose_encoder = None
+
+# Mismas cubetas que los agregados de MetricsRollup, en segundos
+LATENCY_BUCKETS_S = tuple(bound / 1000 for bound in LATENCY_BUCKETS_MS)
+
+# Último valor de los gauges que solo se fijan al cargar el servicio, para
+# volver a publicarlos en los workers creados por fork (republish_gauges)
+_load_gauges: Dict[str, float] = {}
+
+
+def multiprocess_dir() -> Optional[str]:
+    return os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.getenv("prometheus_multiproc_dir")
+
+
+if Counter is not None:
+    # Las métricas se crean al importar y abren ya sus archivos en modo multiproceso
+    if multiprocess_dir():
+        os.makedirs(multiprocess_dir(), exist_ok=True)
+
+    CHAT_REQUESTS = Counter(
+        "chatbot_chat_requests", "Peticiones de chat por endpoint y resultado",
+        ["endpoint", "outcome"],
+    )
+    ANSWER_CACHE = Counter(
+        "chatbot_answer_cache_lookups", "Consultas a la caché de respuestas",
+        ["result"],
+    )
+    RESPONSE_TIME = Histogram(
+        "chatbot_response_seconds", "Tiempo de respuesta del chat (sin guardar en BD)",
+        buckets=LATENCY_BUCKETS_S,
+    )
+    STAGE_LATENCY = Histogram(
+        "chatbot_stage_seconds", "Tiempo por etapa de la consulta (ver metrics.STAGES)",
+        ["stage"], buckets=LATENCY_BUCKETS_S,
+    )
+    INDEX_VECTORS = Gauge(
+        "chatbot_index_vectors", "Vectores del índice FAISS cargado",
+        multiprocess_mode="livemax",
+    )
+    MODEL_LOAD_SECONDS = Gauge(
+        "chatbot_model_load_seconds", "Segundos que tardó la carga del modelo y el índice",
+        multiprocess_mode="livemax",
+    )
+    LOG_QUEUE_DEPTH = Gauge(
+        "chatbot_log_queue_depth", "Registros pendientes en la cola del escritor de logs",
+        multiprocess_mode="livesum",
+    )
+
+
+def enabled() -> bool:
+    return Counter is not None
+
+
+def count_chat_request(endpoint: str, outcome: str) -> None:
+    """Cuenta una petición de chat ('ok' o 'error')."""
+    if Counter is not None:
+        CHAT_REQUESTS.labels(endpoint=endpoint, outcome=outcome).inc()
+
+
+def observe_answer(result: dict, stage_timings: Optional[Dict[str, float]] = None) -> None:
+    """Registra el tiempo de respuesta, el acierto de caché y las etapas de una consulta."""
+    if Counter is None:
+        return
+    ANSWER_CACHE.labels(result="hit" if result.get("cached") else "miss").inc()
+    RESPONSE_TIME.observe(result.get("response_time") or 0.0)
+    for stage, elapsed_ms in (stage_timings or {}).items():
+        STAGE_LATENCY.labels(stage=stage).observe(elapsed_ms / 1000)
+
+
+def observe_stage(stage: str, elapsed_ms: float) -> None:
+    if Counter is not None:
+        STAGE_LATENCY.labels(stage=stage).observe(elapsed_ms / 1000)
+
+
+def set_index_size(vectors: int) -> None:
+    _load_gauges["index_vectors"] = vectors
+    if Counter is not None:
+        INDEX_VECTORS.set(vectors)
+
+
+def set_model_load_seconds(seconds: float) -> None:
+    _load_gauges["model_load_seconds"] = seconds
+    if Counter is not None:
+        MODEL_LOAD_SECONDS.set(seconds)
+
+
+def republish_gauges() -> None:
+    """Vuelve a fijar en este proceso los gauges de carga heredados del maestro."""
+    if "index_vectors" in _load_gauges:
+        set_index_size(_load_gauges["index_vectors"])
+    if "model_load_seconds" in _load_gauges:
+        set_model_load_seconds(_load_gauges["model_load_seconds"])
+
+
+def set_log_queue_depth(depth: int) -> None:
+    if Counter is not None:
+        LOG_QUEUE_DEPTH.set(depth)
+
+
+def render(accept_header: str = "") -> Tuple[bytes, str]:
+    """
+    Serializa las métricas según la cabecera Accept (OpenMetrics si el
+    scraper lo pide). En modo multiproceso agrega los archivos de todos los
+    workers.
+
+    Returns:
+        Tupla (cuerpo, content type).
+    """
+    if multiprocess_dir():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    encoder, content_type = choose_encoder(accept_header)
+    return encoder(registry), content_type
+
@@ -3,11 +3,23 @@ Servicio de vectorización.
 Convierte texto en embeddings usando sentence-transformers e indexa con FAISS.
 """
 
+import hashlib
+import json
 import os
-import pickle
-from typing import List, Tuple
+import shutil
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
 import numpy as np
 
+from .batching import MicroBatcher
+from .cache import LRUCache, fold_query
+from .chunk_store import ChunkStore
+from .embedding_cache import EmbeddingCache
+from .metrics import stage_timer
+from . import telemetry
+
 try:
     import faiss
     from sentence_transformers import SentenceTransformer
@@ -19,11 +31,53 @@ except ImportError:
 class VectorizerService:
     """Vectoriza documentos y realiza búsquedas semánticas con FAISS."""
     
-    def __init__(self, model_name: str = "paraphrase-multilingual-MiniLM-L12-v2"):
+    INDEX_META_FILE = "index_meta.json"
+    MANIFEST_FILE = "manifest.json"
+    EMBEDDINGS_FILE = "embeddings.npy"
+    INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+    METRICS = ("l2", "ip")
+    DEFAULT_INDEX_PARAMS = {
+        "nlist": None,          # IVF: número de listas (None = 4·√N)
+        "nprobe": 8,            # IVF: listas visitadas por búsqueda
+        "pq_m": 16,             # IVF-PQ: subcuantizadores (debe dividir la dimensión)
+        "pq_nbits": 8,          # IVF-PQ: bits por subcuantizador
+        "hnsw_m": 32,           # HNSW: vecinos por nodo
+        "ef_construction": 200, # HNSW: amplitud de búsqueda al construir
+        "ef_search": 64,        # HNSW: amplitud de búsqueda al consultar
+    }
+    
+    def __init__(self, model_name: str = "paraphrase-multilingual-MiniLM-L12-v2",
+                 query_cache_size: int = 1024,
+                 query_cache_ttl: Optional[float] = None,
+                 index_type: str = "flat",
+                 index_params: Optional[dict] = None,
+                 metric: str = "l2",
+                 embedding_cache_dir: Optional[str] = None,
+                 mmap_index: bool = False,
+                 batch_window_ms: float = 0.0,
+                 max_batch_size: int = 32):
         """
         Args:
             model_name: Nombre del modelo de sentence-transformers a usar.
+            query_cache_size: Máximo de embeddings de consultas en caché (0 la desactiva).
+            query_cache_ttl: Segundos de vida de cada embedding en caché (None = sin expiración).
+            index_type: Tipo de índice a construir (flat, ivf_flat, ivf_pq, hnsw).
+            index_params: Parámetros de ajuste del índice (ver DEFAULT_INDEX_PARAMS).
+            metric: 'l2' (distancia euclídea) o 'ip' (producto interno sobre
+                embeddings normalizados, es decir, similitud coseno).
+            embedding_cache_dir: Directorio de la caché persistente de embeddings
+                (None la desactiva).
+            mmap_index: Cargar el índice FAISS mapeado en memoria y de solo lectura,
+                para que los workers creados por fork compartan sus páginas.
+            batch_window_ms: Ventana en ms para agrupar búsquedas concurrentes
+                en un solo pase del encoder y de FAISS (0 lo desactiva).
+            max_batch_size: Máximo de consultas por lote agrupado.
         """
+        if index_type not in self.INDEX_TYPES:
+            raise ValueError(f"Tipo de índice no soportado: {index_type}")
+        if metric not in self.METRICS:
+            raise ValueError(f"Métrica no soportada: {metric}")
+
         if SentenceTransformer is None:
             raise ImportError("Instala: pip install sentence-transformers faiss-cpu")
         
@@ -34,7 +88,24 @@ class VectorizerService:
         self.model = SentenceTransformer(model_name, device="cpu")
         self.index = None
         self.chunks = []
+        self.chunk_hashes: List[str] = []
+        self.embeddings: Optional[np.ndarray] = None
+        self.index_fingerprint: Optional[str] = None
+        self.index_type = index_type
+        self.metric = metric
+        self.mmap_index = mmap_index
+        self.index_params = {**self.DEFAULT_INDEX_PARAMS, **(index_params or {})}
+        self.build_report: Optional[dict] = None
         self.embedding_dim = self.model.get_sentence_embedding_dimension()
+        self.query_cache = LRUCache(maxsize=query_cache_size, ttl=query_cache_ttl)
+        self.embedding_cache = (
+            EmbeddingCache(embedding_cache_dir, model_name, self.embedding_dim)
+            if embedding_cache_dir else None
+        )
+        self.batcher = (
+            MicroBatcher(self.search_batch, max_batch=max_batch_size, max_wait_ms=batch_window_ms)
+            if batch_window_ms > 0 else None
+        )
     
     def vectorize_chunks(self, chunks: List[dict]) -> np.ndarray:
         """
@@ -49,30 +120,221 @@ class VectorizerService:
         texts = [chunk["text"] for chunk in chunks]
         print(f"🔄 Vectorizando {len(texts)} chunks...")
         
-        embeddings = self.model.encode(texts, show_progress_bar=True)
+        embeddings = self.encode_texts(texts, show_progress_bar=True)
         print(f"✅ Embeddings generados: {embeddings.shape}")
         
         return embeddings
     
-    def build_index(self, chunks: List[dict]) -> None:
+    def encode_texts(self, texts: List[str], batch_size: int = 32,
+                     show_progress_bar: bool = False) -> np.ndarray:
+        """
+        Codifica textos consultando primero la caché persistente de embeddings;
+        solo los textos ausentes pasan por el modelo y se agregan a la caché.
+        
+        Args:
+            texts: Textos a codificar.
+            batch_size: Tamaño de lote para el encoder.
+            show_progress_bar: Mostrar barra de progreso del encoder.
+            
+        Returns:
+            Matriz float32 (len(texts) x embedding_dim).
+        """
+        if self.embedding_cache is None:
+            return self.model.encode(
+                texts, batch_size=batch_size, show_progress_bar=show_progress_bar
+            ).astype(np.float32)
+        
+        hashes = [self.chunk_hash(text) for text in texts]
+        found = self.embedding_cache.get_many(hashes)
+        
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in found and text_hash not in missing:
+                missing[text_hash] = text
+        
+        if missing:
+            print(f"   Caché de embeddings: {len(texts) - len(missing)} aciertos, {len(missing)} a calcular")
+            encoded = self.model.encode(
+                list(missing.values()), batch_size=batch_size,
+                show_progress_bar=show_progress_bar
+            ).astype(np.float32)
+            self.embedding_cache.add_many(list(missing.keys()), encoded)
+            found.update(zip(missing.keys(), encoded))
+        
+        if not texts:
+            return np.empty((0, self.embedding_dim), dtype=np.float32)
+        return np.vstack([found[text_hash] for text_hash in hashes]).astype(np.float32, copy=False)
+    
+    @staticmethod
+    def chunk_hash(text: str) -> str:
+        """Hash del texto de un chunk; identifica su embedding entre construcciones."""
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+    
+    def build_index(self, chunks: List[dict], eval_queries: int = 200,
+                    reuse_from: Optional[str] = None) -> None:
         """
         Construye un índice FAISS a partir de chunks.
         
         Args:
             chunks: Lista de chunks procesados.
+            eval_queries: Consultas de muestra para medir recall/latencia (0 = no medir).
+            reuse_from: Directorio de un índice anterior cuyos embeddings se
+                reutilizan para los chunks sin cambios (construcción incremental).
         """
         self.chunks = chunks
-        embeddings = self.vectorize_chunks(chunks)
+        self.chunk_hashes = [self.chunk_hash(chunk["text"]) for chunk in chunks]
+        if reuse_from:
+            self.embeddings = self._embed_incremental(chunks, reuse_from)
+        else:
+            self.embeddings = self.vectorize_chunks(chunks).astype(np.float32)
+        
+        # Los embeddings se guardan sin normalizar; el índice usa su propia copia
+        embeddings = self.embeddings.copy()
+        if self.metric == "ip":
+            faiss.normalize_L2(embeddings)
         
-        # Crear índice FAISS
-        print(f"🏗️  Construyendo índice FAISS...")
-        self.index = faiss.IndexFlatL2(self.embedding_dim)
-        self.index.add(embeddings.astype(np.float32))
+        # Crear índice FAISS (entrenándolo si el tipo lo requiere)
+        print(f"🏗️  Construyendo índice FAISS ({self.index_type}, {self.metric})...")
+        self.index = self._create_index(embeddings)
+        self.index.add(embeddings)
+        self._apply_search_params()
+        self.index_fingerprint = uuid.uuid4().hex
         print(f"✅ Índice construido con {self.index.ntotal} vectores")
+        
+        self.build_report = self.evaluate_index(embeddings, sample_size=eval_queries) if eval_queries else None
+    
+    def _embed_incremental(self, chunks: List[dict], previous_path: str) -> np.ndarray:
+        """
+        Reutiliza los embeddings de un índice anterior para los chunks cuyo
+        texto no cambió y vectoriza solo los nuevos o modificados.
+        """
+        manifest = self.read_manifest(previous_path)
+        embeddings_path = os.path.join(previous_path, self.EMBEDDINGS_FILE)
+        if manifest.get("model_name") != self.model_name or not os.path.exists(embeddings_path):
+            print("⚠️ No hay un manifiesto compatible; se vectorizan todos los chunks.")
+            return self.vectorize_chunks(chunks).astype(np.float32)
+        
+        previous = np.load(embeddings_path, mmap_mode="r")
+        previous_rows = {chunk_hash: row for row, chunk_hash in enumerate(manifest["chunk_hashes"])}
+        
+        embeddings = np.empty((len(chunks), self.embedding_dim), dtype=np.float32)
+        missing = []
+        for row, chunk_hash in enumerate(self.chunk_hashes):
+            previous_row = previous_rows.get(chunk_hash)
+            if previous_row is None:
+                missing.append(row)
+            else:
+                embeddings[row] = previous[previous_row]
+        
+        removed = len(set(previous_rows) - set(self.chunk_hashes))
+        print(
+            f"♻️  Embeddings reutilizados: {len(chunks) - len(missing)} | "
+            f"nuevos: {len(missing)} | eliminados: {removed}"
+        )
+        
+        if missing:
+            embeddings[missing] = self.vectorize_chunks([chunks[row] for row in missing])
+        
+        return embeddings
+    
+    def _create_index(self, embeddings: np.ndarray):
+        """Crea (y entrena si hace falta) un índice vacío del tipo configurado."""
+        params = self.index_params
+        dim = self.embedding_dim
+        faiss_metric = faiss.METRIC_INNER_PRODUCT if self.metric == "ip" else faiss.METRIC_L2
+        
+        if self.index_type == "flat":
+            return self._flat_index()
+        
+        if self.index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, int(params["hnsw_m"]), faiss_metric)
+            index.hnsw.efConstruction = int(params["ef_construction"])
+            return index
+        
+        # IVF: faiss recomienda al menos 39 puntos de entrenamiento por lista
+        total = len(embeddings)
+        nlist = int(params["nlist"] or 4 * int(np.sqrt(total)))
+        max_nlist = max(1, total // 39)
+        if nlist > max_nlist:
+            print(f"⚠️ nlist={nlist} es demasiado grande para {total} vectores; usando {max_nlist}")
+            nlist = max_nlist
+        params["nlist"] = nlist
+        
+        quantizer = self._flat_index()
+        if self.index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss_metric)
+        else:
+            pq_m = int(params["pq_m"])
+            if dim % pq_m:
+                raise ValueError(f"pq_m={pq_m} debe dividir la dimensión del embedding ({dim})")
+            index = faiss.IndexIVFPQ(
+                quantizer, dim, nlist, pq_m, int(params["pq_nbits"]), faiss_metric
+            )
+        
+        print(f"🎯 Entrenando índice {self.index_type} (nlist={nlist})...")
+        index.train(embeddings)
+        return index
+    
+    def _flat_index(self):
+        """Índice exacto con la métrica configurada."""
+        if self.metric == "ip":
+            return faiss.IndexFlatIP(self.embedding_dim)
+        return faiss.IndexFlatL2(self.embedding_dim)
+    
+    def _apply_search_params(self) -> None:
+        """Aplica los parámetros de búsqueda (nprobe/efSearch) al índice cargado."""
+        if self.index_type in ("ivf_flat", "ivf_pq"):
+            faiss.extract_index_ivf(self.index).nprobe = int(self.index_params["nprobe"])
+        elif self.index_type == "hnsw":
+            self.index.hnsw.efSearch = int(self.index_params["ef_search"])
+    
+    def evaluate_index(self, embeddings: np.ndarray, k: int = 10,
+                       sample_size: int = 200, seed: int = 0) -> Dict[str, float]:
+        """
+        Mide recall@k y latencia del índice frente a una búsqueda exacta.
+        Usa como consultas una muestra de los propios embeddings indexados.
+        
+        Args:
+            embeddings: Embeddings con los que se construyó el índice.
+            k: Vecinos a comparar.
+            sample_size: Número de consultas de muestra.
+            seed: Semilla para elegir la muestra.
+            
+        Returns:
+            Dict con 'recall_at_k', 'latency_ms' y 'exact_latency_ms' (por consulta).
+        """
+        k = min(k, len(embeddings))
+        rng = np.random.default_rng(seed)
+        sample = embeddings[rng.choice(len(embeddings), min(sample_size, len(embeddings)), replace=False)]
+        
+        exact = self._flat_index()
+        exact.add(embeddings)
+        
+        start = time.perf_counter()
+        _, exact_ids = exact.search(sample, k)
+        exact_latency = (time.perf_counter() - start) / len(sample)
+        
+        start = time.perf_counter()
+        _, approx_ids = self.index.search(sample, k)
+        latency = (time.perf_counter() - start) / len(sample)
+        
+        hits = sum(
+            len(set(exact_row.tolist()) & set(approx_row.tolist()))
+            for exact_row, approx_row in zip(exact_ids, approx_ids)
+        )
+        
+        return {
+            "k": k,
+            "queries": len(sample),
+            "recall_at_k": hits / (k * len(sample)),
+            "latency_ms": latency * 1000,
+            "exact_latency_ms": exact_latency * 1000,
+        }
     
     def search(self, query: str, k: int = 5) -> List[Tuple[dict, float]]:
         """
         Busca los k chunks más similares a una query.
+        Con micro-batching activo se agrupa con las búsquedas concurrentes.
         
         Args:
             query: Texto de búsqueda.
@@ -81,40 +343,165 @@ class VectorizerService:
         Returns:
             Lista de tuplas (chunk, distancia).
         """
+        if self.batcher is not None:
+            return self.batcher.submit([query], k=k)[0]
+        return self.search_batch([query], k=k)[0]
+    
+    def search_batch(self, queries: List[str], k: int = 5, batch_size: int = 64,
+                     persist_embeddings: bool = False) -> List[List[Tuple[dict, float]]]:
+        """
+        Busca los k chunks más similares para varias queries a la vez.
+        Codifica todas las queries en un solo pase por lotes del modelo y
+        realiza una única búsqueda FAISS sobre la matriz resultante.
+        
+        Args:
+            queries: Textos de búsqueda.
+            k: Número de resultados por query.
+            batch_size: Tamaño de lote para el encoder.
+            persist_embeddings: Consultar/guardar también en la caché persistente
+                de embeddings (evaluación por lotes sobre preguntas recurrentes).
+            
+        Returns:
+            Una lista de tuplas (chunk, puntuación) por cada query, en el mismo orden.
+            La puntuación es una distancia L2 o una similitud coseno según `metric`
+            (ver similarity()).
+        """
         if self.index is None:
             raise ValueError("Índice no construido. Ejecuta build_index() primero.")
         
-        # Vectorizar query
-        query_embedding = self.model.encode([query])[0].astype(np.float32)
+        if not queries:
+            return []
+        
+        # Vectorizar queries en lote (solo las que no están en caché)
+        with stage_timer("embed"):
+            query_embeddings = self.encode_queries(
+                queries, batch_size=batch_size, persist=persist_embeddings
+            )
+            if self.metric == "ip":
+                faiss.normalize_L2(query_embeddings)
         
         # Buscar en FAISS
-        distances, indices = self.index.search(
-            np.array([query_embedding]), k
-        )
+        with stage_timer("search"):
+            distances, indices = self.index.search(query_embeddings, k)
         
         # Retornar chunks con distancias
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(self.chunks):
-                results.append((self.chunks[int(idx)], float(distances[0][i])))
+        all_results = []
+        for row in range(len(queries)):
+            results = []
+            for i, idx in enumerate(indices[row]):
+                if 0 <= idx < len(self.chunks):
+                    results.append((self.chunks[int(idx)], float(distances[row][i])))
+            all_results.append(results)
+        
+        return all_results
+    
+    def encode_queries(self, queries: List[str], batch_size: int = 64,
+                       persist: bool = False) -> np.ndarray:
+        """
+        Obtiene los embeddings de varias queries usando la caché LRU.
+        Las queries se agrupan por su forma normalizada (espacios, mayúsculas
+        y acentos) y solo las ausentes pasan por el modelo, en un único lote.
+        
+        Args:
+            queries: Textos de búsqueda.
+            batch_size: Tamaño de lote para el encoder.
+            persist: Pasar los fallos por la caché persistente de embeddings.
+            
+        Returns:
+            Matriz float32 (len(queries) x embedding_dim).
+        """
+        keys = [fold_query(query) for query in queries]
+        embeddings = [self.query_cache.get(key) for key in keys]
+        
+        missing = {}
+        for query, key, embedding in zip(queries, keys, embeddings):
+            if embedding is None and key not in missing:
+                missing[key] = query
+        
+        if missing:
+            if persist:
+                encoded = self.encode_texts(list(missing.values()), batch_size=batch_size)
+            else:
+                encoded = self.model.encode(
+                    list(missing.values()), batch_size=batch_size
+                ).astype(np.float32)
+            fresh = dict(zip(missing.keys(), encoded))
+            for key, embedding in fresh.items():
+                embedding.flags.writeable = False
+                self.query_cache.set(key, embedding)
+            embeddings = [
+                embedding if embedding is not None else fresh[key]
+                for key, embedding in zip(keys, embeddings)
+            ]
         
-        return results
+        return np.vstack(embeddings).astype(np.float32, copy=False)
     
-    def save_index(self, index_path: str) -> None:
+    def warm_up(self, search: bool = True) -> None:
+        """
+        Codificación y búsqueda de prueba para reservar memoria e inicializar
+        las rutas perezosas del modelo antes de atender consultas reales.
+        No pasa por las cachés de consultas.
+        """
+        embedding = self.model.encode(["warm-up"]).astype(np.float32)
+        if search and self.index is not None:
+            if self.metric == "ip":
+                faiss.normalize_L2(embedding)
+            self.index.search(embedding, 1)
+    
+    def query_cache_stats(self) -> dict:
+        """Estadísticas de la caché de embeddings de consultas."""
+        return self.query_cache.stats()
+    
+    def batching_stats(self) -> Optional[dict]:
+        """Histogramas de tamaño de lote y espera en cola (None sin micro-batching)."""
+        return self.batcher.stats() if self.batcher is not None else None
+    
+    def similarity(self, score: float) -> float:
+        """
+        Convierte la puntuación de FAISS en una similitud en [0, 1].
+        
+        Con métrica 'ip' la puntuación ya es la similitud coseno. Los índices
+        'l2' sobre embeddings sin normalizar no tienen una similitud real; se
+        conserva la aproximación histórica 1 - distancia/100.
+        """
+        return self.score_to_similarity(score, self.metric)
+    
+    @staticmethod
+    def score_to_similarity(score: float, metric: str) -> float:
+        if metric == "ip":
+            return float(min(max(score, 0.0), 1.0))
+        return float(min(max(1.0 - score / 100, 0.0), 1.0))
+    
+    def save_index(self, index_path: str, manifest_extra: Optional[dict] = None) -> None:
         """
         Guarda el índice y los chunks en disco.
         
         Args:
             index_path: Ruta donde guardar los archivos.
+            manifest_extra: Datos adicionales para el manifiesto (p. ej. hashes de documentos).
         """
         os.makedirs(index_path, exist_ok=True)
         
         # Guardar índice FAISS
         faiss.write_index(self.index, os.path.join(index_path, "faiss_index.bin"))
         
-        # Guardar chunks como pickle
-        with open(os.path.join(index_path, "chunks.pkl"), "wb") as f:
-            pickle.dump(self.chunks, f)
+        # Guardar chunks en el almacén columnar (mmap al cargar)
+        ChunkStore.write(index_path, self.chunks)
+        
+        # Guardar embeddings y manifiesto para reconstrucciones incrementales
+        if self.embeddings is not None:
+            np.save(os.path.join(index_path, self.EMBEDDINGS_FILE), self.embeddings)
+            manifest = {
+                **(manifest_extra or {}),
+                "model_name": self.model_name,
+                "chunk_hashes": self.chunk_hashes,
+            }
+            with open(os.path.join(index_path, self.MANIFEST_FILE), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False)
+        
+        # Guardar metadatos (la huella identifica esta construcción del índice)
+        with open(os.path.join(index_path, self.INDEX_META_FILE), "w", encoding="utf-8") as f:
+            json.dump(self._index_meta(), f, ensure_ascii=False, indent=2)
         
         print(f"✅ Índice guardado en {index_path}")
     
@@ -126,11 +513,103 @@ class VectorizerService:
             index_path: Ruta donde están los archivos guardados.
         """
         # Cargar índice FAISS
-        self.index = faiss.read_index(os.path.join(index_path, "faiss_index.bin"))
+        index_file = os.path.join(index_path, "faiss_index.bin")
+        self.index = self._read_faiss_index(index_file)
+        
+        # Abrir chunks mapeados en memoria (se materializan solo al buscarlos)
+        if not ChunkStore.exists(index_path):
+            raise FileNotFoundError(
+                "No se encontró el almacén de chunks; ejecuta 'python manage.py build_index'."
+            )
+        self.chunks = ChunkStore.open(index_path)
         
-        # Cargar chunks
-        with open(os.path.join(index_path, "chunks.pkl"), "rb") as f:
-            self.chunks = pickle.load(f)
+        meta = self._read_index_meta(index_path)
+        self.index_type = meta.get("index_type", "flat")
+        self.metric = meta.get("metric", "l2")
+        self.index_params = {**self.DEFAULT_INDEX_PARAMS, **meta.get("index_params", {})}
+        self._apply_search_params()
+        if meta.get("fingerprint"):
+            self.index_fingerprint = meta["fingerprint"]
+        else:
+            # Índices antiguos sin metadatos: derivar la huella del archivo
+            index_stat = os.stat(index_file)
+            self.index_fingerprint = f"{index_stat.st_mtime_ns:x}-{index_stat.st_size:x}"
         
+        telemetry.set_index_size(self.index.ntotal)
         print(f"✅ Índice cargado desde {index_path}")
         print(f"   Total de chunks: {len(self.chunks)}")
+    
+    def _read_faiss_index(self, index_file: str):
+        """Lee el índice FAISS, mapeado en memoria si mmap_index está activo."""
+        if self.mmap_index:
+            # IO_FLAG_MMAP_IFC (faiss >= 1.9) también mapea los códigos de índices planos
+            mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+            try:
+                return faiss.read_index(index_file, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError as e:
+                print(f"⚠️ No se pudo mapear el índice en memoria ({e}); se carga completo.")
+        return faiss.read_index(index_file)
+    
+    def _index_meta(self) -> dict:
+        """Metadatos que describen el índice construido."""
+        return {
+            "fingerprint": self.index_fingerprint,
+            "built_at": datetime.now(timezone.utc).isoformat(),
+            "model_name": self.model_name,
+            "embedding_dim": self.embedding_dim,
+            "ntotal": int(self.index.ntotal),
+            "index_type": self.index_type,
+            "metric": self.metric,
+            "normalized_embeddings": self.metric == "ip",
+            "index_params": self.index_params,
+            "evaluation": self.build_report,
+        }
+    
+    @classmethod
+    def read_manifest(cls, index_path: str) -> dict:
+        """Lee manifest.json; retorna {} si no existe."""
+        manifest_path = os.path.join(index_path, cls.MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return {}
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    
+    @classmethod
+    def _read_index_meta(cls, index_path: str) -> dict:
+        """Lee index_meta.json; retorna {} si no existe."""
+        meta_path = os.path.join(index_path, cls.INDEX_META_FILE)
+        if not os.path.exists(meta_path):
+            return {}
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def publish_directory(staging_dir: str, target_dir: str) -> None:
+    """
+    Reemplaza `target_dir` por `staging_dir` con renombrados atómicos, de modo
+    que nunca se lea un índice a medio escribir. Los procesos que ya tienen
+    archivos abiertos (mmap) siguen viendo la versión anterior.
+    
+    Args:
+        staging_dir: Directorio con el índice completo recién escrito.
+        target_dir: Directorio publicado (p. ej. data/vectors).
+    """
+    backup_dir = os.path.normpath(target_dir) + ".old"
+    shutil.rmtree(backup_dir, ignore_errors=True)
+    
+    try:
+        if os.path.exists(target_dir):
+            os.rename(target_dir, backup_dir)
+        os.rename(staging_dir, target_dir)
+    except OSError:
+        # p. ej. target_dir es un punto de montaje: reemplazar archivo a archivo,
+        # dejando los metadatos (huella) para el final
+        if os.path.exists(backup_dir) and not os.path.exists(target_dir):
+            os.rename(backup_dir, target_dir)
+        os.makedirs(target_dir, exist_ok=True)
+        names = sorted(os.listdir(staging_dir), key=lambda name: name == VectorizerService.INDEX_META_FILE)
+        for name in names:
+            os.replace(os.path.join(staging_dir, name), os.path.join(target_dir, name))
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    
+    shutil.rmtree(backup_dir, ignore_errors=True)
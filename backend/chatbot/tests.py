@@ -0,0 +1,594 @@
+import gzip
+import json
+import os
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import AuditLog, Conversation, Message, MetricsRollup, QueryLog
+from .services import log_retention, rollups
+from .services.batching import MicroBatcher
+from .services.cache import DjangoCacheBackend, LRUCache
+from .services.embedding_cache import EmbeddingCache
+from .services.retriever import RetrieverClient, RetrieverServer, recv_message, send_message
+from .services.pagination import (
+    MAX_PAGE_SIZE,
+    decode_cursor,
+    encode_cursor,
+    keyset_page,
+    parse_page_size,
+)
+
+
+def create_conversations(count, messages_per_conversation=2):
+    """Crea `count` conversaciones con sus mensajes y un QueryLog por turno."""
+    conversations = []
+    for _ in range(count):
+        conversation = Conversation.objects.create()
+        for turn in range(messages_per_conversation // 2):
+            Message.objects.create(conversation=conversation, role='user', content=f'Pregunta {turn}')
+            Message.objects.create(conversation=conversation, role='assistant', content=f'Respuesta {turn}')
+            QueryLog.objects.create(
+                conversation=conversation,
+                user_query=f'Pregunta {turn}',
+                assistant_response=f'Respuesta {turn}',
+                response_time=0.2,
+                chunks_retrieved=3,
+            )
+        conversations.append(conversation)
+    return conversations
+
+
+class ConversationQueryCountTests(TestCase):
+    """El número de consultas de los endpoints de conversaciones no crece con las filas."""
+
+    def test_list_uses_single_query(self):
+        create_conversations(15, messages_per_conversation=4)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('chatbot:conversation-list-create'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 15)
+        self.assertTrue(all(item['message_count'] == 4 for item in response.json()))
+
+    def test_detail_prefetches_messages(self):
+        conversation = create_conversations(1, messages_per_conversation=10)[0]
+
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse('chatbot:conversation-detail', args=[conversation.id])
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['messages']), 10)
+        self.assertEqual(response.json()['message_count'], 10)
+
+
+class QueryLogListTests(TestCase):
+    """Listado de QueryLog paginado por cursor."""
+
+    def setUp(self):
+        create_conversations(12, messages_per_conversation=4)
+        # Varias filas con el mismo created_at: el id debe desempatar
+        QueryLog.objects.filter(id__lte=10).update(created_at=timezone.now() - timedelta(hours=1))
+
+    def test_list_query_count(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('chatbot:query-logs'), {'limit': 20})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 20)
+        self.assertEqual(response.json()['count'], 24)
+        self.assertFalse(response.json()['count_is_estimate'])
+
+    def test_cursor_walks_every_row_once(self):
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 7}
+            if cursor:
+                params['cursor'] = cursor
+            body = self.client.get(reverse('chatbot:query-logs'), params).json()
+            seen.extend(item['id'] for item in body['results'])
+            cursor = body['next_cursor']
+            if cursor is None:
+                break
+
+        expected = list(
+            QueryLog.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_and_limit(self):
+        response = self.client.get(reverse('chatbot:query-logs'), {'cursor': 'no-es-un-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(reverse('chatbot:query-logs'), {'limit': '-3'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PaginationTests(TestCase):
+    """Funciones de services/pagination.py."""
+
+    def test_cursor_roundtrip(self):
+        created_at = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(created_at, 42)), (created_at, 42))
+
+    def test_decode_rejects_garbage(self):
+        for cursor in ('', '!!!', encode_cursor(timezone.now(), 1)[:-4]):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_parse_page_size(self):
+        self.assertEqual(parse_page_size(None), 50)
+        self.assertEqual(parse_page_size('10'), 10)
+        self.assertEqual(parse_page_size('100000'), MAX_PAGE_SIZE)
+        for value in ('0', 'abc', '-1'):
+            with self.assertRaises(ValueError):
+                parse_page_size(value)
+
+    def test_keyset_page_last_page_has_no_cursor(self):
+        create_conversations(3)
+        rows, next_cursor = keyset_page(QueryLog.objects.all(), 3)
+        self.assertEqual(len(rows), 3)
+        self.assertIsNone(next_cursor)
+
+
+class MetricsCacheStatsTests(TestCase):
+    """`/api/metrics/` publica las estadísticas de las cachés del servicio."""
+
+    def fake_service(self):
+        service = mock.Mock()
+        service.vectorizer.batching_stats.return_value = None
+        service.vectorizer.query_cache_stats.return_value = LRUCache(maxsize=2).stats()
+        service.document_cache = LRUCache(maxsize=2)
+        service.document_cache_stats.side_effect = service.document_cache.stats
+        service.answer_cache = DjangoCacheBackend()
+        service.answer_cache_stats.side_effect = service.answer_cache.stats
+        return service
+
+    def test_no_service_loaded(self):
+        with mock.patch('chatbot.services.runtime._chat_service', None):
+            response = self.client.get(reverse('chatbot:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['caches'])
+
+    def test_document_cache_hits_and_misses(self):
+        service = self.fake_service()
+        service.document_cache.get('a')
+        service.document_cache.set('a', 'texto')
+        service.document_cache.get('a')
+
+        with mock.patch('chatbot.services.runtime._chat_service', service):
+            response = self.client.get(reverse('chatbot:metrics'))
+
+        documents = response.json()['caches']['documents']
+        self.assertEqual((documents['hits'], documents['misses']), (1, 1))
+        self.assertEqual(documents['hit_rate'], 0.5)
+        self.assertEqual(response.json()['caches']['query_embeddings']['hits'], 0)
+
+    def test_shared_answer_cache(self):
+        service = self.fake_service()
+        service.answer_cache.set('respuesta-metricas', {'answer': 'Hola'})
+        service.answer_cache.get('respuesta-metricas')
+        service.answer_cache.invalidate('respuesta-metricas')
+        service.answer_cache.get('respuesta-metricas')
+
+        with mock.patch('chatbot.services.runtime._chat_service', service):
+            response = self.client.get(reverse('chatbot:metrics'))
+
+        answers = response.json()['caches']['answers']
+        self.assertEqual(answers['backend'], 'django:default')
+        self.assertEqual((answers['hits'], answers['misses']), (1, 1))
+
+
+class AdminChangelistQueryCountTests(TestCase):
+    """Los listados del admin no hacen una consulta por fila."""
+
+    def setUp(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        return len(context.captured_queries)
+
+    def assert_constant_queries(self, url):
+        """Misma cantidad de consultas con 5 que con 25 conversaciones."""
+        create_conversations(5, messages_per_conversation=4)
+        baseline = self.count_queries(url)
+
+        create_conversations(20, messages_per_conversation=4)
+        with self.assertNumQueries(baseline):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_conversation_changelist(self):
+        self.assert_constant_queries(reverse('admin:chatbot_conversation_changelist'))
+
+    def test_message_changelist(self):
+        self.assert_constant_queries(reverse('admin:chatbot_message_changelist'))
+
+    def test_query_log_changelist(self):
+        self.assert_constant_queries(reverse('admin:chatbot_querylog_changelist'))
+
+
+class RollupTests(TestCase):
+    """Agregados horarios y diarios de services/rollups.py."""
+
+    def setUp(self):
+        local_now = timezone.localtime()
+        self.hour = timezone.make_aware(
+            datetime(local_now.year, local_now.month, local_now.day, 10)
+        ) - timedelta(days=1)
+
+    def create_log(self, created_at, response_time=0.2, **fields):
+        query_log = QueryLog.objects.create(
+            user_query='Pregunta',
+            assistant_response='Respuesta',
+            response_time=response_time,
+            chunks_retrieved=2,
+            **fields,
+        )
+        QueryLog.objects.filter(id=query_log.id).update(created_at=created_at, updated_at=created_at)
+        return query_log
+
+    def test_rollup_hours_and_days(self):
+        self.create_log(self.hour + timedelta(minutes=5), response_time=0.08,
+                        stage_timings={'embed': 3.0, 'search': 1.0})
+        self.create_log(self.hour + timedelta(minutes=50), response_time=3.0,
+                        answer_cached=True, feedback_score=4)
+        self.create_log(self.hour + timedelta(hours=2), response_time=0.4)
+        error = AuditLog.objects.create(event_type='error', description='Fallo', severity='error')
+        AuditLog.objects.filter(id=error.id).update(created_at=self.hour + timedelta(minutes=10))
+
+        rollups.rollup_hours(self.hour, self.hour + timedelta(hours=3))
+
+        first = MetricsRollup.objects.get(period='hour', bucket_start=self.hour)
+        self.assertEqual(first.query_count, 2)
+        self.assertEqual(first.cached_count, 1)
+        self.assertEqual(first.chunks_sum, 4)
+        self.assertEqual(first.feedback_count, 1)
+        self.assertEqual(first.error_count, 1)
+        self.assertAlmostEqual(first.response_time_sum, 3.08)
+        # Acumulado: 0.08 entra desde el límite 0.1, 3.0 desde el límite 5.0
+        self.assertEqual(first.response_time_buckets, [0, 1, 1, 1, 1, 1, 2, 2])
+        self.assertEqual(sum(first.stage_buckets['embed']), 1)
+
+        day = MetricsRollup.objects.get(period='day')
+        self.assertEqual(day.query_count, 3)
+        self.assertEqual(day.error_count, 1)
+        self.assertEqual(day.response_time_buckets, [0, 1, 1, 2, 2, 2, 3, 3])
+
+    def test_rollup_is_idempotent(self):
+        self.create_log(self.hour + timedelta(minutes=5))
+        rollups.rollup_hours(self.hour, self.hour + timedelta(hours=1))
+        rollups.rollup_hours(self.hour, self.hour + timedelta(hours=1))
+
+        self.assertEqual(MetricsRollup.objects.filter(period='hour').count(), 1)
+        self.assertEqual(MetricsRollup.objects.get(period='day').query_count, 1)
+
+    def test_refresh_picks_up_late_feedback(self):
+        query_log = self.create_log(self.hour + timedelta(minutes=5))
+        rollups.refresh(backfill=True)
+        bucket = MetricsRollup.objects.get(period='hour', bucket_start=self.hour)
+        self.assertEqual((bucket.query_count, bucket.feedback_count), (1, 0))
+
+        query_log.refresh_from_db()
+        query_log.feedback_score = 4
+        query_log.save()
+        rollups.refresh()
+
+        bucket.refresh_from_db()
+        self.assertEqual((bucket.feedback_count, bucket.feedback_sum), (1, 4))
+        day = MetricsRollup.objects.get(period='day', bucket_start=rollups._local_midnight(self.hour))
+        self.assertEqual(day.feedback_count, 1)
+
+    def test_only_backfill_fills_history(self):
+        self.create_log(self.hour - timedelta(days=3))
+
+        rollups.refresh()
+        self.assertFalse(MetricsRollup.objects.filter(bucket_start__lt=self.hour).exists())
+
+        rollups.refresh(backfill=True)
+        bucket = MetricsRollup.objects.get(period='hour', bucket_start=self.hour - timedelta(days=3))
+        self.assertEqual(bucket.query_count, 1)
+        self.assertEqual(rollups.summarize()['total_queries'], 1)
+
+    def test_summarize_totals(self):
+        now = timezone.now()
+        for minutes in (5, 65, 125):
+            self.create_log(now - timedelta(minutes=minutes), feedback_score=5)
+        rollups.rollup_hours(now - timedelta(hours=4), now + timedelta(hours=1))
+
+        summary = rollups.summarize(now)
+        self.assertEqual(summary['total_queries'], 3)
+        self.assertEqual(summary['queries_last_24h'], 3)
+        self.assertAlmostEqual(summary['avg_response_time'], 0.2)
+        self.assertEqual(summary['avg_feedback_score'], 5)
+
+
+def create_log_at(created_at, **fields):
+    """Crea un QueryLog con created_at fijo (auto_now_add lo ignora al crear)."""
+    query_log = QueryLog.objects.create(
+        user_query='Pregunta', assistant_response='Respuesta', **fields
+    )
+    QueryLog.objects.filter(id=query_log.id).update(created_at=created_at)
+    return query_log
+
+
+def read_archive(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+class LogRetentionTests(TestCase):
+    """Archivado y borrado por lotes de services/log_retention.py."""
+
+    def setUp(self):
+        archive = tempfile.TemporaryDirectory()
+        self.addCleanup(archive.cleanup)
+        self.archive_dir = archive.name
+        self.table_dir = os.path.join(self.archive_dir, QueryLog._meta.db_table)
+
+    def archive_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.table_dir)
+            for root, _, names in os.walk(self.table_dir) for name in names
+        )
+
+    def test_prune_groups_by_local_month(self):
+        # 21:00 del 31 de enero en La Habana ya es 1 de febrero en UTC
+        late_january = timezone.make_aware(datetime(2025, 1, 31, 21, 0))
+        first = create_log_at(late_january)
+        second = create_log_at(late_january + timedelta(days=10))
+
+        archived, deleted = log_retention.prune_rows(
+            QueryLog, timezone.now(), self.archive_dir, batch_size=1
+        )
+
+        self.assertEqual((archived, deleted), (2, 2))
+        self.assertEqual(self.archive_files(), [
+            f'2025-01/{first.id:012d}-{first.id:012d}.jsonl.gz',
+            f'2025-02/{second.id:012d}-{second.id:012d}.jsonl.gz',
+        ])
+        self.assertFalse(QueryLog.objects.exists())
+
+    def test_failed_delete_leaves_no_archive(self):
+        create_log_at(timezone.now() - timedelta(days=400))
+
+        with mock.patch('django.db.models.query.QuerySet.delete', side_effect=RuntimeError('fallo')):
+            with self.assertRaises(RuntimeError):
+                log_retention.prune_rows(QueryLog, timezone.now(), self.archive_dir)
+
+        self.assertEqual(self.archive_files(), [])
+        self.assertEqual(QueryLog.objects.count(), 1)
+
+    def test_recover_archive(self):
+        kept = create_log_at(timezone.now() - timedelta(days=400))
+        gone = create_log_at(timezone.now() - timedelta(days=400))
+        _, kept_paths = log_retention.archive_rows(
+            self.archive_dir, QueryLog._meta.db_table, QueryLog.objects.filter(id=kept.id).values()
+        )
+        _, gone_paths = log_retention.archive_rows(
+            self.archive_dir, QueryLog._meta.db_table, QueryLog.objects.filter(id=gone.id).values()
+        )
+        QueryLog.objects.filter(id=gone.id).delete()
+
+        log_retention.recover_archive(self.archive_dir, QueryLog)
+
+        # El borrado de `gone` se confirmó: su archivo se publica; el de `kept` se descarta
+        self.assertFalse(any(os.path.exists(path) for path in kept_paths + gone_paths))
+        published = [path[:-len(log_retention.TMP_SUFFIX)] for path in gone_paths]
+        self.assertEqual([row['id'] for row in read_archive(published[0])], [gone.id])
+        self.assertEqual(len(self.archive_files()), 1)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'El particionado requiere PostgreSQL')
+class PartitioningTests(TestCase):
+    """Conversión a tablas particionadas por mes y poda por DROP TABLE."""
+
+    def test_convert_and_drop_expired_partitions(self):
+        table = QueryLog._meta.db_table
+        old_at = timezone.localtime() - timedelta(days=120)
+        old = create_log_at(old_at, feedback_score=3)
+        recent = create_log_at(timezone.now(), feedback_score=5)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'ALTER TABLE {table} ADD CONSTRAINT querylog_feedback_range '
+                f'CHECK (feedback_score BETWEEN 1 AND 5)'
+            )
+
+        log_retention.convert_to_partitioned(QueryLog, months_ahead=1)
+
+        self.assertTrue(log_retention.is_partitioned(table))
+        self.assertEqual(QueryLog.objects.count(), 2)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM pg_constraint c JOIN pg_class t ON t.oid = c.conrelid '
+                'WHERE t.relname = %s AND c.contype = %s',
+                [table, 'c'],
+            )
+            self.assertIsNotNone(cursor.fetchone(), 'Se perdió el CHECK al particionar')
+        # La secuencia nueva continúa después del id más alto
+        self.assertGreater(create_log_at(timezone.now()).id, recent.id)
+
+        archive = tempfile.TemporaryDirectory()
+        self.addCleanup(archive.cleanup)
+        archived, dropped = log_retention.drop_expired_partitions(
+            QueryLog, timezone.now() - timedelta(days=60), archive.name
+        )
+
+        self.assertIn(log_retention.partition_name(table, old_at.year, old_at.month), dropped)
+        self.assertEqual(archived, 1)
+        self.assertFalse(QueryLog.objects.filter(id=old.id).exists())
+        self.assertTrue(QueryLog.objects.filter(id=recent.id).exists())
+
+
+class _PeerPidHandler(socketserver.BaseRequestHandler):
+    """Responde a cada mensaje con el pid del proceso al otro lado del socket."""
+
+    def handle(self):
+        credentials = self.request.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')
+        )
+        peer_pid = struct.unpack('3i', credentials)[0]
+        while recv_message(self.request) is not None:
+            send_message(self.request, {'ok': True, 'peer_pid': peer_pid})
+
+
+@unittest.skipUnless(hasattr(os, 'fork') and hasattr(socket, 'SO_PEERCRED'), 'Requiere fork y SO_PEERCRED')
+class RetrieverClientForkTests(TestCase):
+    """El cliente del servidor de recuperación no comparte su conexión entre procesos."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        socket_path = os.path.join(directory.name, 'retriever.sock')
+        server = socketserver.ThreadingUnixStreamServer(socket_path, _PeerPidHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.client = RetrieverClient(socket_path, timeout=5)
+
+    def test_child_opens_its_own_connection(self):
+        self.assertEqual(self.client._call({'op': 'ping'})['peer_pid'], os.getpid())
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Proceso hijo: informa del pid que ve el servidor y sale sin pasar por unittest
+            try:
+                peer_pid = self.client._call({'op': 'ping'})['peer_pid']
+                os.write(write_fd, json.dumps([os.getpid(), peer_pid]).encode())
+            finally:
+                os._exit(0)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            child_pid, peer_pid = json.loads(pipe.read() or '[0, -1]')
+        os.waitpid(pid, 0)
+
+        self.assertEqual(peer_pid, child_pid)
+        # La conexión del padre sigue siendo suya y utilizable
+        self.assertEqual(self.client._call({'op': 'ping'})['peer_pid'], os.getpid())
+
+
+class MicroBatcherTests(TestCase):
+    """El hilo del micro-batcher sobrevive a los fallos de un lote."""
+
+    def test_failed_batch_does_not_stop_worker(self):
+        replies = iter([
+            None,  # Respuesta mal formada: falla al repartir los resultados
+            [[('chunk', 0.1)]],
+        ])
+
+        def search_batch(queries, k, persist_embeddings):
+            return next(replies)
+
+        batcher = MicroBatcher(search_batch, max_wait_ms=0)
+        outcomes = []
+
+        def submit_both():
+            for query in ('primera', 'segunda'):
+                try:
+                    outcomes.append(batcher.submit([query]))
+                except Exception as e:
+                    outcomes.append(e)
+
+        # Con el hilo del batcher caído submit() no volvería nunca: se espera con límite
+        caller = threading.Thread(target=submit_both, daemon=True)
+        caller.start()
+        caller.join(timeout=5)
+
+        self.assertEqual(len(outcomes), 2)
+        self.assertIsInstance(outcomes[0], TypeError)
+        self.assertEqual(outcomes[1], [[('chunk', 0.1)]])
+
+
+class RetrieverServerStatsTests(TestCase):
+    """El cliente obtiene las estadísticas de caché del servidor de recuperación."""
+
+    def test_query_cache_stats(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        socket_path = os.path.join(directory.name, 'retriever.sock')
+        vectorizer = mock.Mock()
+        vectorizer.query_cache_stats.return_value = {'hits': 3, 'misses': 1, 'hit_rate': 0.75}
+        server = RetrieverServer(vectorizer, socket_path)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        client = RetrieverClient(socket_path, timeout=5)
+        self.addCleanup(client._close)
+        self.assertEqual(client.query_cache_stats(), {'hits': 3, 'misses': 1, 'hit_rate': 0.75})
+
+
+class EmbeddingCacheTests(TestCase):
+    """Caché de embeddings en disco: anexado, compactación y recuperación."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache_dir = directory.name
+        self.vectors = {f'hash{row}': np.full(4, row, dtype=np.float32) for row in range(6)}
+
+    def open_cache(self):
+        return EmbeddingCache(self.cache_dir, 'modelo/prueba', 4)
+
+    def assert_consistent(self, cache, expected):
+        self.assertEqual(cache.hashes(), set(expected))
+        for chunk_hash, vector in cache.get_many(expected).items():
+            np.testing.assert_array_equal(vector, self.vectors[chunk_hash])
+
+    def test_compact_keeps_pairs(self):
+        cache = self.open_cache()
+        cache.add_many(list(self.vectors), np.stack(list(self.vectors.values())))
+
+        self.assertEqual(cache.compact(['hash1', 'hash4']), (2, 4))
+        self.assert_consistent(cache, ['hash1', 'hash4'])
+
+        # Los anexados posteriores van a la generación nueva
+        cache.add_many(['hash5'], self.vectors['hash5'][None, :])
+        self.assert_consistent(self.open_cache(), ['hash1', 'hash4', 'hash5'])
+
+    def test_interrupted_compact_keeps_previous_generation(self):
+        cache = self.open_cache()
+        cache.add_many(list(self.vectors), np.stack(list(self.vectors.values())))
+
+        real_replace = os.replace
+
+        def crash_on_pointer(source, target):
+            if os.path.basename(target) == EmbeddingCache.CURRENT_FILE:
+                raise OSError('proceso terminado')
+            return real_replace(source, target)
+
+        with mock.patch('chatbot.services.embedding_cache.os.replace', side_effect=crash_on_pointer):
+            with self.assertRaises(OSError):
+                cache.compact(['hash0'])
+
+        self.assert_consistent(self.open_cache(), list(self.vectors))
+        # La siguiente compactación descarta la generación a medias
+        self.assertEqual(self.open_cache().compact(['hash2']), (1, 5))
+        self.assert_consistent(self.open_cache(), ['hash2'])
+        model_dir = self.open_cache().path
+        generations = [name for name in os.listdir(model_dir) if name.startswith('gen-')]
+        self.assertEqual(len(generations), 1)
@@ -9,6 +9,8 @@ urlpatterns = [
     
     # Chat endpoint
     path('chat/', views.chat_view, name='chat'),
+    path('chat/async/', views.chat_async_view, name='chat-async'),
+    path('chat/stream/', views.chat_stream_view, name='chat-stream'),
     
     # Conversaciones
     path('conversations/', views.ConversationListCreateView.as_view(), name='conversation-list-create'),
@@ -2,11 +2,14 @@ from rest_framework import status, viewsets, generics
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
 from rest_framework.permissions import AllowAny
+from django.db.models import Count
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
-from django.db.models import Avg, Count, Q
-from datetime import timedelta
-import os
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from asgiref.sync import sync_to_async
+import asyncio
+import json
 
 from .models import Conversation, Message, QueryLog, AuditLog
 from .serializers import (
@@ -19,29 +22,41 @@ from .serializers import (
     MetricsSerializer,
 )
 from .services.chat_service import ChatService
+from .services import rollups, telemetry
+from .services.log_writer import get_log_writer
+from .services.pagination import estimated_count, keyset_page, parse_page_size
+from .services.runtime import (
+    cache_stats,
+    chunk_lookup,
+    get_chat_service,
+    readiness,
+    is_ready,
+    retrieval_executor,
+    search_batching_stats,
+)
 
-# Lazy loading del servicio de chat
-_chat_service = None
-
-def get_chat_service():
-    """Obtiene la instancia del servicio de chat (lazy loading)."""
-    global _chat_service
-    if _chat_service is None:
-        _chat_service = ChatService(
-            documents_dir=os.getenv('DOCUMENTS_DIR', 'data/documents'),
-            vectors_dir=os.getenv('VECTORS_DIR', 'data/vectors')
-        )
-        # Intentar cargar índice si existe
-        _chat_service.load_index()
-    return _chat_service
+# Turnos del chat en streaming aún en curso (ver _start_stream_turn)
+_pending_turns = set()
 
 
 @api_view(['GET'])
 def health_check(request):
-    """Endpoint de health check para verificar que el servicio está activo."""
+    """
+    Endpoint de health check para verificar que el servicio está activo.
+    Responde 503 mientras el modelo y el índice no estén precargados, para que
+    el healthcheck de Docker y el balanceador solo enruten a workers listos.
+    """
+    if not is_ready():
+        return Response({
+            'status': 'starting',
+            'message': 'Backend GAPID Chatbot cargando modelo e índice',
+            'readiness': readiness()
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    
     return Response({
         'status': 'ok',
-        'message': 'Backend GAPID Chatbot está operacional'
+        'message': 'Backend GAPID Chatbot está operacional',
+        'readiness': readiness()
     }, status=status.HTTP_200_OK)
 
 
@@ -50,7 +65,7 @@ class ConversationListCreateView(generics.ListCreateAPIView):
     GET: Listar todas las conversaciones.
     POST: Crear una nueva conversación.
     """
-    queryset = Conversation.objects.all()
+    queryset = Conversation.objects.annotate(message_count=Count('messages'))
     serializer_class = ConversationListSerializer
     permission_classes = [AllowAny]
     
@@ -65,9 +80,16 @@ class ConversationDetailView(generics.RetrieveUpdateDestroyAPIView):
     PUT/PATCH: Actualizar conversación.
     DELETE: Eliminar conversación.
     """
-    queryset = Conversation.objects.all()
+    queryset = Conversation.objects.annotate(message_count=Count('messages'))
     permission_classes = [AllowAny]
     
+    def get_queryset(self):
+        """En GET se precargan los mensajes en una sola consulta."""
+        queryset = super().get_queryset()
+        if self.request.method == 'GET':
+            queryset = queryset.prefetch_related('messages')
+        return queryset
+    
     def get_serializer_class(self):
         """Usar DetailSerializer para GET, ListSerializer para otros."""
         if self.request.method == 'GET':
@@ -86,7 +108,7 @@ class MessageListCreateView(generics.ListCreateAPIView):
     def get_queryset(self):
         """Filtrar mensajes por conversación."""
         conversation_id = self.kwargs.get('conversation_id')
-        return Message.objects.filter(conversation_id=conversation_id).order_by('created_at')
+        return Message.objects.filter(conversation_id=conversation_id).order_by('created_at', 'id')
     
     def perform_create(self, serializer):
         """Crear un mensaje asociado a la conversación."""
@@ -115,11 +137,9 @@ def chat_view(request):
                 'error': 'El mensaje no puede estar vacío'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Si no hay conversación, crear una
-        if not conversation_id:
-            conversation = Conversation.objects.create()
-            conversation_id = conversation.id
-        else:
+        # Si no hay conversación, se crea al guardar el turno
+        conversation = None
+        if conversation_id:
             conversation = get_object_or_404(Conversation, id=conversation_id)
         
         # Preparar metadata del request
@@ -128,44 +148,32 @@ def chat_view(request):
             'user_agent': request.META.get('HTTP_USER_AGENT', '')
         }
         
-        # Obtener respuesta del chat service con logging
-        chat_response = get_chat_service().answer_question(
-            message_text, 
-            k=3,
-            log_to_db=True,
-            conversation_id=conversation_id,
-            request_meta=request_meta
-        )
-        
-        # Guardar mensaje del usuario
-        user_message = Message.objects.create(
-            conversation=conversation,
-            role='user',
-            content=message_text
-        )
+        # Obtener respuesta del chat service
+        chat_response, context_chunks = _compute_chat_answer(message_text, 3)
         
-        # Guardar mensaje del asistente
-        assistant_message = Message.objects.create(
-            conversation=conversation,
-            role='assistant',
-            content=chat_response['answer']
+        # Guardar mensajes y QueryLog en una sola transacción
+        conversation, user_message, assistant_message = ChatService.persist_chat_turn(
+            conversation, message_text, chat_response, context_chunks, request_meta
         )
+        telemetry.count_chat_request('chat', 'ok')
         
         return Response({
-            'conversation_id': conversation_id,
+            'conversation_id': conversation.id,
             'user_message_id': user_message.id,
             'assistant_message_id': assistant_message.id,
             'answer': chat_response['answer'],
             'sources': chat_response.get('sources', []),
             'confidence_score': chat_response.get('confidence_score', 0),
             'response_time': chat_response.get('response_time', 0),
-            'chunks_retrieved': chat_response.get('chunks_retrieved', 0)
+            'chunks_retrieved': chat_response.get('chunks_retrieved', 0),
+            'cached': chat_response.get('cached', False)
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
         import traceback
         print(f"ERROR en chat_view: {str(e)}")
         traceback.print_exc()
+        telemetry.count_chat_request('chat', 'error')
         
         # Registrar error en auditoría
         ChatService.log_audit_event(
@@ -180,6 +188,261 @@ def chat_view(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _compute_chat_answer(message_text, k):
+    """Parte CPU del chat (caché, búsqueda y pasajes) para el pool de recuperación."""
+    chat_service = get_chat_service()
+    if not chat_service.ensure_index():
+        return chat_service._not_indexed_result(), None
+    return chat_service.compute_answer(message_text, k)
+
+
+def _parse_chat_body(request):
+    """
+    Lee el cuerpo JSON de las vistas de chat async.
+    
+    Returns:
+        Tupla (mensaje, conversation_id, respuesta de error o None).
+    """
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None, None, JsonResponse({'error': 'JSON inválido'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    message_text = str(data.get('message', '')).strip()
+    if not message_text:
+        return None, None, JsonResponse({
+            'error': 'El mensaje no puede estar vacío'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return message_text, data.get('conversation_id'), None
+
+
+def _request_meta(request):
+    return {
+        'ip_address': get_client_ip(request),
+        'user_agent': request.META.get('HTTP_USER_AGENT', '')
+    }
+
+
+async def _persist_chat_async(conversation, message_text, chat_response, context_chunks, request_meta):
+    """Versión async de ChatService.persist_chat_turn (las transacciones son síncronas)."""
+    return await sync_to_async(ChatService.persist_chat_turn)(
+        conversation, message_text, chat_response, context_chunks, request_meta
+    )
+
+
+async def _run_stream_turn(conversation, message_text, request_meta, context_ready, answer_ready):
+    """
+    Recupera, genera y guarda un turno del chat en streaming. Corre como tarea
+    independiente del stream (ver _start_stream_turn): publica lo recuperado
+    y la respuesta en `context_ready` y `answer_ready` para que la vista los
+    envíe, y el turno se guarda aunque el cliente se desconecte antes.
+    
+    Returns:
+        Tupla (resultado del chat, (conversación, mensaje usuario, mensaje asistente)).
+    """
+    loop = asyncio.get_running_loop()
+    executor = retrieval_executor()
+    chat_service = await loop.run_in_executor(executor, get_chat_service)
+    
+    if await loop.run_in_executor(executor, chat_service.ensure_index):
+        retrieval = await loop.run_in_executor(
+            executor, chat_service.retrieve_context, message_text, 3
+        )
+        context_ready.set_result({
+            'sources': retrieval['sources'],
+            'confidence_score': retrieval['confidence_score'],
+            'cached': retrieval['cached'] is not None
+        })
+        chat_response, context_chunks = await loop.run_in_executor(
+            executor, chat_service.finish_answer, message_text, 3, retrieval
+        )
+    else:
+        context_ready.set_result({'sources': [], 'confidence_score': 0, 'cached': False})
+        chat_response, context_chunks = chat_service._not_indexed_result(), None
+    
+    answer_ready.set_result(chat_response)
+    saved = await _persist_chat_async(
+        conversation, message_text, chat_response, context_chunks, request_meta
+    )
+    return chat_response, saved
+
+
+def _start_stream_turn(conversation, message_text, request_meta):
+    """
+    Lanza _run_stream_turn como tarea: la cancelación del stream cuando el
+    cliente se desconecta no la interrumpe.
+    
+    Returns:
+        Tupla (tarea, future del evento context, future de la respuesta).
+    """
+    loop = asyncio.get_running_loop()
+    context_ready, answer_ready = loop.create_future(), loop.create_future()
+    task = loop.create_task(
+        _run_stream_turn(conversation, message_text, request_meta, context_ready, answer_ready)
+    )
+    # El event loop solo guarda referencias débiles a las tareas
+    _pending_turns.add(task)
+    task.add_done_callback(_finish_stream_turn)
+    return task, context_ready, answer_ready
+
+
+def _finish_stream_turn(task):
+    _pending_turns.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"❌ Falló el turno del chat en streaming: {task.exception()}")
+
+
+async def _stream_stage(stage_ready, task):
+    """Espera un resultado intermedio del turno; relanza el error si la tarea falló antes."""
+    await asyncio.wait({stage_ready, task}, return_when=asyncio.FIRST_COMPLETED)
+    if stage_ready.done():
+        return stage_ready.result()
+    return task.result()
+
+
+async def _log_chat_error_async(view_name, error, traceback_text):
+    print(f"ERROR en {view_name}: {str(error)}")
+    await sync_to_async(ChatService.log_audit_event)(
+        event_type='error',
+        description=f'Error en {view_name}: {str(error)}',
+        severity='error',
+        metadata={'traceback': traceback_text}
+    )
+
+
+@csrf_exempt
+@require_POST
+async def chat_async_view(request):
+    """
+    Versión async del endpoint de chat para servidores ASGI (uvicorn).
+    La recuperación se ejecuta en un pool de hilos acotado y las escrituras
+    usan el ORM async, así un worker atiende muchas conversaciones a la vez
+    sin dedicar un hilo a cada petición. Mismo request y respuesta que chat_view.
+    """
+    try:
+        message_text, conversation_id, error_response = _parse_chat_body(request)
+        if error_response is not None:
+            return error_response
+        
+        conversation = None
+        if conversation_id:
+            conversation = await Conversation.objects.filter(id=conversation_id).afirst()
+            if conversation is None:
+                return JsonResponse({'detail': 'No encontrado.'}, status=status.HTTP_404_NOT_FOUND)
+        
+        loop = asyncio.get_running_loop()
+        chat_response, context_chunks = await loop.run_in_executor(
+            retrieval_executor(), _compute_chat_answer, message_text, 3
+        )
+        
+        conversation, user_message, assistant_message = await _persist_chat_async(
+            conversation, message_text, chat_response, context_chunks, _request_meta(request)
+        )
+        telemetry.count_chat_request('chat_async', 'ok')
+        
+        return JsonResponse({
+            'conversation_id': conversation.id,
+            'user_message_id': user_message.id,
+            'assistant_message_id': assistant_message.id,
+            'answer': chat_response['answer'],
+            'sources': chat_response.get('sources', []),
+            'confidence_score': chat_response.get('confidence_score', 0),
+            'response_time': chat_response.get('response_time', 0),
+            'chunks_retrieved': chat_response.get('chunks_retrieved', 0),
+            'cached': chat_response.get('cached', False)
+        }, status=status.HTTP_200_OK)
+    
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        telemetry.count_chat_request('chat_async', 'error')
+        await _log_chat_error_async('chat_async_view', e, traceback.format_exc())
+        
+        return JsonResponse({
+            'error': f'Error procesando el chat: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _sse_event(event, data):
+    """Formatea un evento Server-Sent Events con datos JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _answer_pieces(answer):
+    """Trocea la respuesta por líneas para enviarla de forma progresiva."""
+    return answer.splitlines(keepends=True) or [answer]
+
+
+@csrf_exempt
+@require_POST
+async def chat_stream_view(request):
+    """
+    Variante en streaming (Server-Sent Events) del endpoint de chat.
+    Mismo request que chat_view; emite los eventos:
+    
+    - context: fuentes y confianza, en cuanto termina la búsqueda (las
+      mismas fuentes que llegarán en done)
+    - answer: fragmentos de la respuesta ({"delta": "..."})
+    - done: IDs de conversación y mensajes tras guardarlos, con los datos finales
+    - error: si algo falla a mitad del stream
+    
+    El turno se procesa en una tarea aparte y se guarda en cuanto la
+    respuesta está lista, mientras se envían los fragmentos; si el cliente se
+    desconecta antes de 'done', el turno se completa y se guarda igualmente.
+    """
+    message_text, conversation_id, error_response = _parse_chat_body(request)
+    if error_response is not None:
+        return error_response
+    
+    conversation = None
+    if conversation_id:
+        conversation = await Conversation.objects.filter(id=conversation_id).afirst()
+        if conversation is None:
+            return JsonResponse({'detail': 'No encontrado.'}, status=status.HTTP_404_NOT_FOUND)
+    
+    request_meta = _request_meta(request)
+    
+    async def events():
+        try:
+            task, context_ready, answer_ready = _start_stream_turn(
+                conversation, message_text, request_meta
+            )
+            yield _sse_event('context', await _stream_stage(context_ready, task))
+            
+            chat_response = await _stream_stage(answer_ready, task)
+            for piece in _answer_pieces(chat_response['answer']):
+                yield _sse_event('answer', {'delta': piece})
+            
+            # shield: una desconexión cancela el stream, no la tarea del turno
+            _, (saved_conversation, user_message, assistant_message) = await asyncio.shield(task)
+            telemetry.count_chat_request('chat_stream', 'ok')
+            
+            yield _sse_event('done', {
+                'conversation_id': saved_conversation.id,
+                'user_message_id': user_message.id,
+                'assistant_message_id': assistant_message.id,
+                'sources': chat_response.get('sources', []),
+                'confidence_score': chat_response.get('confidence_score', 0),
+                'response_time': chat_response.get('response_time', 0),
+                'chunks_retrieved': chat_response.get('chunks_retrieved', 0),
+                'cached': chat_response.get('cached', False)
+            })
+        
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            telemetry.count_chat_request('chat_stream', 'error')
+            await _log_chat_error_async('chat_stream_view', e, traceback.format_exc())
+            yield _sse_event('error', {'error': f'Error procesando el chat: {str(e)}'})
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Evitar que nginx acumule el stream en su buffer
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 def get_client_ip(request):
     """Extrae la IP del cliente del request."""
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -193,14 +456,15 @@ def get_client_ip(request):
 @api_view(['GET'])
 def query_logs_view(request):
     """
-    Endpoint para listar registros de consultas.
+    Endpoint para listar registros de consultas, del más reciente al más
+    antiguo, paginado por cursor.
     
     Query params:
-    - limit: número de registros (default 50)
+    - limit: registros por página (default 50, máximo 200)
+    - cursor: next_cursor de la página anterior
     - conversation_id: filtrar por conversación
     """
     try:
-        limit = int(request.query_params.get('limit', 50))
         conversation_id = request.query_params.get('conversation_id')
         
         queryset = QueryLog.objects.all()
@@ -208,14 +472,7 @@ def query_logs_view(request):
         if conversation_id:
             queryset = queryset.filter(conversation_id=conversation_id)
         
-        queryset = queryset[:limit]
-        
-        serializer = QueryLogListSerializer(queryset, many=True)
-        
-        return Response({
-            'count': queryset.count(),
-            'results': serializer.data
-        }, status=status.HTTP_200_OK)
+        return _log_page_response(request, queryset, QueryLogListSerializer)
         
     except Exception as e:
         return Response({
@@ -223,12 +480,37 @@ def query_logs_view(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _log_page_response(request, queryset, serializer_class):
+    """
+    Respuesta paginada por cursor de un listado de logs: 'count' es una
+    estimación (ver pagination.estimated_count) y 'next_cursor' es None en
+    la última página.
+    """
+    try:
+        page_size = parse_page_size(request.query_params.get('limit'))
+        rows, next_cursor = keyset_page(queryset, page_size, request.query_params.get('cursor'))
+    except ValueError as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    count, count_is_estimate = estimated_count(queryset)
+    serializer = serializer_class(rows, many=True)
+    
+    return Response({
+        'count': count,
+        'count_is_estimate': count_is_estimate,
+        'next_cursor': next_cursor,
+        'results': serializer.data
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 def query_log_detail_view(request, log_id):
     """Endpoint para obtener detalles completos de un registro de consulta."""
     try:
         query_log = get_object_or_404(QueryLog, id=log_id)
-        serializer = QueryLogSerializer(query_log)
+        serializer = QueryLogSerializer(query_log, context={'chunk_lookup': chunk_lookup()})
         
         return Response(serializer.data, status=status.HTTP_200_OK)
         
@@ -243,15 +525,16 @@ def query_log_detail_view(request, log_id):
 @api_view(['GET'])
 def audit_logs_view(request):
     """
-    Endpoint para listar registros de auditoría.
+    Endpoint para listar registros de auditoría, del más reciente al más
+    antiguo, paginado por cursor.
     
     Query params:
-    - limit: número de registros (default 50)
+    - limit: registros por página (default 50, máximo 200)
+    - cursor: next_cursor de la página anterior
     - event_type: filtrar por tipo de evento
     - severity: filtrar por severidad
     """
     try:
-        limit = int(request.query_params.get('limit', 50))
         event_type = request.query_params.get('event_type')
         severity = request.query_params.get('severity')
         
@@ -263,14 +546,7 @@ def audit_logs_view(request):
         if severity:
             queryset = queryset.filter(severity=severity)
         
-        queryset = queryset[:limit]
-        
-        serializer = AuditLogSerializer(queryset, many=True)
-        
-        return Response({
-            'count': queryset.count(),
-            'results': serializer.data
-        }, status=status.HTTP_200_OK)
+        return _log_page_response(request, queryset, AuditLogSerializer)
         
     except Exception as e:
         return Response({
@@ -282,59 +558,22 @@ def audit_logs_view(request):
 def metrics_view(request):
     """
     Endpoint para obtener métricas y estadísticas del sistema.
+    Las cifras de consultas y errores salen de MetricsRollup, que se refresca
+    como mucho cada METRICS_ROLLUP_REFRESH_SECONDS (o con `rollup_metrics`).
     """
     try:
-        now = timezone.now()
-        last_24h = now - timedelta(hours=24)
-        last_7d = now - timedelta(days=7)
-        last_30d = now - timedelta(days=30)
-        
-        # Consultas por periodo
-        total_queries = QueryLog.objects.count()
-        queries_24h = QueryLog.objects.filter(created_at__gte=last_24h).count()
-        queries_7d = QueryLog.objects.filter(created_at__gte=last_7d).count()
-        queries_30d = QueryLog.objects.filter(created_at__gte=last_30d).count()
-        
-        # Métricas de rendimiento
-        avg_metrics = QueryLog.objects.aggregate(
-            avg_response_time=Avg('response_time'),
-            avg_chunks=Avg('chunks_retrieved'),
-            avg_feedback=Avg('feedback_score')
-        )
-        
-        # Conversaciones totales
-        total_conversations = Conversation.objects.count()
-        
-        # Errores
-        total_errors = AuditLog.objects.filter(
-            Q(severity='error') | Q(severity='critical')
-        ).count()
+        # Agregados horarios/diarios: unas cuantas filas en lugar de recorrer los logs
+        rollups.refresh_if_stale()
+        summary = rollups.summarize()
         
-        # Horas más activas (últimos 7 días)
-        queries_by_hour = QueryLog.objects.filter(
-            created_at__gte=last_7d
-        ).extra(
-            select={'hour': 'EXTRACT(hour FROM created_at)'}
-        ).values('hour').annotate(
-            count=Count('id')
-        ).order_by('-count')[:5]
-        
-        most_active_hours = [
-            {'hour': int(item['hour']), 'count': item['count']}
-            for item in queries_by_hour
-        ]
+        log_writer = get_log_writer()
         
         metrics_data = {
-            'total_queries': total_queries,
-            'total_conversations': total_conversations,
-            'avg_response_time': avg_metrics['avg_response_time'] or 0.0,
-            'avg_chunks_retrieved': avg_metrics['avg_chunks'] or 0.0,
-            'queries_last_24h': queries_24h,
-            'queries_last_7d': queries_7d,
-            'queries_last_30d': queries_30d,
-            'avg_feedback_score': avg_metrics['avg_feedback'],
-            'total_errors': total_errors,
-            'most_active_hours': most_active_hours
+            **summary,
+            'total_conversations': Conversation.objects.count(),
+            'search_batching': search_batching_stats(),
+            'caches': cache_stats(),
+            'log_writer': log_writer.stats() if log_writer is not None else None
         }
         
         serializer = MetricsSerializer(data=metrics_data)
@@ -348,3 +587,22 @@ def metrics_view(request):
         return Response({
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@require_GET
+def prometheus_metrics_view(request):
+    """
+    Métricas de proceso en formato OpenMetrics/Prometheus para scraping
+    frecuente: peticiones de chat, caché de respuestas, latencias por etapa,
+    tamaño del índice, tiempo de carga del modelo y cola de logs. No consulta
+    la BD; con PROMETHEUS_MULTIPROC_DIR agrega todos los workers.
+    """
+    if not telemetry.enabled():
+        return HttpResponse(
+            'prometheus_client no está instalado\n',
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content_type='text/plain; charset=utf-8'
+        )
+    
+    body, content_type = telemetry.render(request.META.get('HTTP_ACCEPT', ''))
+    return HttpResponse(body, content_type=content_type)
@@ -72,6 +72,22 @@ if os.getenv("USE_SQLITE", "false").lower() == "true":
         "NAME": BASE_DIR / "db.sqlite3",
     }
 
+# Caché de Django (usado por ANSWER_CACHE_BACKEND=django para compartir
+# respuestas entre workers; p. ej. DJANGO_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache)
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("DJANGO_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("DJANGO_CACHE_LOCATION", "gapid-chatbot"),
+    }
+}
+
+# Retención de QueryLog/AuditLog (manage.py prune_logs). 0 = conservar siempre.
+LOG_RETENTION = {
+    "QUERY_LOG_DAYS": int(os.getenv("QUERY_LOG_RETENTION_DAYS", "180")),
+    "AUDIT_LOG_DAYS": int(os.getenv("AUDIT_LOG_RETENTION_DAYS", "365")),
+    "ARCHIVE_DIR": os.getenv("LOG_ARCHIVE_DIR", "data/log_archive"),
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from chatbot.views import prometheus_metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("chatbot.urls")),
+    path("metrics", prometheus_metrics_view, name="prometheus-metrics"),
 ]
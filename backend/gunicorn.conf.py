@@ -0,0 +1,91 @@
+"""
+Configuración de gunicorn con precarga antes del fork.
+Uso: gunicorn -c gunicorn.conf.py config.wsgi
+
+Con preload_app el proceso maestro importa Django y el AppConfig precarga el
+modelo y el índice FAISS (mapeado en memoria, solo lectura) una sola vez; los
+workers los heredan por fork compartiendo páginas copy-on-write.
+"""
+
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+
+def _set_compute_threads(count):
+    try:
+        import torch
+        torch.set_num_threads(count)
+    except ImportError:
+        pass
+    try:
+        import faiss
+        faiss.omp_set_num_threads(count)
+    except ImportError:
+        pass
+
+
+if preload_app:
+    # Gunicorn carga la app (Arbiter.setup) antes de cualquier hook, así que la
+    # precarga del maestro se limita a un hilo aquí, al importar la
+    # configuración: un pool OpenMP creado antes del fork no es seguro de
+    # reutilizar en los workers. Cada worker fija sus hilos en post_fork.
+    for _variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[_variable] = "1"
+    _set_compute_threads(1)
+
+
+def _reset_prometheus_dir():
+    # Los archivos de métricas de una ejecución anterior falsearían los
+    # contadores. Se limpia al importar la configuración, antes de la precarga
+    # (que ya escribe gauges del maestro), y solo una vez por maestro: un
+    # reload con HUP vuelve a importar este archivo.
+    directory = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if not directory or os.environ.get("_PROMETHEUS_DIR_RESET_BY") == str(os.getpid()):
+        return
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith(".db"):
+            os.remove(os.path.join(directory, name))
+    os.environ["_PROMETHEUS_DIR_RESET_BY"] = str(os.getpid())
+
+
+_reset_prometheus_dir()
+
+
+def when_ready(server):
+    """Se ejecuta en el maestro tras cargar la app y antes de crear workers."""
+    if preload_app:
+        # Mover los objetos ya creados (modelo, índice, módulos) a la generación
+        # permanente: el GC de los workers no los recorre y no ensucia sus páginas.
+        gc.freeze()
+        server.log.info("Modelo e índice precargados en el maestro; gc.freeze() aplicado")
+
+
+def post_fork(server, worker):
+    """Ajustes por worker después del fork."""
+    # Cada worker usa pocos hilos de cómputo para no sobre-suscribir la CPU
+    _set_compute_threads(int(os.getenv("TORCH_THREADS_PER_WORKER", "1")))
+
+    # Las conexiones de BD abiertas en el maestro no deben compartirse
+    from django.db import connections
+    connections.close_all()
+
+    # Los gauges de la precarga (índice, carga del modelo) se escribieron con
+    # el pid del maestro: el worker los publica con el suyo
+    if preload_app:
+        from chatbot.services import telemetry
+        telemetry.republish_gauges()
+
+
+def child_exit(server, worker):
+    """Descarta los gauges del worker terminado en las métricas multiproceso."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -256,6 +256,8 @@ export interface QueryLogDetail {
 
 export interface QueryLogsResponse {
   count: number;
+  count_is_estimate: boolean;
+  next_cursor: string | null;
   results: QueryLog[];
 }
 
@@ -274,12 +276,14 @@ export const metricsAPI = {
   },
 
   /**
-   * Listar consultas registradas
+   * Listar consultas registradas (paginadas por cursor: pasar next_cursor
+   * de la respuesta anterior para obtener la página siguiente)
    */
-  async listQueryLogs(limit: number = 50, conversationId?: number): Promise<QueryLogsResponse> {
+  async listQueryLogs(limit: number = 50, conversationId?: number, cursor?: string): Promise<QueryLogsResponse> {
     try {
       const params: any = { limit };
       if (conversationId) params.conversation_id = conversationId;
+      if (cursor) params.cursor = cursor;
       
       const response = await apiClient.get<QueryLogsResponse>('/logs/queries/', { params });
       return response.data;